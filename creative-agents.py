@@ -4,24 +4,130 @@ Creative Agents - Ollama-powered creative analysis tools
 Because sometimes you need a restaurant review of your Python code!
 """
 
+import time
+
+STARTED = time.perf_counter()  # --profile counts module imports from here
+
 import argparse
 import sqlite3
 import json
+import os
+import socket
 import sys
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
 
+from ollama_pool import HostPool, append_metrics_log, model_key
+from toolkit_metrics import Metrics, Profiler
+
+
+def read_batch(path):
+    """Parse --batch input (a file, or - for stdin) into (agent, input) pairs
+
+    Lines are agent<TAB>input or JSON objects with "agent" and "input" keys.
+    Raises ValueError naming the line of the first malformed entry.
+    """
+    source = 'stdin' if path == '-' else path
+    stream = sys.stdin if path == '-' else open(path, 'r')
+    items = []
+    with stream:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    entry = json.loads(line)
+                    items.append((entry['agent'], entry['input']))
+                except ValueError as e:
+                    raise ValueError(f"{source} line {number}: invalid JSON ({e})") from None
+                except KeyError as e:
+                    raise ValueError(f"{source} line {number}: missing {e} key") from None
+            else:
+                agent_name, _, input_text = line.partition('\t')
+                items.append((agent_name.strip(), input_text))
+    return items
+
+
+# --profile phases, in report order. Seeding the database while the agent
+# snapshot is refreshed counts as ensure-schema. With --agents/--all the main
+# thread's wait for the workers counts as query; the requests themselves are
+# reported separately.
+PROFILER = Profiler(STARTED, ("import", "startup", "ensure-schema", "agents", "connect", "query", "render"))
+
+
+# Instrumentation for node_exporter's textfile collector; histograms use Metrics.BUCKETS
+OLLAMA_METRICS = {
+    "ollama_request_duration_seconds": ("histogram", "Wall time of a completed Ollama call, queueing and model load included"),
+    "ollama_request_errors_total": ("counter", "Ollama API requests that failed: connection errors, timeouts, HTTP errors"),
+    "ollama_tokens_total": ("counter", "Tokens processed by Ollama, by kind (prompt or generated)"),
+}
+METRICS = Metrics("creative-agents", OLLAMA_METRICS)
+
+
+class AgentError(Exception):
+    """Ollama answered a creative agent request with an error or bad reply"""
+
+
 class CreativeAgents:
-    def __init__(self, ollama_host="milliways", ollama_port=11434):
-        self.ollama_url = f"http://{ollama_host}:{ollama_port}/api"
+    SEED_VERSION = 2  # Bump when the default agents or schema below change
+    
+    def __init__(self, ollama_host="milliways", ollama_port=11434, metrics=None):
+        hosts = ollama_host.split(',') if isinstance(ollama_host, str) else list(ollama_host)
+        self.pool = HostPool(hosts, ollama_port, metrics=METRICS, profiler=PROFILER)
+        self.metrics = metrics
         self.db_path = "/mnt/idea-factory/databases/ollama_agents.db"
-        self.init_database()
+        # Per-host snapshot so queries normally never open the NFS-hosted database
+        self.snapshot_path = Path.home() / ".cache" / f"creative-agents-{socket.gethostname().split('.')[0]}.json"
+        self._snapshot = None
+        self._read_conn = None
+        self._write_conn = None
+    
+    def _connection(self, write=False):
+        """Return this process's shared connection to the agents database
+
+        Query paths get a read-only connection so they never take a write
+        lock on the NFS-hosted file. Once a writable connection exists it is
+        reused for reads too.
+        """
+        if self._write_conn is not None:
+            return self._write_conn
+        
+        if write:
+            self._write_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            if self._read_conn is not None:
+                self._read_conn.close()
+                self._read_conn = None
+            return self._write_conn
+        
+        if self._read_conn is None:
+            self._read_conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                              check_same_thread=False)
+        return self._read_conn
+    
+    def _seed_version(self, conn):
+        return conn.execute("PRAGMA user_version").fetchone()[0]
     
+    @PROFILER.timed("ensure-schema")
     def init_database(self):
-        """Initialize agent personalities database"""
+        """Initialize agent personalities database (only when the seed version changes)"""
+        try:
+            if self._seed_version(self._connection()) >= self.SEED_VERSION:
+                return
+        except sqlite3.Error:
+            pass  # Missing or unreadable database; create it below
+        
         Path("/mnt/idea-factory/databases").mkdir(parents=True, exist_ok=True)
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connection(write=True)
+        # Take the write lock before re-checking so concurrent starts seed once
+        conn.execute("BEGIN IMMEDIATE")
+        if self._seed_version(conn) >= self.SEED_VERSION:
+            conn.rollback()
+            return
+        
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -75,40 +181,186 @@ class CreativeAgents:
                 VALUES (?, ?, ?, ?)
             """, (agent['name'], agent['system_prompt'], agent['description'], agent['model_preference']))
         
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS agents_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO agents_meta (key, value) VALUES ('version', 0)")
+        self._bump_version(cursor)
+        
+        cursor.execute(f"PRAGMA user_version = {int(self.SEED_VERSION)}")
         conn.commit()
-        conn.close()
+    
+    def _bump_version(self, cursor):
+        """Invalidate every host's snapshot after a change to the agents table"""
+        cursor.execute("UPDATE agents_meta SET value = value + 1 WHERE key = 'version'")
+    
+    def _db_signature(self):
+        try:
+            st = os.stat(self.db_path)
+            return [st.st_mtime_ns, st.st_size]
+        except OSError:
+            return None
+    
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _refresh_snapshot(self, snapshot):
+        """Re-read agents from the shared database if its version stamp moved"""
+        self.init_database()
+        # Stat before reading so a concurrent write leaves the snapshot stale
+        signature = self._db_signature()
+        conn = self._connection()
+        version = conn.execute("SELECT value FROM agents_meta WHERE key = 'version'").fetchone()[0]
+        
+        if snapshot and snapshot.get('version') == version and snapshot.get('seed_version') == self.SEED_VERSION:
+            agents = snapshot['agents']
+        else:
+            rows = conn.execute("""
+                SELECT name, system_prompt, description, model_preference FROM agents
+            """).fetchall()
+            agents = {
+                name: {'system_prompt': system_prompt, 'description': description, 'model': model}
+                for name, system_prompt, description, model in rows
+            }
+        
+        snapshot = {
+            'signature': signature,
+            'seed_version': self.SEED_VERSION,
+            'version': version,
+            'agents': agents,
+        }
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.snapshot_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f)
+            tmp_file.replace(self.snapshot_path)
+        except OSError:
+            pass  # Still usable in-process; next run will retry
+        return snapshot
+    
+    @PROFILER.timed("agents")
+    def _agents(self):
+        """Return agent definitions, reading the shared database only when it changed"""
+        if self._snapshot is None:
+            snapshot = self._load_snapshot()
+            signature = self._db_signature()
+            # An unreachable database falls back to the last known snapshot
+            fresh = (snapshot is not None
+                     and snapshot.get('seed_version') == self.SEED_VERSION
+                     and (signature is None or snapshot.get('signature') == signature))
+            if fresh:
+                self._snapshot = snapshot
+            else:
+                try:
+                    self._snapshot = self._refresh_snapshot(snapshot)
+                except (sqlite3.Error, OSError) as e:
+                    # Unreachable or locked NFS database: keep working from the last snapshot
+                    if snapshot is None:
+                        print(f"❌ Cannot read agents database {self.db_path}: {e}")
+                        sys.exit(1)
+                    print(f"⚠️  Agents database unavailable ({e}); using cached agents", file=sys.stderr)
+                    self._snapshot = snapshot
+        return self._snapshot['agents']
     
     def list_agents(self):
         """List available creative agents"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT name, description FROM agents ORDER BY name")
-        agents = cursor.fetchall()
-        conn.close()
+        agents = self._agents()
         
         print("Available Creative Agents:")
         print("=" * 40)
-        for name, description in agents:
-            print(f"🎭 {name}: {description}")
+        for name in sorted(agents):
+            print(f"🎭 {name}: {agents[name]['description']}")
         print()
         print("Usage: creative-agents <agent_name> \"your input text\"")
     
     def get_agent(self, agent_name):
         """Get agent configuration"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        agent = self._agents().get(agent_name)
         
-        cursor.execute("""
-            SELECT system_prompt, model_preference FROM agents WHERE name = ?
-        """, (agent_name,))
+        if agent:
+            return {'system_prompt': agent['system_prompt'], 'model': agent['model']}
+        return None
+    
+    def _record_metrics(self, agent_name, model, result, endpoint, started):
+        """Append one call's timing and throughput to the shared metrics log"""
+        ns_per_ms = 1_000_000
+        wall_ms = (time.monotonic() - started) * 1000
+        total_ms = result.get('total_duration', 0) / ns_per_ms
+        eval_tokens = result.get('eval_count', 0)
+        eval_ns = result.get('eval_duration', 0)
         
-        result = cursor.fetchone()
-        conn.close()
+        entry = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'tool': 'creative-agents',
+            'operation': 'agent',
+            'agent': agent_name,
+            'model': model_key(model),
+            'host': f"{endpoint['host']}:{endpoint['port']}",
+            'prompt_tokens': result.get('prompt_eval_count', 0),
+            'generated_tokens': eval_tokens,
+            'tokens_per_sec': round(eval_tokens / (eval_ns / 1e9), 2) if eval_ns else None,
+            'load_ms': round(result.get('load_duration', 0) / ns_per_ms, 1),
+            'prompt_eval_ms': round(result.get('prompt_eval_duration', 0) / ns_per_ms, 1),
+            'eval_ms': round(eval_ns / ns_per_ms, 1),
+            'total_ms': round(total_ms, 1),
+            'wall_ms': round(wall_ms, 1),
+            'queue_ms': round(max(wall_ms - total_ms, 0.0), 1),
+        }
         
-        if result:
-            return {'system_prompt': result[0], 'model': result[1]}
-        return None
+        labels = {"operation": entry['operation'], "model": entry['model'], "host": entry['host']}
+        METRICS.observe("ollama_request_duration_seconds", wall_ms / 1000, **labels)
+        METRICS.add("ollama_tokens_total", entry['prompt_tokens'], kind="prompt", **labels)
+        METRICS.add("ollama_tokens_total", eval_tokens, kind="generated", **labels)
+        
+        append_metrics_log(entry)
+        
+        if self.metrics == 'json':
+            print(json.dumps(entry))
+    
+    def _ask_agent(self, agent_name, agent, input_text, endpoint=None):
+        """Send one chat request for an agent
+
+        Passing the endpoint of a previous call pins the request to that host
+        (falling back to the pool if it is unreachable) so the server can reuse
+        its cached system-prompt prefix. Returns (content, result, endpoint,
+        started); raises AgentError when Ollama answers with an error or an
+        unusable reply.
+        """
+        payload = {
+            "model": agent['model'],
+            "messages": [
+                {"role": "system", "content": agent['system_prompt']},
+                {"role": "user", "content": input_text}
+            ],
+            "stream": False
+        }
+        
+        started = time.monotonic()
+        response, endpoint = self.pool.request(
+            'POST', '/chat',
+            model=agent['model'],
+            prefer=endpoint,
+            json=payload,
+            timeout=120
+        )
+        
+        if response.status_code != 200:
+            error_data = response.json() if response.content else {}
+            raise AgentError(f"Error: {error_data.get('error', f'HTTP {response.status_code}')}")
+        
+        result = response.json()
+        if 'message' not in result or 'content' not in result['message']:
+            raise AgentError("Unexpected response format")
+        
+        return result['message']['content'].strip(), result, endpoint, started
     
     def query_agent(self, agent_name, input_text):
         """Query a creative agent with input"""
@@ -118,43 +370,22 @@ class CreativeAgents:
             return
         
         try:
-            payload = {
-                "model": agent['model'],
-                "messages": [
-                    {"role": "system", "content": agent['system_prompt']},
-                    {"role": "user", "content": input_text}
-                ],
-                "stream": False
-            }
-            
             print(f"🎭 {agent_name} is thinking...")
             print("=" * 50)
             
-            response = requests.post(
-                f"{self.ollama_url}/chat",
-                json=payload,
-                timeout=120
-            )
+            content, result, endpoint, started = self._ask_agent(agent_name, agent, input_text)
+            print(content)
             
-            if response.status_code == 200:
-                result = response.json()
-                
-                if 'message' in result and 'content' in result['message']:
-                    content = result['message']['content'].strip()
-                    print(content)
-                    
-                    # Show timing if available
-                    if 'total_duration' in result:
-                        duration_ms = result['total_duration'] / 1_000_000
-                        print()
-                        print(f"⏱️  Response time: {duration_ms:.0f}ms")
-                else:
-                    print("❌ Unexpected response format")
-            else:
-                error_data = response.json() if response.content else {}
-                error_msg = error_data.get('error', f'HTTP {response.status_code}')
-                print(f"❌ Error: {error_msg}")
+            # Show timing if available
+            if 'total_duration' in result:
+                duration_ms = result['total_duration'] / 1_000_000
+                served_by = f" on {endpoint['name']}" if len(self.pool.endpoints) > 1 else ""
+                print()
+                print(f"⏱️  Response time: {duration_ms:.0f}ms{served_by}")
+            self._record_metrics(agent_name, agent['model'], result, endpoint, started)
                 
+        except AgentError as e:
+            print(f"❌ {e}")
         except requests.exceptions.Timeout:
             print("❌ Request timed out (120s limit)")
         except requests.exceptions.RequestException as e:
@@ -162,9 +393,135 @@ class CreativeAgents:
         except json.JSONDecodeError:
             print("❌ Invalid JSON response")
     
+    def query_agents(self, agent_names, input_text):
+        """Send the same input to several agents concurrently"""
+        agents = {}
+        for agent_name in agent_names:
+            agent = self.get_agent(agent_name)
+            if agent:
+                agents[agent_name] = agent
+            else:
+                print(f"❌ Agent '{agent_name}' not found. Use --list to see available agents.")
+        
+        if not agents:
+            return
+        
+        print(f"🎭 {len(agents)} agents are thinking: {', '.join(agents)}")
+        print("=" * 50)
+        
+        started = time.monotonic()
+        latencies = []
+        with ThreadPoolExecutor(max_workers=len(agents)) as executor:
+            futures = {
+                executor.submit(self._ask_agent, agent_name, agent, input_text): agent_name
+                for agent_name, agent in agents.items()
+            }
+            
+            # Print each reply as soon as it lands rather than in request order
+            for future in PROFILER.iterate(as_completed(futures), "query"):
+                agent_name = futures[future]
+                print(f"🎭 {agent_name}")
+                print("-" * 50)
+                try:
+                    content, result, endpoint, call_started = future.result()
+                    latency_ms = (time.monotonic() - call_started) * 1000
+                    latencies.append(latency_ms)
+                    print(content)
+                    served_by = f" on {endpoint['name']}" if len(self.pool.endpoints) > 1 else ""
+                    print(f"⏱️  {latency_ms:.0f}ms{served_by}")
+                    self._record_metrics(agent_name, agents[agent_name]['model'], result, endpoint, call_started)
+                except AgentError as e:
+                    print(f"❌ {e}")
+                except requests.exceptions.Timeout:
+                    print("❌ Request timed out (120s limit)")
+                except requests.exceptions.RequestException as e:
+                    print(f"❌ Request failed: {e}")
+                except json.JSONDecodeError:
+                    print("❌ Invalid JSON response")
+                print()
+        
+        wall_ms = (time.monotonic() - started) * 1000
+        total_ms = sum(latencies)
+        print("=" * 50)
+        print(f"⏱️  Wall clock: {wall_ms:.0f}ms | Sum of latencies: {total_ms:.0f}ms "
+              f"| Speedup: {total_ms / wall_ms if wall_ms else 0:.1f}x")
+    
+    def run_batch(self, items):
+        """Run queued (agent, input) pairs grouped for prompt-cache reuse
+
+        Groups are ordered by model so each model loads once, and each agent's
+        inputs go back to back on the same host so Ollama can reuse the KV
+        cache of the shared system prompt instead of re-evaluating it. The
+        saving is estimated from the first call of each group: its prompt
+        tokens per character and eval time per token give the expected cost
+        of the later calls, which is compared with what Ollama reports.
+        """
+        groups = {}
+        for agent_name, input_text in items:
+            agent = self.get_agent(agent_name)
+            if not agent:
+                print(f"❌ Agent '{agent_name}' not found. Use --list to see available agents.")
+                continue
+            groups.setdefault((agent['model'], agent_name), []).append(input_text)
+        
+        if not groups:
+            return
+        
+        started = time.monotonic()
+        requests_done = 0
+        prompt_eval_ms = 0.0
+        saved_ms = 0.0
+        
+        for (model, agent_name), inputs in sorted(groups.items()):
+            agent = self.get_agent(agent_name)
+            endpoint = None
+            baseline = None
+            
+            print(f"🎭 {agent_name} ({model}): {len(inputs)} input(s)")
+            print("=" * 50)
+            
+            for index, input_text in enumerate(inputs, 1):
+                print(f"--- [{index}/{len(inputs)}] ---")
+                try:
+                    content, result, endpoint, call_started = self._ask_agent(agent_name, agent, input_text, endpoint)
+                except AgentError as e:
+                    print(f"❌ {e}")
+                    continue
+                except requests.exceptions.Timeout:
+                    print("❌ Request timed out (120s limit)")
+                    continue
+                except requests.exceptions.RequestException as e:
+                    print(f"❌ Request failed: {e}")
+                    continue
+                except json.JSONDecodeError:
+                    print("❌ Invalid JSON response")
+                    continue
+                
+                print(content)
+                print()
+                self._record_metrics(agent_name, model, result, endpoint, call_started)
+                requests_done += 1
+                
+                prompt_tokens = result.get('prompt_eval_count', 0)
+                call_prompt_ms = result.get('prompt_eval_duration', 0) / 1_000_000
+                prompt_eval_ms += call_prompt_ms
+                chars = len(agent['system_prompt']) + len(input_text)
+                if baseline is None:
+                    if prompt_tokens:
+                        baseline = (prompt_tokens / chars, call_prompt_ms / prompt_tokens)
+                else:
+                    tokens_per_char, ms_per_token = baseline
+                    saved_ms += max(chars * tokens_per_char - prompt_tokens, 0) * ms_per_token
+        
+        wall_ms = (time.monotonic() - started) * 1000
+        print("=" * 50)
+        print(f"📦 Batch: {requests_done} request(s) in {len(groups)} group(s), {wall_ms:.0f}ms wall clock")
+        print(f"⏱️  Prompt eval: {prompt_eval_ms:.0f}ms | Estimated saved by prefix reuse: {saved_ms:.0f}ms")
+    
     def add_agent(self, name, system_prompt, description, model='granite3.2:2b'):
         """Add a new creative agent"""
-        conn = sqlite3.connect(self.db_path)
+        self.init_database()
+        conn = self._connection(write=True)
         cursor = conn.cursor()
         
         try:
@@ -172,16 +529,18 @@ class CreativeAgents:
                 INSERT INTO agents (name, system_prompt, description, model_preference)
                 VALUES (?, ?, ?, ?)
             """, (name, system_prompt, description, model))
+            self._bump_version(cursor)
             
             conn.commit()
+            self._snapshot = None
             print(f"✅ Agent '{name}' added successfully!")
         except sqlite3.IntegrityError:
+            conn.rollback()
             print(f"❌ Agent '{name}' already exists")
-        finally:
-            conn.close()
 
 
 def main():
+    PROFILER.switch("startup")
     parser = argparse.ArgumentParser(
         description="Creative Agents - Ollama-powered creative analysis tools",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -206,6 +565,14 @@ Dungeon Master:
 ⚠️  WARNING: These are 'sharp knife' tools - handle with care!
    Results may cause git confusion or Yelp review flashbacks!
 
+Several Agents At Once (queried in parallel):
+  creative-agents --agents restaurant_critic,error_grandma "def f(x): return x/0"
+  creative-agents --all "Our CI has been red for a week"
+
+Batch Mode (inputs grouped by agent/model to reuse the cached system prompt):
+  printf 'commit_poet\tfix typo\ncommit_poet\tbump version\n' | creative-agents --batch -
+  creative-agents --batch queue.jsonl     # {"agent": "...", "input": "..."} per line
+
 Management:
   creative-agents --list              # Show available agents
   creative-agents --add-agent        # Add custom agent (interactive)
@@ -214,14 +581,28 @@ Management:
     
     parser.add_argument('agent', nargs='?', help='Agent name to use')
     parser.add_argument('input_text', nargs='?', help='Text to analyze')
+    parser.add_argument('--agents', help='Comma-separated agents to query in parallel with the same input')
+    parser.add_argument('--all', action='store_true', help='Query every agent in parallel with the same input')
+    parser.add_argument('--batch', metavar='FILE',
+                        help="Run queued inputs from FILE ('-' for stdin): JSON lines or agent<TAB>input")
     parser.add_argument('--list', action='store_true', help='List available agents')
     parser.add_argument('--add-agent', action='store_true', help='Add a new agent (interactive)')
-    parser.add_argument('--ollama-host', default='milliways', help='Ollama host (default: milliways)')
+    parser.add_argument('--ollama-host', default='milliways', help='Ollama host, or comma-separated host[:port] list to load-balance (default: milliways)')
     parser.add_argument('--ollama-port', type=int, default=11434, help='Ollama port (default: 11434)')
+    parser.add_argument('--metrics', choices=['json'], help='Print per-call timing/throughput metrics as JSON')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print where the time went on stderr: import, ensure-schema, agents, '
+                             'connect (host probes), query, render')
+    parser.add_argument('--profile-out', metavar='FILE',
+                        help='With --profile (implied), also write cProfile stats to FILE for pstats')
     
     args = parser.parse_args()
     
-    agents = CreativeAgents(args.ollama_host, args.ollama_port)
+    if args.profile or args.profile_out:
+        PROFILER.start(args.profile_out)
+    
+    agents = CreativeAgents(args.ollama_host, args.ollama_port, args.metrics)
+    PROFILER.switch("render")
     
     if args.list:
         agents.list_agents()
@@ -237,6 +618,23 @@ Management:
             agents.add_agent(name, system_prompt, description, model)
         except KeyboardInterrupt:
             print("\n❌ Cancelled")
+    elif args.batch:
+        try:
+            items = read_batch(args.batch)
+        except OSError as e:
+            print(f"❌ Cannot read batch file {args.batch}: {e.strerror or e}")
+            return
+        except ValueError as e:
+            print(f"❌ Bad batch input: {e}")
+            return
+        agents.run_batch(items)
+    elif args.agents or args.all:
+        # With a fan-out flag the only positional argument is the input text
+        input_text = args.input_text or args.agent
+        if not input_text:
+            parser.error("input text is required with --agents/--all")
+        names = sorted(agents._agents()) if args.all else [a.strip() for a in args.agents.split(',') if a.strip()]
+        agents.query_agents(names, input_text)
     elif args.agent and args.input_text:
         agents.query_agent(args.agent, args.input_text)
     else:
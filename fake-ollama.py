@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Fake Ollama - Minimal stand-in for the Ollama API
+Lets ollama-cli and creative-agents be exercised without a GPU box
+"""
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllama:
+    def __init__(self, models, delay=0.2, load_delay=1.0, tokens_per_sec=50):
+        self.models = models
+        self.delay = delay
+        self.load_delay = load_delay
+        self.tokens_per_sec = tokens_per_sec
+        self.loaded = set()
+        self.last_prompt = {}
+        self.lock = threading.Lock()
+
+    def _full_name(self, model):
+        """Ollama reports untagged models as name:latest"""
+        return model if ':' in model else f"{model}:latest"
+
+    def tags(self):
+        now = datetime.now(timezone.utc).isoformat()
+        return {"models": [
+            {"name": m, "model": m, "size": 2 * 1024**3, "modified_at": now,
+             "digest": f"{abs(hash(m)):064x}"[:64]}
+            for m in self.models
+        ]}
+
+    def ps(self):
+        with self.lock:
+            return {"models": [{"name": m, "model": m} for m in sorted(self.loaded)]}
+
+    def run(self, model, prompt_text, context=None):
+        """Simulate model load plus evaluation and return Ollama timing fields"""
+        model = self._full_name(model)
+        if model not in self.models:
+            return None
+
+        start = time.monotonic()
+        words = prompt_text.split()
+        with self.lock:
+            cold = model not in self.loaded
+            self.loaded.add(model)
+            # Like Ollama's KV cache, a prefix shared with the previous prompt is free
+            previous = self.last_prompt.get(model, [])
+            cached = 0
+            while cached < min(len(words), len(previous)) and words[cached] == previous[cached]:
+                cached += 1
+            self.last_prompt[model] = words
+
+        load_s = self.load_delay if cold else 0.0
+        # A reused context means the shared prefix does not need re-evaluating
+        reused = max(len(context) if context else 0, cached)
+        prompt_tokens = max(len(words) - reused, 1)
+        eval_tokens = 20 if prompt_text else 0
+        prompt_s = prompt_tokens / (self.tokens_per_sec * 20)
+        eval_s = eval_tokens / self.tokens_per_sec if prompt_text else 0.0
+        time.sleep(load_s + prompt_s + eval_s + (self.delay if prompt_text else 0.0))
+
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": True,
+            "done_reason": "stop" if prompt_text else "load",
+            "total_duration": int((time.monotonic() - start) * 1e9),
+            "load_duration": int(load_s * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_s * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_s * 1e9),
+            "context": list(range(len(prompt_text.split()) + eval_tokens)),
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FakeOllama/0.1"
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path == "/api/tags":
+            self._send(200, fake.tags())
+        elif self.path == "/api/ps":
+            self._send(200, fake.ps())
+        elif self.path == "/api/version":
+            self._send(200, {"version": "0.0.0-fake"})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send(400, {"error": "invalid JSON"})
+            return
+
+        model = request.get("model", "")
+        if self.path == "/api/generate":
+            text = request.get("prompt", "")
+            if request.get("system"):
+                text = f"{request['system']} {text}"
+            result = fake.run(model, text, request.get("context"))
+            if result:
+                result["response"] = f"[{fake.server_name}] echo: {request.get('prompt', '')[:80]}" if text else ""
+        elif self.path == "/api/chat":
+            messages = request.get("messages", [])
+            text = " ".join(m.get("content", "") for m in messages)
+            result = fake.run(model, text)
+            if result:
+                result.pop("context")
+                last = messages[-1].get("content", "") if messages else ""
+                result["message"] = {"role": "assistant", "content": f"[{fake.server_name}] echo: {last[:80]}"}
+        else:
+            self._send(404, {"error": "not found"})
+            return
+
+        if result is None:
+            self._send(404, {"error": f"model '{model}' not found, try pulling it first"})
+        elif request.get("stream", True):
+            # Streaming replies are newline-delimited JSON; send one final chunk
+            body = (json.dumps(result) + "\n").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send(200, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fake Ollama - Minimal Ollama API stand-in for testing",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Two fake hosts to exercise load balancing and failover
+  fake-ollama --port 11501 &
+  fake-ollama --port 11502 --delay 1.5 &
+  ollama-cli -H 127.0.0.1:11501,127.0.0.1:11502 "hello"
+        """
+    )
+
+    parser.add_argument('--bind', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=11434, help='Port to listen on (default: 11434)')
+    parser.add_argument('--models', default='llama3.2:latest,granite3.2:2b,granite3.1-moe:3b',
+                        help='Comma-separated models to advertise')
+    parser.add_argument('--delay', type=float, default=0.2, help='Base response delay in seconds (default: 0.2)')
+    parser.add_argument('--load-delay', type=float, default=1.0,
+                        help='Extra delay the first time a model is used (default: 1.0)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log every request')
+
+    args = parser.parse_args()
+
+    fake = FakeOllama([m.strip() for m in args.models.split(',') if m.strip()],
+                      delay=args.delay, load_delay=args.load_delay)
+    fake.server_name = f"{args.bind}:{args.port}"
+
+    server = ThreadingHTTPServer((args.bind, args.port), Handler)
+    server.fake = fake
+    server.verbose = args.verbose
+    print(f"Fake Ollama listening on {args.bind}:{args.port} ({len(fake.models)} models)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+LabMail Bench - Measure LabMail against a synthetic inbox
+Builds a throwaway inbox, runs each variant in a fresh process, and reports peak RSS and time
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BENCH_HOST = f"bench-{os.getpid()}"  # Inbox name for synthetic messages; never a real member
+
+
+def load_script(filename):
+    """Import a LabMail script by file name (the hyphenated names are not importable)"""
+    spec = importlib.util.spec_from_file_location(Path(filename).stem.replace('-', '_'), SCRIPT_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux reports KB
+
+
+def file_backend(base_dir, host, codec=None, scan_workers=1):
+    """A labmail.py LabMail whose folders live under base_dir; codec "json" turns orjson off"""
+    labmail = load_script("labmail.py")
+    if codec == "json":
+        labmail.orjson = None
+    mail = labmail.LabMail.__new__(labmail.LabMail)  # Skip __init__: it creates /var/lib/labmail
+    mail.output_format = "text"
+    mail.scan_workers = scan_workers
+    mail.hostname = host
+    mail.inbox_dir = Path(base_dir) / "inbox"
+    mail.sent_dir = Path(base_dir) / "sent"
+    mail.index_dir = Path(base_dir) / "index"
+    return mail
+
+
+# Synthetic inboxes
+
+def build_file_inbox(base_dir, host, count, body_size, layout="single"):
+    """Write count message files shaped like labmail.py's, oldest first
+
+    layout "single" is the original one-JSON-document file; "header" is the
+    current fixed header line followed by the body.
+    """
+    inbox = Path(base_dir) / "inbox" / host
+    inbox.mkdir(parents=True)
+    mail = file_backend(base_dir, host) if layout == "header" else None
+    start = datetime.now(timezone.utc) - timedelta(seconds=count)
+    body = ("lorem ipsum dolor sit amet " * (body_size // 27 + 1))[:body_size]
+    priorities = ("normal",) * 8 + ("high", "urgent")
+    for i in range(count):
+        message_id = str(uuid.uuid4())
+        message = {
+            "id": message_id, "from": ("edgar-dev", "skynet-prod", "hal-db")[i % 3], "to": host,
+            "subject": f"Benchmark message {i}", "body": body,
+            "timestamp": (start + timedelta(seconds=i)).isoformat(), "read": i % 4 != 0,
+            "priority": priorities[i % len(priorities)], "in_reply_to": None, "thread_id": message_id,
+        }
+        if mail:
+            mail._write_message(inbox / f"{message_id}.json", message)
+        else:
+            with open(inbox / f"{message_id}.json", 'w') as f:
+                json.dump(message, f, separators=(',', ':'))
+
+
+def build_pg_inbox(mail, host, count, body_size):
+    conn = mail._get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO labmailmessages (id, from_system, to_system, subject, body, priority, is_read, created_at)
+            SELECT gen_random_uuid(), (ARRAY['edgar-dev', 'skynet-prod', 'hal-db'])[i %% 3 + 1], %s,
+                   'Benchmark message ' || i, repeat('x', %s),
+                   CASE WHEN i %% 10 = 8 THEN 'high' WHEN i %% 10 = 9 THEN 'urgent' ELSE 'normal' END,
+                   i %% 4 <> 0, NOW() - make_interval(secs => %s - i)
+            FROM generate_series(1, %s) AS i
+        """, (host, body_size, count, count))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def drop_pg_inbox(mail, host):
+    conn = mail._get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM labmailmessages WHERE to_system = %s", (host,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Variants, each run in its own process so peak RSS is its own
+
+def list_file(variant, base_dir, host):
+    if variant == "baseline":
+        return 0
+
+    if variant == "dicts":
+        # The list path before header records: every message fully parsed and kept
+        messages = []
+        for msg_file in (Path(base_dir) / "inbox" / host).glob("*.json"):
+            with open(msg_file, 'r') as f:
+                messages.append(json.load(f))
+        messages.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+        with open(os.devnull, 'w') as out:
+            for msg in messages:
+                print(f"[{msg['id'][:8]}] From: {msg.get('from')} {msg.get('subject')}", file=out)
+        return len(messages)
+
+    mail = file_backend(base_dir, host)
+    with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+        mail.list_messages()
+    return None
+
+
+def list_pg(variant, host):
+    labmail_db = load_script("labmail-db.py")
+    mail = labmail_db.LabMailDB()
+    mail.hostname = host
+    if variant == "baseline":
+        return 0
+
+    if variant == "dicts":
+        # The list path before header records: one RealDictRow per message
+        from psycopg2.extras import RealDictCursor
+        conn = mail._get_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                SELECT id, from_system, to_system, subject, priority, created_at, is_read,
+                       read_at, thread_id, in_reply_to, body_size
+                FROM labmailmessages WHERE to_system = %s
+                ORDER BY is_read, CASE WHEN is_read THEN 2 ELSE priority_rank END, created_at DESC
+            """, (host,))
+            messages = cur.fetchall()
+        finally:
+            conn.close()
+        with open(os.devnull, 'w') as out:
+            for msg in messages:
+                print(f"[{str(msg['id'])[:8]}] From: {msg['from_system']} {msg['subject']}", file=out)
+        return len(messages)
+
+    with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+        mail.list_messages()
+    return None
+
+
+def measure(args):
+    """Child process: run one variant and report its peak RSS as JSON"""
+    backend, variant = args.child.split(':')
+    start = time.monotonic()
+    if backend == "file":
+        count = list_file(variant, args.dir, args.host)
+    else:
+        count = list_pg(variant, args.host)
+    print(json.dumps({"rss_mb": peak_rss_mb(), "seconds": time.monotonic() - start, "count": count}))
+
+
+def measure_listing(args):
+    """Child process: time list_messages over one inbox layout with one JSON codec"""
+    layout, codec = args.child.split(':')
+    mail = file_backend(args.dir, args.host, codec)
+    best = None
+    with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+        for _ in range(args.repeat):
+            start = time.monotonic()
+            mail.list_messages()
+            elapsed = time.monotonic() - start
+            best = elapsed if best is None else min(best, elapsed)
+    print(json.dumps({"seconds": best, "rss_mb": peak_rss_mb()}))
+
+
+def run_child(command, *extra):
+    result = subprocess.run([sys.executable, str(Path(__file__).resolve()), command, *extra],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"Benchmark child failed: {' '.join(extra)}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def memory(args):
+    backends = ["file", "postgres"] if args.backend == "both" else [args.backend]
+    print(f"LabMail list memory: {args.messages} messages, {args.body_size}-byte bodies")
+    print()
+    print(f"{'backend':<10}{'loader':<10}{'peak RSS':>12}{'over baseline':>16}{'time':>10}")
+
+    for backend in backends:
+        work_dir = tempfile.mkdtemp(prefix="labmail-bench-")
+        mail = None
+        try:
+            if backend == "file":
+                build_file_inbox(work_dir, BENCH_HOST, args.messages, args.body_size)
+            else:
+                mail = load_script("labmail-db.py").LabMailDB()
+                build_pg_inbox(mail, BENCH_HOST, args.messages, args.body_size)
+
+            baseline = None
+            for variant in ("baseline", "dicts", "headers"):
+                result = run_child("memory", "--child", f"{backend}:{variant}", "--dir", work_dir, "--host", BENCH_HOST)
+                if variant == "baseline":
+                    baseline = result["rss_mb"]
+                    continue
+                print(f"{backend:<10}{variant:<10}{result['rss_mb']:>9.1f} MB{result['rss_mb'] - baseline:>13.1f} MB"
+                      f"{result['seconds']:>9.2f}s")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            if mail:
+                drop_pg_inbox(mail, BENCH_HOST)
+
+
+def listing(args):
+    codecs = ["json", "orjson"] if importlib.util.find_spec("orjson") else ["json"]
+    print(f"LabMail file backend list throughput: {args.messages} messages, {args.body_size}-byte bodies, "
+          f"best of {args.repeat} (warm cache)")
+    print()
+    print(f"{'layout':<10}{'codec':<10}{'time':>10}{'messages/s':>14}{'peak RSS':>12}")
+
+    for layout in ("single", "header"):
+        work_dir = tempfile.mkdtemp(prefix="labmail-bench-")
+        try:
+            build_file_inbox(work_dir, BENCH_HOST, args.messages, args.body_size, layout)
+            for codec in codecs:
+                result = run_child("listing", "--child", f"{layout}:{codec}", "--dir", work_dir,
+                                   "--host", BENCH_HOST, "--repeat", str(args.repeat))
+                print(f"{layout:<10}{codec:<10}{result['seconds']:>9.2f}s{args.messages / result['seconds']:>14,.0f}"
+                      f"{result['rss_mb']:>9.1f} MB")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if len(codecs) == 1:
+        print()
+        print("orjson is not installed; pip install orjson to compare codecs")
+
+
+def scan(args):
+    """Time the header scan (list) and an index rebuild at increasing worker counts"""
+    work_dir = tempfile.mkdtemp(prefix="labmail-bench-", dir=args.dir)
+    workers = [int(w) for w in args.workers.split(',')]
+    print(f"LabMail file backend scan: {args.messages} messages in {work_dir}, "
+          f"{args.latency_ms:g} ms injected per file read")
+    print()
+    print(f"{'workers':>8}{'header scan':>14}{'index rebuild':>16}{'speedup':>10}")
+
+    try:
+        build_file_inbox(work_dir, BENCH_HOST, args.messages, args.body_size, "header")
+        (Path(work_dir) / "index").mkdir()
+        first = None
+        for count in workers:
+            mail = file_backend(work_dir, BENCH_HOST, scan_workers=count)
+            if args.latency_ms:
+                # Stand-in for an NFS round trip per file when no NFS mount is at hand
+                for name in ("_read_header", "_read_message"):
+                    read = getattr(mail, name)
+                    setattr(mail, name, lambda path, read=read: (time.sleep(args.latency_ms / 1000), read(path))[1])
+
+            with open(os.devnull, 'w') as out, contextlib.redirect_stdout(out):
+                start = time.monotonic()
+                mail.list_messages()
+                headers = time.monotonic() - start
+
+                mail._index_path().unlink(missing_ok=True)
+                start = time.monotonic()
+                mail._update_index()
+                rebuild = time.monotonic() - start
+
+            first = first or headers + rebuild
+            print(f"{count:>8}{headers:>13.2f}s{rebuild:>15.2f}s{first / (headers + rebuild):>9.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def statements(args):
+    """Per-call latency of the hot PostgreSQL statements: plain SQL vs PREPAREd and EXECUTEd by name"""
+    labmail_db = load_script("labmail-db.py")
+    mail = labmail_db.LabMailDB()
+    mail.profile["pooled"] = False  # Benchmark the prepared path whatever the profile says
+    build_pg_inbox(mail, BENCH_HOST, args.messages, 256)
+    conn = mail._get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM labmailmessages WHERE to_system = %s LIMIT 1", (BENCH_HOST,))
+        message_id = str(cur.fetchone()[0])
+        conn.commit()
+
+        def insert_params():
+            new_id = str(uuid.uuid4())
+            return (new_id, "coder", BENCH_HOST, "Benchmark insert", "body", None, None, None,
+                    "normal", new_id, "Benchmark insert", "body")
+
+        cases = [
+            ("labmail_insert", insert_params),
+            ("labmail_lookup", lambda: (BENCH_HOST, message_id[:8] + "%")),
+            ("labmail_mark_read", lambda: ([message_id],)),
+            ("labmail_count_inbox", lambda: (BENCH_HOST,)),
+            ("labmail_list_unread_from", lambda: (BENCH_HOST, "hal-db")),
+            ("labmail_blob_chunk", lambda: (1, 1024, "0" * 64)),
+        ]
+        print(f"LabMail statement latency: {args.messages}-message inbox, {args.calls} calls each "
+              f"on one connection to {labmail_db.describe_dsn(mail.profile['dsn'])}")
+        print()
+        print(f"{'statement':<28}{'plain':>12}{'prepared':>12}{'saved':>12}")
+
+        for name, make_params in cases:
+            timings = {"plain": 0.0, "prepared": 0.0}
+            for call in range(args.calls + 5):  # The first few warm the caches and are not counted
+                # Alternate the modes call by call so drift on the server hits both equally
+                for mode in ("plain", "prepared") if call % 2 else ("prepared", "plain"):
+                    params = make_params()
+                    start = time.perf_counter()
+                    if mode == "plain":
+                        cur.execute(labmail_db.STATEMENTS[name], params)
+                    else:
+                        mail._execute(cur, name, params)
+                    if cur.description:
+                        cur.fetchall()
+                    if call >= 5:
+                        timings[mode] += (time.perf_counter() - start) / args.calls * 1e6
+            conn.commit()
+            saved = timings["plain"] - timings["prepared"]
+            print(f"{name:<28}{timings['plain']:>9.0f} us{timings['prepared']:>9.0f} us"
+                  f"{saved:>9.0f} us ({saved / timings['plain']:.0%})")
+    finally:
+        conn.close()
+        drop_pg_inbox(mail, BENCH_HOST)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="LabMail Bench - Measure LabMail against a synthetic inbox",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  labmail-bench memory                          # 100k messages, file backend
+  labmail-bench memory --backend both --messages 20000 --body-size 8192
+  labmail-bench listing                         # 50k messages: file layout x JSON codec
+  labmail-bench scan --dir /mnt/idea-factory/tmp # scan time vs --scan-workers on NFS
+  labmail-bench scan --latency-ms 2             # ...or with emulated per-file latency
+  labmail-bench statements                      # PostgreSQL: plain vs prepared statement latency
+        """
+    )
+
+    subparsers = parser.add_subparsers(dest='command', help='Benchmarks')
+
+    memory_parser = subparsers.add_parser('memory', help='Peak RSS of listing a large inbox: dicts vs header records')
+    memory_parser.add_argument('--messages', type=int, default=100000, help='Messages in the inbox (default: 100000)')
+    memory_parser.add_argument('--body-size', type=int, default=2048, help='Body size in bytes (default: 2048)')
+    memory_parser.add_argument('--backend', choices=['file', 'postgres', 'both'], default='file',
+                               help='Which LabMail backend to measure (default: file)')
+    memory_parser.add_argument('--child', help=argparse.SUPPRESS)
+    memory_parser.add_argument('--dir', help=argparse.SUPPRESS)
+    memory_parser.add_argument('--host', help=argparse.SUPPRESS)
+    
+    listing_parser = subparsers.add_parser('listing', help='File backend list throughput by file layout and JSON codec')
+    listing_parser.add_argument('--messages', type=int, default=50000, help='Messages in the inbox (default: 50000)')
+    listing_parser.add_argument('--body-size', type=int, default=2048, help='Body size in bytes (default: 2048)')
+    listing_parser.add_argument('--repeat', type=int, default=3, help='Listings per variant; the best counts (default: 3)')
+    listing_parser.add_argument('--child', help=argparse.SUPPRESS)
+    listing_parser.add_argument('--dir', help=argparse.SUPPRESS)
+    listing_parser.add_argument('--host', help=argparse.SUPPRESS)
+    
+    scan_parser = subparsers.add_parser('scan', help='File backend folder scan time by --scan-workers count')
+    scan_parser.add_argument('--messages', type=int, default=20000, help='Messages in the inbox (default: 20000)')
+    scan_parser.add_argument('--body-size', type=int, default=2048, help='Body size in bytes (default: 2048)')
+    scan_parser.add_argument('--workers', default='1,2,4,8,16,32',
+                             help='Comma-separated worker counts to try (default: 1,2,4,8,16,32)')
+    scan_parser.add_argument('--dir', help='Build the inbox under this directory, e.g. on an NFS mount (default: /tmp)')
+    scan_parser.add_argument('--latency-ms', type=float, default=0,
+                             help='Sleep this long per file read to emulate network storage (default: 0)')
+    
+    statements_parser = subparsers.add_parser('statements', help='PostgreSQL hot statement latency: plain vs prepared')
+    statements_parser.add_argument('--messages', type=int, default=5000, help='Messages in the inbox (default: 5000)')
+    statements_parser.add_argument('--calls', type=int, default=500, help='Timed calls per statement and mode (default: 500)')
+
+    args = parser.parse_args()
+
+    if args.command == 'memory':
+        if args.child:
+            measure(args)
+        else:
+            memory(args)
+    elif args.command == 'scan':
+        scan(args)
+    elif args.command == 'statements':
+        statements(args)
+    elif args.command == 'listing':
+        if args.child:
+            measure_listing(args)
+        else:
+            listing(args)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
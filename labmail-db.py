@@ -4,81 +4,635 @@ LabMail - Digital Innovation Lab Messaging System (PostgreSQL Backend)
 Interoffice messaging for AI collective coordination via HAL-db PostgreSQL
 """
 
+import time
+
+STARTED = time.perf_counter()  # --profile counts module imports from here
+
 import argparse
+import codecs
+import configparser
+import gzip
+import hashlib
+import itertools
 import json
 import os
+import random
+import re
+import select
 import socket
 import sys
 import uuid
+import zlib
+from collections import namedtuple
 from datetime import datetime, timezone
 import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, connection, cursor, parse_dsn
 from psycopg2.extras import RealDictCursor
 
+from toolkit_metrics import Metrics, Profiler
+
+
+# Schema history: entry N brings the database to version N+1. Statements must
+# be idempotent so databases created before versioning upgrade cleanly.
+# Adding an entry? Bump SCHEMA_VERSION in labmail_async.py to match.
+SCHEMA_MIGRATIONS = [
+    [
+        """
+        CREATE TABLE IF NOT EXISTS labmailmessages (
+            id UUID PRIMARY KEY,
+            from_system VARCHAR(50) NOT NULL,
+            to_system VARCHAR(50) NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT,
+            priority VARCHAR(20) DEFAULT 'normal',
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+            read_at TIMESTAMP WITH TIME ZONE NULL,
+            is_read BOOLEAN DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_labmail_to_system
+        ON labmailmessages(to_system, is_read, created_at DESC)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_labmail_from_system
+        ON labmailmessages(from_system, created_at DESC)
+        """,
+    ],
+    [
+        # Full-text search over subject (weighted higher) and body
+        """
+        ALTER TABLE labmailmessages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(body, '')), 'B')
+        ) STORED
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_labmail_search
+        ON labmailmessages USING GIN (search_vector)
+        """,
+    ],
+    [
+        # Reply links; every message carries the id of its thread's root
+        """
+        ALTER TABLE labmailmessages
+            ADD COLUMN IF NOT EXISTS in_reply_to UUID NULL,
+            ADD COLUMN IF NOT EXISTS thread_id UUID NULL
+        """,
+        "UPDATE labmailmessages SET thread_id = id WHERE thread_id IS NULL",
+        """
+        CREATE INDEX IF NOT EXISTS idx_labmail_thread
+        ON labmailmessages(thread_id, created_at)
+        """,
+    ],
+    [
+        # Large bodies are gzipped into body_gz or offloaded to the
+        # content-addressed labmail_blobs table. Both are already compressed,
+        # so EXTERNAL storage skips TOAST compression and lets substring()
+        # fetch just the chunks a streaming read asks for.
+        """
+        ALTER TABLE labmailmessages
+            ADD COLUMN IF NOT EXISTS body_gz BYTEA NULL,
+            ADD COLUMN IF NOT EXISTS body_blob CHAR(64) NULL,
+            ADD COLUMN IF NOT EXISTS body_size INTEGER NULL
+        """,
+        "ALTER TABLE labmailmessages ALTER COLUMN body_gz SET STORAGE EXTERNAL",
+        """
+        CREATE TABLE IF NOT EXISTS labmail_blobs (
+            digest CHAR(64) PRIMARY KEY,
+            data BYTEA NOT NULL,
+            size BIGINT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+        )
+        """,
+        "ALTER TABLE labmail_blobs ALTER COLUMN data SET STORAGE EXTERNAL",
+        # Packed bodies are not in the body column, so the search vector is
+        # written on insert instead of generated from it
+        "ALTER TABLE labmailmessages ALTER COLUMN search_vector DROP EXPRESSION IF EXISTS",
+    ],
+    [
+        # Work-queue claims: a claimed message is skipped by other claimers
+        # until claimed_until passes; ack marks it read, nack releases it
+        """
+        ALTER TABLE labmailmessages
+            ADD COLUMN IF NOT EXISTS claim_token UUID NULL,
+            ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(100) NULL,
+            ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMP WITH TIME ZONE NULL,
+            ADD COLUMN IF NOT EXISTS delivery_count INTEGER NOT NULL DEFAULT 0
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_labmail_claimable
+        ON labmailmessages(to_system, created_at) WHERE is_read = FALSE
+        """,
+    ],
+    [
+        # Delivery order: urgent, then high, then normal; oldest first within a level
+        """
+        ALTER TABLE labmailmessages ADD COLUMN IF NOT EXISTS priority_rank SMALLINT
+        GENERATED ALWAYS AS (CASE priority WHEN 'urgent' THEN 0 WHEN 'high' THEN 1 ELSE 2 END) STORED
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_labmail_priority
+        ON labmailmessages(to_system, is_read, priority_rank, created_at)
+        """,
+        # Superseded: claims now walk idx_labmail_priority in delivery order
+        "DROP INDEX IF EXISTS idx_labmail_claimable",
+    ],
+]
+
+# Connection profiles: INI files, one section per profile, later files overriding
+# earlier ones. $LABMAIL_CONFIG replaces the list; every key can also be set with
+# a LABMAIL_<KEY> environment variable, which wins over the file.
+CONFIG_PATHS = ("/etc/labmail.conf", "~/.config/labmail.conf")
+DEFAULT_PROFILE = {
+    # hal-db.justsparx.local. No password here: libpq (and asyncpg) take it from
+    # ~/.pgpass or PGPASSWORD, or put one in the profile's dsn
+    "dsn": "postgresql://hal_admin@192.168.1.202:5432/hal_main",
+    "read_dsn": "",  # Replicas for read-only queries, separated by whitespace; empty sends them to dsn
+    "listen_dsn": "",  # Unpooled connection for watch (LISTEN); empty uses dsn
+    "pooled": "no",  # dsn/read_dsn go through pgbouncer in transaction mode: keep no session state
+    "connect_timeout": "10",  # Seconds
+    "statement_timeout": "0",  # Seconds, 0 for none; ignored when pooled (set it on the role instead)
+    "replica_wait": "2",  # Seconds --consistent waits for a replica to catch up before using dsn
+}
+
+
+def load_profile(name=None):
+    """Resolve a connection profile: built-in defaults, then the config file section, then LABMAIL_* variables"""
+    name = name or os.environ.get("LABMAIL_PROFILE") or "default"
+    parser = configparser.ConfigParser(interpolation=None)
+    config_path = os.environ.get("LABMAIL_CONFIG")
+    found = parser.read([config_path] if config_path else [os.path.expanduser(p) for p in CONFIG_PATHS])
+    
+    if parser.has_section(name):
+        settings = dict(parser[name])
+    elif name == "default":
+        settings = parser.defaults()
+    else:
+        raise ValueError(f"no [{name}] profile in {', '.join(found) or 'any config file'}")
+    unknown = set(settings) - set(DEFAULT_PROFILE)
+    if unknown:
+        raise ValueError(f"unknown setting(s) in [{name}]: {', '.join(sorted(unknown))}")
+    
+    profile = {key: os.environ.get(f"LABMAIL_{key.upper()}", settings.get(key, default))
+               for key, default in DEFAULT_PROFILE.items()}
+    profile["pooled"] = profile["pooled"].strip().lower() in ("1", "yes", "true", "on")
+    profile["connect_timeout"] = int(profile["connect_timeout"])
+    profile["statement_timeout"] = float(profile["statement_timeout"])
+    profile["replica_wait"] = float(profile["replica_wait"])
+    if not profile["dsn"].strip():
+        raise ValueError(f"no dsn configured in [{name}]: set dsn in {', '.join(found) or CONFIG_PATHS[-1]} or LABMAIL_DSN")
+    profile["name"] = name
+    return profile
+
+
+def describe_dsn(dsn):
+    """host:port/dbname of a DSN for messages; never the password"""
+    try:
+        parts = parse_dsn(dsn)
+    except psycopg2.Error:
+        return "(unparseable DSN)"
+    return f"{parts.get('host', 'local socket')}:{parts.get('port', 5432)}/{parts.get('dbname', parts.get('user', '?'))}"
+
+
+# Column -> key for --format json/ndjson; every LabMail backend uses the same keys
+MESSAGE_FIELDS = (
+    ("id", "id"), ("from_system", "from"), ("to_system", "to"), ("subject", "subject"),
+    ("priority", "priority"), ("created_at", "created_at"), ("is_read", "is_read"),
+    ("read_at", "read_at"), ("thread_id", "thread_id"), ("in_reply_to", "in_reply_to"),
+    ("body_size", "body_size"), ("claim_token", "claim_token"), ("claimed_until", "claimed_until"),
+    ("delivery_count", "delivery_count"),
+)
+
+# One inbox row as list shows it: a plain tuple per message instead of a dict
+MessageHeader = namedtuple("MessageHeader", (
+    "id", "from_system", "to_system", "subject", "priority", "created_at", "is_read",
+    "read_at", "thread_id", "in_reply_to", "body_size",
+))
+
+
+def list_query(unread_only=False, by_sender=False, with_body=False):
+    """The inbox listing for one combination of list filters
+
+    Unread mail comes first in delivery order (urgent before high before
+    normal, oldest first within a level), then read mail newest first. Each
+    part is a branch that walks its index in order (idx_labmail_priority,
+    idx_labmail_to_system) and UNION ALL returns them one after the other, so
+    nothing is sorted. Without unread_only the parameters go in once per branch.
+    """
+    columns = ', '.join(MessageHeader._fields)
+    if with_body:
+        columns += ", body, body_gz, body_blob"
+    sender = " AND from_system = %s" if by_sender else ""
+    unread = (f"SELECT {columns} FROM labmailmessages WHERE to_system = %s AND is_read = FALSE{sender}"
+              " ORDER BY priority_rank, created_at")
+    if unread_only:
+        return unread
+    read = (f"SELECT {columns} FROM labmailmessages WHERE to_system = %s AND is_read = TRUE{sender}"
+            " ORDER BY created_at DESC")
+    return f"({unread}) UNION ALL ({read})"
+
+
+# Hot statements, PREPAREd by name the first time a connection runs them and
+# EXECUTEd after that, so repeats skip parsing and planning. Placeholders are
+# psycopg2's %s; arrays arrive as text[] and are cast explicitly, because
+# EXECUTE only applies assignment casts to its arguments.
+STATEMENTS = {
+    "labmail_insert": """
+        INSERT INTO labmailmessages
+        (id, from_system, to_system, subject, body, body_gz, body_blob, body_size,
+         priority, thread_id, search_vector)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                setweight(to_tsvector('english', %s::text), 'A') ||
+                setweight(to_tsvector('english', %s::text), 'B'))
+    """,
+    "labmail_lookup": """
+        SELECT id, from_system, to_system, subject, body, body_gz, body_blob, body_size,
+               priority, created_at, read_at, is_read, thread_id, in_reply_to
+        FROM labmailmessages
+        WHERE to_system = %s AND CAST(id AS TEXT) LIKE %s
+        ORDER BY created_at DESC
+        LIMIT 1
+    """,
+    "labmail_mark_read": """
+        UPDATE labmailmessages
+        SET is_read = TRUE, read_at = NOW()
+        WHERE id = ANY(%s::text[]::uuid[]) AND is_read = FALSE
+    """,
+    "labmail_count_inbox": """
+        SELECT COUNT(*) AS total, COUNT(*) FILTER (WHERE is_read = FALSE) AS unread
+        FROM labmailmessages
+        WHERE to_system = %s
+    """,
+    "labmail_blob_chunk": "SELECT substring(data FROM %s FOR %s) FROM labmail_blobs WHERE digest = %s",
+    # Every member's mailbox in one pass: each message counts once for its
+    # recipient and once for its sender. Activity is sending or reading mail.
+    "labmail_overview": """
+        SELECT member,
+               COALESCE(a.received, 0) AS received, COALESCE(a.unread, 0) AS unread,
+               COALESCE(a.sent, 0) AS sent,
+               EXTRACT(EPOCH FROM NOW() - a.oldest_unread)::float8 AS oldest_unread_seconds,
+               a.last_activity,
+               EXTRACT(EPOCH FROM NOW() - a.last_activity)::float8 AS last_activity_seconds
+        FROM (
+            SELECT side.member,
+                   COUNT(*) FILTER (WHERE side.inbound) AS received,
+                   COUNT(*) FILTER (WHERE side.inbound AND NOT m.is_read) AS unread,
+                   COUNT(*) FILTER (WHERE NOT side.inbound) AS sent,
+                   MIN(m.created_at) FILTER (WHERE side.inbound AND NOT m.is_read) AS oldest_unread,
+                   GREATEST(MAX(m.created_at) FILTER (WHERE NOT side.inbound),
+                            MAX(m.read_at) FILTER (WHERE side.inbound)) AS last_activity
+            FROM labmailmessages m
+            CROSS JOIN LATERAL (VALUES (m.to_system, TRUE), (m.from_system, FALSE)) AS side(member, inbound)
+            GROUP BY side.member
+        ) a
+        FULL JOIN unnest(%s::text[]) AS c(member) USING (member)
+        ORDER BY member
+    """,
+    **{f"labmail_list{'_unread' * unread_only}{'_from' * by_sender}": list_query(unread_only, by_sender)
+       for unread_only in (False, True) for by_sender in (False, True)},
+}
+
+
+def prepared_sql(query):
+    """A STATEMENTS query with its %s placeholders numbered $1, $2, ... for PREPARE"""
+    numbers = itertools.count(1)
+    return re.sub(r"%%|%s", lambda m: m.group() if m.group() == "%%" else f"${next(numbers)}", query)
+
+
+# overview column -> Prometheus gauge; rows with no value (nothing unread) are left out
+OVERVIEW_METRICS = (
+    ("received", "labmail_messages_received", "Messages addressed to the member"),
+    ("unread", "labmail_messages_unread", "Unread messages in the member's inbox"),
+    ("sent", "labmail_messages_sent", "Messages sent by the member"),
+    ("oldest_unread_seconds", "labmail_oldest_unread_age_seconds", "Age of the oldest unread message"),
+    ("last_activity", "labmail_last_activity_timestamp_seconds", "Unix time the member last sent or read mail"),
+)
+
+
+def prometheus_text(rows):
+    """Render overview rows in the Prometheus text exposition format"""
+    lines = []
+    for key, metric, help_text in OVERVIEW_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        for row in rows:
+            value = row[key]
+            if value is None:
+                continue
+            if isinstance(value, datetime):
+                value = value.timestamp()
+            member = row["member"].replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            lines.append(f'{metric}{{member="{member}"}} {round(value, 3)}')
+    return "\n".join(lines) + "\n"
+
+
+def format_age(seconds, suffix=""):
+    """Compact age for tables: 45s, 12m, 3h, 2d; "-" when there is none"""
+    if seconds is None:
+        return "-"
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)}{unit}{suffix}"
+    return f"{int(seconds)}s{suffix}"
+
+
+# --profile phases, in report order. A connect made while checking the schema
+# counts as connect, but ensure-schema keeps its own queries.
+PROFILER = Profiler(STARTED, ("import", "startup", "connect", "ensure-schema", "query", "fetch", "render"),
+                    opaque={"ensure-schema"})
+
+
+# Instrumentation for node_exporter's textfile collector; histograms use Metrics.BUCKETS
+LABMAIL_METRICS = {
+    "labmail_operation_duration_seconds": ("histogram", "Time taken by a LabMail command, connecting included"),
+    "labmail_connection_acquire_seconds": ("histogram", "Time to open a PostgreSQL connection"),
+    "labmail_connection_errors_total": ("counter", "PostgreSQL connections that could not be opened"),
+    "labmail_rows_scanned_total": ("counter", "Rows returned or changed by LabMail statements"),
+    "labmail_bytes_written_total": ("counter", "Message body bytes written to the database, after compression"),
+}
+METRICS = Metrics("labmail-db", LABMAIL_METRICS, duration="labmail_operation_duration_seconds")
+
+
+class MeteredCursor:
+    """Cursor mixin adding the rows each statement returned or changed to labmail_rows_scanned_total
+
+    A server-side (named) cursor's rowcount only covers its latest batch,
+    so its rows are counted as they are iterated instead.
+    """
+    
+    def execute(self, query, vars=None):
+        with PROFILER.phase("query"):
+            super().execute(query, vars)
+        if self.name is None and self.rowcount > 0:
+            METRICS.add("labmail_rows_scanned_total", self.rowcount, operation=METRICS.operation)
+    
+    def fetchone(self):
+        with PROFILER.phase("fetch"):
+            return super().fetchone()
+    
+    def fetchmany(self, size=None):
+        with PROFILER.phase("fetch"):
+            return super().fetchmany(size)
+    
+    def fetchall(self):
+        with PROFILER.phase("fetch"):
+            return super().fetchall()
+    
+    def __iter__(self):
+        rows = super().__iter__()
+        return rows if self.name is None and not PROFILER.enabled else self._counted(rows)
+    
+    def _counted(self, rows):
+        fetched = 0
+        try:
+            while True:
+                with PROFILER.phase("fetch"):
+                    row = next(rows)  # Not a for loop: a plain cursor's iterator is the cursor itself
+                yield row
+                fetched += 1
+        except StopIteration:
+            return
+        finally:
+            if self.name is not None:
+                METRICS.add("labmail_rows_scanned_total", fetched, operation=METRICS.operation)
+
+
+class MeteredTupleCursor(MeteredCursor, cursor):
+    pass
+
+
+class MeteredDictCursor(MeteredCursor, RealDictCursor):
+    pass
+
+
+class StatementConnection(connection):
+    """A psycopg2 connection that remembers which STATEMENTS it has PREPAREd and hands out metered cursors"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.prepare_failed = False  # Some PREPARE's fate is unknown; the next one starts with DEALLOCATE ALL
+    
+    def cursor(self, *args, cursor_factory=None, **kwargs):
+        metered = MeteredDictCursor if cursor_factory is RealDictCursor else cursor_factory or MeteredTupleCursor
+        return super().cursor(*args, cursor_factory=metered, **kwargs)
+
+
+def json_default(value):
+    """Serialize the datetime and UUID values psycopg2 returns"""
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def emit(record, output_format):
+    """Print one JSON object: indented for json, a single line for ndjson"""
+    print(json.dumps(record, default=json_default, indent=2 if output_format == "json" else None))
+
+
+def emit_stream(records, output_format):
+    """Print records as they are produced: a line each for ndjson, or a JSON array written incrementally"""
+    count = 0
+    if output_format != "ndjson":
+        sys.stdout.write("[")
+    for record in records:
+        line = json.dumps(record, default=json_default)
+        if output_format == "ndjson":
+            print(line)
+        else:
+            sys.stdout.write(("," if count else "") + "\n  " + line)
+        count += 1
+    if output_format != "ndjson":
+        sys.stdout.write("\n]\n" if count else "]\n")
+    return count
+
+
+def emit_error(message, **fields):
+    """Report an error in JSON modes on stderr so stdout stays parseable"""
+    print(json.dumps({"error": message, **fields}, default=json_default), file=sys.stderr)
+
 
 class LabMailDB:
-    def __init__(self):
+    COMPRESS_THRESHOLD = 8 * 1024  # Bodies this size (bytes) or larger are gzipped
+    BLOB_THRESHOLD = 256 * 1024  # ...and these go to labmail_blobs instead of the row
+    STREAM_CHUNK = 256 * 1024  # Compressed bytes fetched per round trip when streaming a blob
+    SEARCH_TEXT_LIMIT = 256 * 1024  # Body characters fed to the search vector
+    
+    def __init__(self, output_format="text", profile=None, read_only=False, consistent=False):
         self.hostname = socket.gethostname().split('.')[0]  # Remove domain
+        self.output_format = output_format  # text, json or ndjson
+        self.consistent = consistent  # Replica reads must see everything committed on the primary so far
+        self._primary_lsn = None
         
         # HAL-db connection settings
-        self.db_config = {
-            'host': '192.168.1.202',  # hal-db.justsparx.local
-            'port': 5432,
-            'database': 'hal_main',
-            'user': 'hal_admin',
-            'password': 'hal_admin_password'
-        }
+        try:
+            self.profile = load_profile(profile)
+        except ValueError as e:
+            print(f"❌ Bad connection profile: {e}")
+            sys.exit(1)
         
         # Known AI collective members
         self.collective_members = [
             "edgar-dev", "skynet-prod", "hal-db", "coder"
         ]
         
-        self._ensure_tables()
+        # Read-only commands check the schema on a replica and leave the primary alone
+        self._ensure_tables("read_dsn" if read_only else "dsn")
+    
+    def _connect_options(self, target):
+        """psycopg2.connect() keywords for one of the profile's DSNs"""
+        options = {"connect_timeout": self.profile["connect_timeout"], "connection_factory": StatementConnection}
+        if self.profile["statement_timeout"] and not (self.profile["pooled"] and target != "listen_dsn"):
+            options["options"] = f"-c statement_timeout={int(self.profile['statement_timeout'] * 1000)}"
+        return options
+    
+    @PROFILER.timed("connect")
+    def _connect(self, dsn, target):
+        """psycopg2.connect() to dsn, recording how long it took (or that it failed) under target"""
+        started = time.perf_counter()
+        try:
+            conn = psycopg2.connect(dsn, **self._connect_options(target))
+        except psycopg2.Error:
+            METRICS.add("labmail_connection_errors_total", target=target)
+            raise
+        METRICS.observe("labmail_connection_acquire_seconds", time.perf_counter() - started, target=target)
+        return conn
     
-    def _get_connection(self):
-        """Get database connection to HAL-db"""
+    def _get_connection(self, target="dsn"):
+        """Get database connection to HAL-db: target is the profile's dsn, read_dsn or listen_dsn
+        
+        An empty read_dsn or listen_dsn falls back to dsn, and so does a
+        read_dsn whose replicas are all down or, under --consistent, behind.
+        Pooled connections get no startup options, which pgbouncer would
+        reject; listen_dsn is always a direct connection.
+        """
+        if target == "read_dsn" and self.profile["read_dsn"]:
+            conn = self._replica_connection()
+            if conn is not None:
+                return conn
+            target = "dsn"
+        dsn = self.profile[target] or self.profile["dsn"]
         try:
-            conn = psycopg2.connect(**self.db_config)
-            return conn
+            return self._connect(dsn, target)
         except psycopg2.Error as e:
             print(f"❌ Cannot connect to HAL-db: {e}")
-            print(f"   Host: {self.db_config['host']}:{self.db_config['port']}")
-            print(f"   Database: {self.db_config['database']}")
+            print(f"   Server: {describe_dsn(dsn)} (profile: {self.profile['name']})")
             print("   Ensure HAL-db is running and accessible")
+            if "password" in str(e):
+                print("   Password: add it to ~/.pgpass, set PGPASSWORD, or put it in the profile's dsn")
             sys.exit(1)
     
-    def _ensure_tables(self):
-        """Create LabMail tables if they don't exist"""
-        conn = self._get_connection()
+    def _replica_connection(self):
+        """Connect to one of the profile's replicas, spreading load by trying them in random order
+        
+        Under --consistent the replica must first replay the primary's WAL up
+        to where it was when the command started, which covers every write
+        committed before it, from any host. Returns None when no replica is
+        usable within replica_wait seconds; the caller then reads from dsn.
+        """
+        replicas = self.profile["read_dsn"].split()
+        random.shuffle(replicas)
+        if self.consistent and self._primary_lsn is None:
+            conn = self._get_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT pg_current_wal_lsn()")
+                self._primary_lsn = cur.fetchone()[0]
+            finally:
+                conn.close()
+        
+        deadline = time.monotonic() + self.profile["replica_wait"]
+        for dsn in replicas:
+            try:
+                conn = self._connect(dsn, "read_dsn")
+            except psycopg2.Error as e:
+                print(f"⚠️  Replica {describe_dsn(dsn)} unavailable: {str(e).strip()}", file=sys.stderr)
+                continue
+            if not self.consistent:
+                return conn
+            try:
+                cur = conn.cursor()
+                while True:
+                    cur.execute("SELECT NOT pg_is_in_recovery() OR pg_last_wal_replay_lsn() >= %s::pg_lsn",
+                                (self._primary_lsn,))
+                    caught_up = cur.fetchone()[0]
+                    conn.rollback()  # Don't hold a snapshot while waiting
+                    if caught_up:
+                        return conn
+                    if time.monotonic() >= deadline:
+                        break
+                    time.sleep(0.02)
+            except psycopg2.Error as e:
+                print(f"⚠️  Replica {describe_dsn(dsn)} unavailable: {str(e).strip()}", file=sys.stderr)
+            conn.close()
+        return None
+    
+    def _execute(self, cur, name, params=()):
+        """Run a STATEMENTS entry, PREPAREd in the same round trip the first time this connection needs it
+        
+        Pooled connections send the plain SQL: under transaction pooling the
+        next statement may reach a server that never saw the PREPARE.
+        """
+        conn = cur.connection
+        if self.profile["pooled"]:
+            cur.execute(STATEMENTS[name], params)
+            return
+        call = f"EXECUTE {name}({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}"
+        if name in conn.prepared:
+            cur.execute(call, params)
+            return
+        # PREPARE is not undone by a rollback: if the EXECUTE after it failed the
+        # statement exists, if PREPARE itself failed it does not. Rather than guess,
+        # drop them all before the next PREPARE on this connection.
+        reset = "DEALLOCATE ALL; " if conn.prepare_failed else ""
+        try:
+            cur.execute(f"{reset}PREPARE {name} AS {prepared_sql(STATEMENTS[name])}; {call}", params)
+        except psycopg2.Error:
+            conn.prepare_failed = True
+            if reset:
+                conn.prepared.clear()
+            raise
+        if reset:
+            conn.prepared.clear()
+            conn.prepare_failed = False
+        conn.prepared.add(name)
+    
+    @PROFILER.timed("ensure-schema")
+    def _ensure_tables(self, target="dsn"):
+        """Create or upgrade LabMail tables when the schema version is behind
+        
+        The version check may run on a replica; an upgrade always runs on dsn.
+        """
+        conn = self._get_connection(target)
         try:
             cur = conn.cursor()
             
-            # Create messages table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS labmailmessages (
-                    id UUID PRIMARY KEY,
-                    from_system VARCHAR(50) NOT NULL,
-                    to_system VARCHAR(50) NOT NULL,
-                    subject TEXT NOT NULL,
-                    body TEXT,
-                    priority VARCHAR(20) DEFAULT 'normal',
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                    read_at TIMESTAMP WITH TIME ZONE NULL,
-                    is_read BOOLEAN DEFAULT FALSE
-                );
-            """)
-            
-            # Create index for efficient queries
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_labmail_to_system 
-                ON labmailmessages(to_system, is_read, created_at DESC);
-            """)
+            # Fast path: one catalog lookup and one tiny SELECT, no DDL or locks
+            cur.execute("SELECT to_regclass('labmail_schema') IS NOT NULL")
+            if cur.fetchone()[0]:
+                cur.execute("SELECT COALESCE(MAX(version), 0) FROM labmail_schema")
+                if cur.fetchone()[0] >= len(SCHEMA_MIGRATIONS):
+                    conn.rollback()
+                    return
             
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_labmail_from_system 
-                ON labmailmessages(from_system, created_at DESC);
-            """)
+            if target != "dsn":
+                # Behind, or a lagging replica: the primary re-checks under the lock below
+                conn.close()
+                conn = self._get_connection()
+                cur = conn.cursor()
+            
+            # Serialize upgrades so concurrent first runs don't race on DDL
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('labmail_schema'))")
+            cur.execute("CREATE TABLE IF NOT EXISTS labmail_schema (version INTEGER NOT NULL)")
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM labmail_schema")
+            current = cur.fetchone()[0]
             
+            for statements in SCHEMA_MIGRATIONS[current:]:
+                for statement in statements:
+                    cur.execute(statement)
+            
+            cur.execute("DELETE FROM labmail_schema")
+            cur.execute("INSERT INTO labmail_schema (version) VALUES (%s)", (len(SCHEMA_MIGRATIONS),))
             conn.commit()
             
         except psycopg2.Error as e:
@@ -87,12 +641,96 @@ class LabMailDB:
         finally:
             conn.close()
     
+    def _store_body(self, cur, body):
+        """Return (body, body_gz, body_blob, body_size) column values for a message body
+
+        Small bodies stay plain text. Larger ones are gzipped into body_gz, and
+        the largest are stored once in labmail_blobs under their SHA-256 so the
+        message row only carries the digest.
+        """
+        raw = (body or '').encode('utf-8')
+        if len(raw) < self.COMPRESS_THRESHOLD:
+            METRICS.add("labmail_bytes_written_total", len(raw), operation=METRICS.operation)
+            return body, None, None, None
+        
+        packed = gzip.compress(raw)
+        if len(raw) >= self.BLOB_THRESHOLD:
+            digest = hashlib.sha256(raw).hexdigest()
+            # Identical payloads (the same log sent to several systems) upload once
+            cur.execute("SELECT 1 FROM labmail_blobs WHERE digest = %s", (digest,))
+            if not cur.fetchone():
+                cur.execute("""
+                    INSERT INTO labmail_blobs (digest, data, size) VALUES (%s, %s, %s)
+                    ON CONFLICT (digest) DO NOTHING
+                """, (digest, packed, len(raw)))
+                METRICS.add("labmail_bytes_written_total", len(packed), operation=METRICS.operation)
+            return None, None, digest, len(raw)
+        
+        if len(packed) >= len(raw):
+            METRICS.add("labmail_bytes_written_total", len(raw), operation=METRICS.operation)
+            return body, None, None, None  # Incompressible; TOAST can have it
+        METRICS.add("labmail_bytes_written_total", len(packed), operation=METRICS.operation)
+        return None, packed, None, len(raw)
+    
+    def _body_chunks(self, conn, message):
+        """Yield a message body as text, streaming offloaded blobs a chunk at a time"""
+        if message.get('body_gz') is not None:
+            yield gzip.decompress(bytes(message['body_gz'])).decode('utf-8', errors='replace')
+            return
+        if not message.get('body_blob'):
+            yield message.get('body') or ''
+            return
+        
+        cur = conn.cursor()
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)  # gzip framing
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        offset = 1
+        while True:
+            self._execute(cur, "labmail_blob_chunk", (offset, self.STREAM_CHUNK, message['body_blob']))
+            row = cur.fetchone()
+            if row is None:
+                print(f"⚠️  Body blob missing: {message['body_blob']}", file=sys.stderr)
+                return
+            chunk = bytes(row[0])
+            if not chunk:
+                break
+            yield decoder.decode(decompressor.decompress(chunk))
+            offset += len(chunk)
+        yield decoder.decode(decompressor.flush(), final=True)
+    
+    def _write_body(self, conn, message):
+        """Print a message body without holding a streamed blob in memory"""
+        written = False
+        for chunk in self._body_chunks(conn, message):
+            if chunk:
+                sys.stdout.write(chunk)
+                written = True
+        print("" if written else "No content")
+    
+    def _notify_urgent(self, cur, message_id, recipient, subject):
+        """Push an urgent message to the recipient's watchers; delivered when the transaction commits"""
+        cur.execute("SELECT pg_notify(%s, %s)", (f"labmail_{recipient}", json.dumps({
+            "id": message_id, "from": self.hostname, "to": recipient,
+            "subject": subject[:200], "priority": "urgent",
+        })))
+    
+    def _record(self, row, conn=None, with_body=False):
+        """Convert a message row to a dict for JSON output"""
+        record = {key: row[column] for column, key in MESSAGE_FIELDS if column in row}
+        if with_body:
+            record["body"] = "".join(self._body_chunks(conn, row))
+        return record
+    
+    @METRICS.timed("send")
     def send_message(self, recipient, subject, body, priority="normal"):
         """Send a message to a recipient via HAL-db"""
         # Clean recipient name
         recipient = recipient.split('.')[0]  # Remove domain if present
         
         if recipient not in self.collective_members:
+            if self.output_format != "text":
+                emit_error("Unknown recipient", recipient=recipient, available=self.collective_members)
+                return False
             print(f"❌ Unknown recipient: {recipient}")
             print(f"Available recipients: {', '.join(self.collective_members)}")
             return False
@@ -102,15 +740,22 @@ class LabMailDB:
         conn = self._get_connection()
         try:
             cur = conn.cursor()
+            body_text, body_gz, body_blob, body_size = self._store_body(cur, body)
             
-            cur.execute("""
-                INSERT INTO labmailmessages 
-                (id, from_system, to_system, subject, body, priority)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (message_id, self.hostname, recipient, subject, body, priority))
+            self._execute(cur, "labmail_insert", (message_id, self.hostname, recipient, subject, body_text, body_gz, body_blob, body_size,
+                  priority, message_id, subject, (body or '')[:self.SEARCH_TEXT_LIMIT]))
+            
+            if priority == "urgent":
+                self._notify_urgent(cur, message_id, recipient, subject)
             
             conn.commit()
             
+            if self.output_format != "text":
+                emit({"id": message_id, "to": recipient, "subject": subject, "priority": priority,
+                      "thread_id": message_id, "body_size": len((body or '').encode('utf-8'))},
+                     self.output_format)
+                return True
+            
             priority_emoji = {"normal": "📧", "high": "⚡", "urgent": "🚨"}
             print(f"{priority_emoji.get(priority, '📧')} Message sent to {recipient} via HAL-db")
             print(f"   Subject: {subject}")
@@ -123,31 +768,150 @@ class LabMailDB:
         finally:
             conn.close()
     
-    def list_messages(self, unread_only=False, from_sender=None):
-        """List messages in inbox from HAL-db"""
+    @METRICS.timed("reply")
+    def reply_message(self, message_id, body, subject=None, priority="normal"):
+        """Reply to a message in this inbox, linking it into the same thread"""
+        reply_id = str(uuid.uuid4())
+        
         conn = self._get_connection()
+        try:
+            cur = conn.cursor()
+            body_text, body_gz, body_blob, body_size = self._store_body(cur, body)
+            
+            # Look up the original and insert the reply in one statement
+            cur.execute("""
+                INSERT INTO labmailmessages
+                (id, from_system, to_system, subject, body, body_gz, body_blob, body_size,
+                 priority, in_reply_to, thread_id, search_vector)
+                SELECT %s, %s, m.from_system, s.subject, %s, %s, %s, %s, %s, m.id, COALESCE(m.thread_id, m.id),
+                       setweight(to_tsvector('english', s.subject), 'A') ||
+                       setweight(to_tsvector('english', %s), 'B')
+                FROM labmailmessages m,
+                     LATERAL (SELECT COALESCE(%s, CASE WHEN m.subject ILIKE 're:%%' THEN m.subject
+                                                       ELSE 'Re: ' || m.subject END) AS subject) s
+                WHERE m.to_system = %s AND CAST(m.id AS TEXT) LIKE %s
+                ORDER BY m.created_at DESC
+                LIMIT 1
+                RETURNING to_system, subject, thread_id
+            """, (reply_id, self.hostname, body_text, body_gz, body_blob, body_size, priority,
+                  (body or '')[:self.SEARCH_TEXT_LIMIT], subject, self.hostname, f"{message_id}%"))
+            
+            row = cur.fetchone()
+            if row:
+                if priority == "urgent":
+                    self._notify_urgent(cur, reply_id, row[0], row[1])
+                conn.commit()
+            else:
+                conn.rollback()  # Don't keep a blob stored for a reply that never happened
+            
+            if not row:
+                if self.output_format != "text":
+                    emit_error("Message not found", id=message_id)
+                    return False
+                print(f"❌ Message not found: {message_id}")
+                return False
+            
+            if self.output_format != "text":
+                emit({"id": reply_id, "to": row[0], "subject": row[1], "priority": priority,
+                      "thread_id": row[2], "body_size": len((body or '').encode('utf-8'))},
+                     self.output_format)
+                return True
+            
+            priority_emoji = {"normal": "📧", "high": "⚡", "urgent": "🚨"}
+            print(f"{priority_emoji.get(priority, '📧')} Reply sent to {row[0]} via HAL-db")
+            print(f"   Subject: {row[1]}")
+            print(f"   ID: {reply_id[:8]}...")
+            print(f"   Thread: {str(row[2])[:8]}...")
+            return True
+            
+        except psycopg2.Error as e:
+            print(f"❌ Error sending reply: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    @METRICS.timed("thread")
+    def show_thread(self, message_id):
+        """Show the whole conversation containing a message"""
+        conn = self._get_connection("read_dsn")
         try:
             cur = conn.cursor(cursor_factory=RealDictCursor)
             
-            # Build query
-            query = """
-                SELECT id, from_system, subject, priority, created_at, is_read
-                FROM labmailmessages 
-                WHERE to_system = %s
-            """
-            params = [self.hostname]
+            # Resolve the thread from any message in it and fetch the whole
+            # conversation through idx_labmail_thread in a single query. Clients
+            # older than schema 3 still insert rows without thread_id; such a
+            # row is the root of its own thread, found through the primary key.
+            cur.execute("""
+                WITH root AS (
+                    SELECT COALESCE(thread_id, id) AS thread_id FROM labmailmessages
+                    WHERE (to_system = %s OR from_system = %s) AND CAST(id AS TEXT) LIKE %s
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                )
+                SELECT m.id, m.from_system, m.to_system, m.subject, m.body, m.body_gz, m.body_blob, m.body_size,
+                       m.priority, m.created_at, m.is_read, m.read_at, m.in_reply_to,
+                       COALESCE(m.thread_id, m.id) AS thread_id
+                FROM labmailmessages m, root
+                WHERE (m.thread_id = root.thread_id OR (m.thread_id IS NULL AND m.id = root.thread_id))
+                AND (m.to_system = %s OR m.from_system = %s)
+                ORDER BY m.created_at
+            """, (self.hostname, self.hostname, f"{message_id}%", self.hostname, self.hostname))
+            
+            messages = cur.fetchall()
+            
+            if self.output_format != "text":
+                if not messages:
+                    emit_error("Thread not found", id=message_id)
+                else:
+                    emit_stream((self._record(msg, conn, with_body=True) for msg in messages), self.output_format)
+                return
+            
+            if not messages:
+                print(f"❌ Thread not found: {message_id}")
+                return
             
-            if unread_only:
-                query += " AND is_read = FALSE"
+            print(f"🧵 Thread [{str(messages[0]['thread_id'])[:8]}] - {len(messages)} message(s)")
+            print("=" * 50)
             
+            for msg in messages:
+                priority = {"high": "⚡", "urgent": "🚨"}.get(msg['priority'], "")
+                timestamp = msg['created_at'].strftime('%Y-%m-%d %H:%M')
+                reply_to = f" ↳ [{str(msg['in_reply_to'])[:8]}]" if msg['in_reply_to'] else ""
+                
+                print(f"📨 {priority} [{str(msg['id'])[:8]}] {msg['from_system']} → {msg['to_system']}{reply_to}")
+                print(f"    📅 {timestamp}")
+                print(f"    📋 {msg['subject']}")
+                print()
+                self._write_body(conn, msg)
+                print("-" * 30)
+                
+        except psycopg2.Error as e:
+            print(f"❌ Error reading thread: {e}")
+        finally:
+            conn.close()
+    
+    @METRICS.timed("list")
+    def list_messages(self, unread_only=False, from_sender=None, with_body=False):
+        """List messages in inbox from HAL-db"""
+        conn = self._get_connection("read_dsn")
+        try:
+            params = [self.hostname]
             if from_sender:
-                query += " AND from_system = %s"
                 params.append(from_sender.split('.')[0])
+            if not unread_only:
+                params *= 2  # Once for the unread branch, once for the read one
             
-            query += " ORDER BY created_at DESC"
+            if self.output_format != "text":
+                # Server-side cursor: rows arrive in batches and are written as they come
+                cur = conn.cursor(name="labmail_list", cursor_factory=RealDictCursor)
+                cur.itersize = 500
+                cur.execute(list_query(unread_only, bool(from_sender), with_body), params)
+                emit_stream((self._record(row, conn, with_body) for row in cur), self.output_format)
+                return
             
-            cur.execute(query, params)
-            messages = cur.fetchall()
+            cur = conn.cursor()
+            self._execute(cur, f"labmail_list{'_unread' * unread_only}{'_from' * bool(from_sender)}", params)
+            messages = [MessageHeader._make(row) for row in cur]
             
             if not messages:
                 filter_desc = []
@@ -164,14 +928,14 @@ class LabMailDB:
             print()
             
             for msg in messages:
-                status = "📭" if msg['is_read'] else "📬"
-                priority = {"high": "⚡", "urgent": "🚨"}.get(msg['priority'], "")
+                status = "📭" if msg.is_read else "📬"
+                priority = {"high": "⚡", "urgent": "🚨"}.get(msg.priority, "")
                 
-                timestamp = msg['created_at'].strftime('%Y-%m-%d %H:%M')
+                timestamp = msg.created_at.strftime('%Y-%m-%d %H:%M')
                 
-                print(f"{status} {priority} [{str(msg['id'])[:8]}] From: {msg['from_system']}")
+                print(f"{status} {priority} [{str(msg.id)[:8]}] From: {msg.from_system}")
                 print(f"    📅 {timestamp}")
-                print(f"    📋 {msg['subject']}")
+                print(f"    📋 {msg.subject}")
                 print()
                 
         except psycopg2.Error as e:
@@ -179,38 +943,35 @@ class LabMailDB:
         finally:
             conn.close()
     
+    @METRICS.timed("read")
     def read_message(self, message_id=None, unread_only=False):
         """Read a specific message or show unread messages"""
         if message_id:
-            # Read specific message
-            conn = self._get_connection()
+            # Read specific message; the lookup and body may come from a replica
+            conn = self._get_connection("read_dsn")
             try:
                 cur = conn.cursor(cursor_factory=RealDictCursor)
                 
                 # Find message by partial ID
-                cur.execute("""
-                    SELECT * FROM labmailmessages 
-                    WHERE to_system = %s AND CAST(id AS TEXT) LIKE %s
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """, (self.hostname, f"{message_id}%"))
+                self._execute(cur, "labmail_lookup", (self.hostname, f"{message_id}%"))
                 
                 message = cur.fetchone()
                 
                 if not message:
+                    if self.output_format != "text":
+                        emit_error("Message not found", id=message_id)
+                        return
                     print(f"❌ Message not found: {message_id}")
                     return
                 
-                self._display_message(dict(message))
+                if self.output_format != "text":
+                    emit(self._record(message, conn, with_body=True), self.output_format)
+                else:
+                    self._display_message(dict(message), conn)
                 
                 # Mark as read
-                cur.execute("""
-                    UPDATE labmailmessages 
-                    SET is_read = TRUE, read_at = NOW()
-                    WHERE id = %s
-                """, (message['id'],))
-                
-                conn.commit()
+                if not message['is_read']:
+                    self._mark_ids_read([message['id']], conn)
                 
             except psycopg2.Error as e:
                 print(f"❌ Error reading message: {e}")
@@ -220,7 +981,404 @@ class LabMailDB:
             # Show unread messages
             self.list_messages(unread_only=True)
     
-    def _display_message(self, message):
+    @METRICS.timed("read")
+    def read_messages(self, ids=None, all_unread=False):
+        """Read several messages: bodies stream back from one query, one UPDATE marks them read"""
+        columns = """m.id, m.from_system, m.to_system, m.subject, m.body, m.body_gz, m.body_blob,
+                     m.body_size, m.priority, m.created_at, m.read_at, m.is_read,
+                     m.thread_id, m.in_reply_to"""
+        
+        if ids:
+            # Each partial ID resolves to its newest match, as with a single read
+            query = f"""
+                SELECT * FROM (
+                    SELECT DISTINCT ON (p.prefix) p.prefix, {columns}
+                    FROM unnest(%s::text[]) AS p(prefix)
+                    JOIN labmailmessages m ON CAST(m.id AS TEXT) LIKE p.prefix || '%%'
+                    WHERE m.to_system = %s
+                    ORDER BY p.prefix, m.created_at DESC
+                ) matched
+                ORDER BY created_at
+            """
+            params = (ids, self.hostname)
+        else:
+            query = f"""
+                SELECT {columns}
+                FROM labmailmessages m
+                WHERE m.to_system = %s AND m.is_read = FALSE
+                  AND (m.claimed_until IS NULL OR m.claimed_until < NOW())
+                ORDER BY m.priority_rank, m.created_at
+            """
+            params = (self.hostname,)
+        
+        conn = self._get_connection("read_dsn")
+        try:
+            # Server-side cursor: each message is shown as it arrives
+            cur = conn.cursor(name="labmail_read", cursor_factory=RealDictCursor)
+            cur.itersize = 100
+            cur.execute(query, params)
+            
+            found = set()
+            message_ids = {}
+            
+            def messages():
+                for row in cur:
+                    found.add(row.get('prefix'))
+                    if row['id'] not in message_ids:
+                        message_ids[row['id']] = True
+                        yield row
+            
+            if self.output_format != "text":
+                emit_stream((self._record(row, conn, with_body=True) for row in messages()), self.output_format)
+            else:
+                for message in messages():
+                    self._display_message(dict(message), conn)
+            cur.close()
+            
+            for prefix in ids or ():
+                if prefix not in found:
+                    if self.output_format != "text":
+                        emit_error("Message not found", id=prefix)
+                    else:
+                        print(f"❌ Message not found: {prefix}")
+            
+            if not message_ids:
+                if not ids and self.output_format == "text":
+                    print("📬 No unread messages")
+                return
+            
+            marked = self._mark_ids_read(message_ids, conn)
+            if self.output_format == "text":
+                print(f"📭 Marked {marked} message(s) read")
+            
+        except psycopg2.Error as e:
+            print(f"❌ Error reading messages: {e}")
+        finally:
+            conn.close()
+    
+    def _mark_ids_read(self, message_ids, conn):
+        """Mark messages read on the primary, reusing conn when it is the primary; returns how many were unread"""
+        primary = conn if not self.profile["read_dsn"] else self._get_connection()
+        try:
+            cur = primary.cursor()
+            self._execute(cur, "labmail_mark_read", ([str(message_id) for message_id in message_ids],))
+            primary.commit()
+            return cur.rowcount
+        finally:
+            if primary is not conn:
+                primary.close()
+    
+    @METRICS.timed("mark-read")
+    def mark_read(self, from_sender=None, before=None):
+        """Mark unread messages read in one set-based UPDATE, optionally by sender and age"""
+        conditions = ["to_system = %s", "is_read = FALSE"]
+        params = [self.hostname]
+        
+        if from_sender:
+            conditions.append("from_system = %s")
+            params.append(from_sender.split('.')[0])
+        
+        if before:
+            conditions.append("created_at < %s")
+            params.append(before)
+        
+        conn = self._get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE labmailmessages
+                SET is_read = TRUE, read_at = NOW()
+                WHERE {' AND '.join(conditions)}
+            """, params)
+            conn.commit()
+            
+            if self.output_format != "text":
+                emit({"marked": cur.rowcount}, self.output_format)
+            else:
+                print(f"📭 Marked {cur.rowcount} message(s) read")
+            
+        except psycopg2.Error as e:
+            print(f"❌ Error marking messages read: {e}")
+        finally:
+            conn.close()
+    
+    @METRICS.timed("claim")
+    def claim_messages(self, count=1, visibility=300, worker=None):
+        """Atomically hand out the oldest unread, unclaimed messages to one worker
+
+        Candidate rows are locked with FOR UPDATE SKIP LOCKED inside a single
+        UPDATE ... RETURNING, so concurrent claimers never wait on each other
+        or receive the same message. A claim lasts `visibility` seconds; a
+        message that is not acked by then can be claimed again.
+        """
+        token = str(uuid.uuid4())
+        worker = worker or f"{self.hostname}:{os.getpid()}"
+        
+        conn = self._get_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                UPDATE labmailmessages m
+                SET claim_token = %s,
+                    claimed_by = %s,
+                    claimed_until = NOW() + make_interval(secs => %s),
+                    delivery_count = m.delivery_count + 1
+                FROM (
+                    SELECT id FROM labmailmessages
+                    WHERE to_system = %s AND is_read = FALSE
+                      AND (claimed_until IS NULL OR claimed_until < NOW())
+                    ORDER BY priority_rank, created_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ) next
+                WHERE m.id = next.id
+                RETURNING m.id, m.from_system, m.to_system, m.subject, m.body, m.body_gz, m.body_blob,
+                          m.body_size, m.priority, m.created_at, m.read_at, m.is_read, m.thread_id,
+                          m.in_reply_to, m.claim_token, m.claimed_until, m.delivery_count, m.priority_rank
+            """, (token, worker, visibility, self.hostname, count))
+            messages = sorted(cur.fetchall(), key=lambda m: (m['priority_rank'], m['created_at']))
+            conn.commit()
+            
+            if self.output_format != "text":
+                emit_stream((self._record(m, conn, with_body=True) for m in messages), self.output_format)
+                return
+            
+            if not messages:
+                print("📭 No messages to claim")
+                return
+            
+            print(f"🔒 Claimed {len(messages)} message(s) until "
+                  f"{messages[0]['claimed_until'].strftime('%H:%M:%S')} (token {token})")
+            print()
+            for message in messages:
+                self._display_message(dict(message), conn)
+                if message['delivery_count'] > 1:
+                    print(f"🔁 Delivery {message['delivery_count']} (previous claim expired or was released)")
+            print(f"✅ When done: labmail ack {' '.join(str(m['id'])[:8] for m in messages)} --token {token}")
+            
+        except psycopg2.Error as e:
+            print(f"❌ Error claiming messages: {e}")
+        finally:
+            conn.close()
+    
+    @METRICS.timed("next")
+    def next_message(self, peek=False):
+        """Show the highest-priority unread message and mark it read
+
+        The pick is one descent of idx_labmail_priority. Messages held by a
+        claim are skipped, and without --peek the pick and the mark-read are a
+        single UPDATE, so two sessions never get the same message.
+        """
+        conn = self._get_connection()
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            pick = """
+                SELECT id FROM labmailmessages
+                WHERE to_system = %s AND is_read = FALSE
+                  AND (claimed_until IS NULL OR claimed_until < NOW())
+                ORDER BY priority_rank, created_at
+                LIMIT 1
+            """
+            columns = """m.id, m.from_system, m.to_system, m.subject, m.body, m.body_gz, m.body_blob,
+                         m.body_size, m.priority, m.created_at, m.read_at, m.is_read, m.thread_id, m.in_reply_to"""
+            
+            if peek:
+                cur.execute(f"SELECT {columns} FROM labmailmessages m WHERE m.id = ({pick})", (self.hostname,))
+            else:
+                cur.execute(f"""
+                    UPDATE labmailmessages m
+                    SET is_read = TRUE, read_at = NOW()
+                    WHERE m.id = ({pick} FOR UPDATE SKIP LOCKED)
+                    RETURNING {columns}
+                """, (self.hostname,))
+            message = cur.fetchone()
+            conn.commit()
+            
+            if self.output_format != "text":
+                if message:
+                    emit(self._record(message, conn, with_body=True), self.output_format)
+                else:
+                    emit_error("No unread messages")
+                return
+            
+            if not message:
+                print("📬 No unread messages")
+                return
+            
+            self._display_message(dict(message), conn)
+            
+        except psycopg2.Error as e:
+            print(f"❌ Error fetching next message: {e}")
+        finally:
+            conn.close()
+    
+    def watch_urgent(self, timeout=None):
+        """Block on LISTEN and report urgent messages the moment they are committed"""
+        if self.profile["pooled"] and not self.profile["listen_dsn"]:
+            # Transaction pooling hands each statement a different server, so LISTEN would be lost
+            print(f"❌ watch needs a direct connection: set listen_dsn in profile '{self.profile['name']}'")
+            return
+        conn = self._get_connection("listen_dsn")
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(f"labmail_{self.hostname}")))
+            
+            if self.output_format == "text":
+                print(f"👂 Watching for urgent messages to {self.hostname} (Ctrl+C to stop)")
+            
+            while True:
+                if select.select([conn], [], [], timeout) == ([], [], []):
+                    return  # Timed out with nothing new
+                conn.poll()
+                while conn.notifies:
+                    event = json.loads(conn.notifies.pop(0).payload)
+                    if self.output_format != "text":
+                        print(json.dumps(event), flush=True)
+                    else:
+                        print(f"🚨 [{event['id'][:8]}] From: {event['from']}")
+                        print(f"    📋 {event['subject']}")
+                        sys.stdout.flush()
+                    
+        except KeyboardInterrupt:
+            pass
+        except psycopg2.Error as e:
+            print(f"❌ Watch error: {e}")
+        finally:
+            conn.close()
+    
+    @METRICS.timed("settle")
+    def settle_messages(self, ids, ack=True, token=None, delay=0):
+        """Ack (mark read) or nack (release) claimed messages in one UPDATE
+
+        With a token only messages still held under that claim are settled, so
+        a worker whose claim expired cannot ack a message someone else now holds.
+        A nack with a delay keeps the message hidden for that many seconds.
+        """
+        verb = "acked" if ack else "released"
+        if ack:
+            assignments = "is_read = TRUE, read_at = NOW(), claimed_until = NULL"
+            params = []
+        else:
+            assignments = "claimed_until = CASE WHEN %s > 0 THEN NOW() + make_interval(secs => %s) END"
+            params = [delay, delay]
+        
+        conditions = ["to_system = %s", "is_read = FALSE", "CAST(id AS TEXT) LIKE ANY(%s)"]
+        params += [self.hostname, [f"{i}%" for i in ids]]
+        if token:
+            conditions.append("claim_token = %s")
+            params.append(token)
+        elif not ack:
+            conditions.append("claim_token IS NOT NULL")
+        
+        conn = self._get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE labmailmessages
+                SET {assignments}, claim_token = NULL, claimed_by = NULL
+                WHERE {' AND '.join(conditions)}
+                RETURNING CAST(id AS TEXT)
+            """, params)
+            done = [row[0] for row in cur.fetchall()]
+            conn.commit()
+            
+            missed = [i for i in ids if not any(d.startswith(i) for d in done)]
+            if self.output_format != "text":
+                emit({verb: done, "missed": missed}, self.output_format)
+                return
+            
+            for prefix in missed:
+                print(f"⚠️  Not {verb}: {prefix} (not claimed with this token, or already done)")
+            if ack:
+                print(f"✅ Acked {len(done)} message(s)")
+            else:
+                print(f"↩️  Released {len(done)} message(s)")
+            
+        except psycopg2.Error as e:
+            print(f"❌ Error settling messages: {e}")
+        finally:
+            conn.close()
+    
+    @METRICS.timed("search")
+    def search_messages(self, query, from_sender=None, since=None, limit=20, page=1):
+        """Full-text search over messages sent to or from this system"""
+        conn = self._get_connection("read_dsn")
+        try:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            
+            conditions = ["m.search_vector @@ q", "(m.to_system = %s OR m.from_system = %s)"]
+            params = [query, self.hostname, self.hostname]
+            
+            if from_sender:
+                conditions.append("m.from_system = %s")
+                params.append(from_sender.split('.')[0])
+            
+            if since:
+                conditions.append("m.created_at >= %s")
+                params.append(since)
+            
+            params.extend([limit, (page - 1) * limit])
+            
+            # Rank and page inside the GIN-backed subquery; only the rows on
+            # this page pay for ts_headline
+            cur.execute(f"""
+                SELECT id, from_system, to_system, priority, created_at, is_read, thread_id, body_size, rank, total,
+                       ts_headline('english', subject, q, 'HighlightAll=TRUE, StartSel=**, StopSel=**') AS subject,
+                       ts_headline('english', COALESCE(body, ''), q,
+                                   'MaxFragments=2, MaxWords=20, MinWords=8, StartSel=**, StopSel=**') AS snippet
+                FROM (
+                    SELECT m.id, m.from_system, m.to_system, m.subject, m.body, m.body_size,
+                           m.priority, m.created_at, m.is_read, m.thread_id, q,
+                           ts_rank_cd(m.search_vector, q) AS rank,
+                           COUNT(*) OVER () AS total
+                    FROM labmailmessages m, websearch_to_tsquery('english', %s) AS q
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY rank DESC, m.created_at DESC
+                    LIMIT %s OFFSET %s
+                ) hits
+                ORDER BY rank DESC, created_at DESC
+            """, params)
+            
+            results = cur.fetchall()
+            
+            if self.output_format != "text":
+                emit_stream(({**self._record(msg), "rank": msg['rank'], "snippet": msg['snippet'],
+                              "total": msg['total']} for msg in results), self.output_format)
+                return
+            
+            if not results:
+                print(f"🔍 No messages matching '{query}'" + (f" on page {page}" if page > 1 else ""))
+                return
+            
+            total = results[0]['total']
+            pages = (total + limit - 1) // limit
+            print(f"🔍 {total} message(s) matching '{query}' (page {page} of {pages}):")
+            print()
+            
+            for msg in results:
+                status = "📭" if msg['is_read'] else "📬"
+                priority = {"high": "⚡", "urgent": "🚨"}.get(msg['priority'], "")
+                timestamp = msg['created_at'].strftime('%Y-%m-%d %H:%M')
+                
+                print(f"{status} {priority} [{str(msg['id'])[:8]}] {msg['from_system']} → {msg['to_system']}")
+                print(f"    📅 {timestamp}")
+                print(f"    📋 {msg['subject']}")
+                if msg['snippet']:
+                    print(f"    🔎 {' '.join(msg['snippet'].split())}")
+                elif msg['body_size']:
+                    print(f"    📦 {msg['body_size'] / 1024:.1f} KB compressed body (read to view)")
+                print()
+            
+            if page < pages:
+                print(f"More results: labmail search '{query}' --page {page + 1}")
+                
+        except psycopg2.Error as e:
+            print(f"❌ Error searching messages: {e}")
+        finally:
+            conn.close()
+    
+    def _display_message(self, message, conn):
         """Display a message in detail"""
         priority_emoji = {"normal": "📧", "high": "⚡", "urgent": "🚨"}
         timestamp = message['created_at'].strftime('%Y-%m-%d %H:%M:%S')
@@ -231,43 +1389,47 @@ class LabMailDB:
         print(f"📅 Date: {timestamp}")
         print(f"🆔 ID: {message['id']}")
         print(f"📋 Subject: {message['subject']}")
+        if message['body_size']:
+            print(f"📦 Size: {message['body_size'] / 1024:.1f} KB")
         print()
         print("📝 Message:")
         print("-" * 30)
-        print(message['body'] or 'No content')
+        self._write_body(conn, message)
         print("-" * 30)
         print()
     
+    @METRICS.timed("status")
     def get_status(self):
         """Show LabMail system status"""
-        print(f"🤖 LabMail Status - {self.hostname}")
-        print("=" * 40)
-        
-        conn = self._get_connection()
+        conn = self._get_connection("read_dsn")
         try:
             cur = conn.cursor()
             
             # Count messages
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total,
-                    COUNT(*) FILTER (WHERE is_read = FALSE) as unread
-                FROM labmailmessages 
-                WHERE to_system = %s
-            """, (self.hostname,))
+            self._execute(cur, "labmail_count_inbox", (self.hostname,))
             
             counts = cur.fetchone()
             total_messages = counts[0] if counts else 0
             unread_messages = counts[1] if counts else 0
             
+            cur.execute("SELECT version()")
+            db_version = cur.fetchone()[0].split(' ')[0:2]
+            server = f"{conn.info.host}:{conn.info.port}/{conn.info.dbname}"  # The replica, if one answered
+            
+            if self.output_format != "text":
+                emit({"hostname": self.hostname, "total": total_messages, "unread": unread_messages,
+                      "database": server, "database_version": ' '.join(db_version),
+                      "members": self.collective_members}, self.output_format)
+                return
+            
+            print(f"🤖 LabMail Status - {self.hostname}")
+            print("=" * 40)
+            
             print(f"📬 Total messages: {total_messages}")
             print(f"📭 Unread messages: {unread_messages}")
             print(f"🏠 Hostname: {self.hostname}")
-            print(f"🗄️ Database: HAL-db PostgreSQL ({self.db_config['host']})")
+            print(f"🗄️ Database: HAL-db PostgreSQL ({server})")
             
-            # Test database connection
-            cur.execute("SELECT version()")
-            db_version = cur.fetchone()[0].split(' ')[0:2]
             print(f"💾 Database: {' '.join(db_version)}")
             
             print()
@@ -280,58 +1442,54 @@ class LabMailDB:
         finally:
             conn.close()
     
+    def _stats_record(self, cur):
+        """Collect system-wide message counts for JSON output in one pass over the table"""
+        cur.execute("""
+            SELECT from_system, to_system,
+                   COUNT(*) AS total,
+                   COUNT(*) FILTER (WHERE is_read = FALSE) AS unread
+            FROM labmailmessages
+            GROUP BY from_system, to_system
+        """)
+        
+        record = {"total": 0, "sent": {}, "received": {}, "unread": {}}
+        for from_system, to_system, total, unread in cur.fetchall():
+            record["total"] += total
+            record["sent"][from_system] = record["sent"].get(from_system, 0) + total
+            record["received"][to_system] = record["received"].get(to_system, 0) + total
+            if unread:
+                record["unread"][to_system] = record["unread"].get(to_system, 0) + unread
+        return record
+    
+    @METRICS.timed("stats")
     def get_stats(self):
         """Show message statistics across AI collective"""
-        conn = self._get_connection()
+        conn = self._get_connection("read_dsn")
         try:
             cur = conn.cursor()
             
+            if self.output_format != "text":
+                emit(self._stats_record(cur), self.output_format)
+                return
+            
             print("📊 LabMail System Statistics")
             print("=" * 40)
             
-            # Total messages in system
-            cur.execute("SELECT COUNT(*) FROM labmailmessages")
-            total = cur.fetchone()[0]
-            print(f"📧 Total messages in system: {total}")
-            
-            # Messages by sender
-            cur.execute("""
-                SELECT from_system, COUNT(*) as count
-                FROM labmailmessages 
-                GROUP BY from_system 
-                ORDER BY count DESC
-            """)
+            record = self._stats_record(cur)
+            print(f"📧 Total messages in system: {record['total']}")
             
             print("\n📤 Messages sent by system:")
-            for row in cur.fetchall():
-                print(f"   🤖 {row[0]}: {row[1]} messages")
-            
-            # Messages by recipient
-            cur.execute("""
-                SELECT to_system, COUNT(*) as count
-                FROM labmailmessages 
-                GROUP BY to_system 
-                ORDER BY count DESC
-            """)
+            for system, count in sorted(record["sent"].items(), key=lambda item: -item[1]):
+                print(f"   🤖 {system}: {count} messages")
             
             print("\n📥 Messages received by system:")
-            for row in cur.fetchall():
-                print(f"   🤖 {row[0]}: {row[1]} messages")
+            for system, count in sorted(record["received"].items(), key=lambda item: -item[1]):
+                print(f"   🤖 {system}: {count} messages")
             
-            # Unread messages by system
-            cur.execute("""
-                SELECT to_system, COUNT(*) as unread
-                FROM labmailmessages 
-                WHERE is_read = FALSE
-                GROUP BY to_system 
-                ORDER BY unread DESC
-            """)
-            
-            unread_data = cur.fetchall()
-            if unread_data:
+            if record["unread"]:
                 print("\n📭 Unread messages by system:")
-                for row in unread_data:
-                    print(f"   📬 {row[0]}: {row[1]} unread")
+                for system, count in sorted(record["unread"].items(), key=lambda item: -item[1]):
+                    print(f"   📬 {system}: {count} unread")
             else:
                 print("\n✅ All messages read across AI collective!")
                 
@@ -340,8 +1498,71 @@ class LabMailDB:
         finally:
             conn.close()
 
+    
+    @METRICS.timed("overview")
+    def overview(self, watch=None, prometheus=None):
+        """Show every member's totals, unread count, oldest unread age and last activity
+        
+        One query covers the whole collective. With watch it is re-run every
+        watch seconds on the same connection, where it stays prepared.
+        prometheus is a file to replace atomically each time (for the
+        node_exporter textfile collector), or "-" for stdout.
+        """
+        conn = self._get_connection("read_dsn")
+        try:
+            while True:
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                self._execute(cur, "labmail_overview", (self.collective_members,))
+                rows = cur.fetchall()
+                conn.rollback()  # Release the snapshot so the next refresh sees new mail
+                
+                if prometheus == "-":
+                    sys.stdout.write(prometheus_text(rows))
+                    sys.stdout.flush()
+                elif prometheus:
+                    temp_path = f"{prometheus}.{os.getpid()}.tmp"
+                    with open(temp_path, "w") as f:
+                        f.write(prometheus_text(rows))
+                    os.replace(temp_path, prometheus)  # Scrapers never see a half-written file
+                elif self.output_format != "text":
+                    emit_stream(({**row, "last_activity": row["last_activity"] and row["last_activity"].isoformat()}
+                                 for row in rows), self.output_format)
+                    sys.stdout.flush()
+                else:
+                    self._show_overview(rows, refresh=bool(watch))
+                
+                if not watch:
+                    return
+                time.sleep(watch)
+                
+        except KeyboardInterrupt:
+            pass
+        except (psycopg2.Error, OSError) as e:
+            print(f"❌ Overview error: {e}")
+        finally:
+            conn.close()
+    
+    def _show_overview(self, rows, refresh=False):
+        """Print the overview table"""
+        if refresh and sys.stdout.isatty():
+            sys.stdout.write("\033[H\033[2J")  # Redraw in place
+        print(f"🌐 LabMail Collective Overview - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print("=" * 72)
+        print(f"   {'member':<14}{'received':>9}{'unread':>8}{'oldest unread':>15}{'sent':>7}{'last activity':>16}")
+        for row in rows:
+            status = "📬" if row["unread"] else "📭"
+            print(f"{status} {row['member']:<14}{row['received']:>9}{row['unread']:>8}"
+                  f"{format_age(row['oldest_unread_seconds']):>15}{row['sent']:>7}"
+                  f"{format_age(row['last_activity_seconds'], ' ago'):>16}")
+        sys.stdout.flush()
+
+
+# Commands that never write; with a replica configured the primary is not touched
+READ_ONLY_COMMANDS = {"list", "status", "stats", "overview", "search", "thread"}
+
 
 def main():
+    PROFILER.switch("startup")
     parser = argparse.ArgumentParser(
         description="LabMail - Digital Innovation Lab Messaging System (PostgreSQL)",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -355,11 +1576,23 @@ Examples:
   
   # List and read messages
   labmail list --unread
+  labmail list --unread --with-body --format ndjson
   labmail read abc123
+  labmail read --all-unread
+  labmail mark-read --from hal-db --before 2025-06-01
+  labmail next
+  labmail watch
+  labmail claim -n 5 --visibility 600 --format ndjson
+  labmail ack abc123 def456 --token <token from claim>
+  labmail reply abc123 "Done, certificate renewed"
+  labmail thread abc123
+  labmail search "ssl certificate" --since 2025-06-01
   
   # System information
   labmail status
   labmail stats
+  labmail overview --watch 10
+  labmail overview --prometheus /var/lib/node_exporter/labmail.prom
 
 Note: Interactive body input disabled for AI compatibility.
 Always provide body as command line argument if needed.
@@ -368,29 +1601,109 @@ Always provide body as command line argument if needed.
     
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
+    # Options shared by every command
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument('--format', choices=['text', 'json', 'ndjson'], default='text',
+                               help='Output format (default: text); json/ndjson stream one object per message')
+    output_parser.add_argument('--db-profile', metavar='NAME',
+                               help='Connection profile from /etc/labmail.conf or ~/.config/labmail.conf '
+                                    '(default: $LABMAIL_PROFILE or "default")')
+    output_parser.add_argument('--consistent', action='store_true',
+                               help='Replica reads first wait until the replica has every write committed '
+                                    'so far (read-your-writes)')
+    output_parser.add_argument('--profile', action='store_true',
+                               help='Print where the time went on stderr: import, connect, ensure-schema, '
+                                    'query, fetch, render')
+    output_parser.add_argument('--profile-out', metavar='FILE',
+                               help='With --profile (implied), also write cProfile stats to FILE for pstats')
+    
     # Send command
-    send_parser = subparsers.add_parser('send', help='Send a message')
+    send_parser = subparsers.add_parser('send', parents=[output_parser], help='Send a message')
     send_parser.add_argument('recipient', help='Recipient hostname (edgar-dev, skynet-prod, hal-db, coder)')
     send_parser.add_argument('subject', help='Message subject')
-    send_parser.add_argument('body', nargs='?', default='', help='Message body (optional)')
+    send_parser.add_argument('body', nargs='?', default='', help='Message body (optional, - reads stdin)')
     send_parser.add_argument('--priority', choices=['normal', 'high', 'urgent'], default='normal',
                            help='Message priority (default: normal)')
     
     # List command
-    list_parser = subparsers.add_parser('list', help='List messages')
+    list_parser = subparsers.add_parser('list', parents=[output_parser], help='List messages')
     list_parser.add_argument('--unread', action='store_true', help='Show only unread messages')
     list_parser.add_argument('--from', dest='from_sender', help='Show messages from specific sender')
+    list_parser.add_argument('--with-body', action='store_true', help='Include message bodies (json/ndjson only)')
     
     # Read command
-    read_parser = subparsers.add_parser('read', help='Read a message')
+    read_parser = subparsers.add_parser('read', parents=[output_parser], help='Read a message')
     read_parser.add_argument('message_id', nargs='?', help='Message ID to read (optional)')
     read_parser.add_argument('--unread', action='store_true', help='Show unread messages if no ID specified')
+    read_parser.add_argument('--all-unread', action='store_true', help='Read every unread message and mark them read')
+    read_parser.add_argument('--ids', help='Comma-separated message IDs to read together (partial IDs accepted)')
+    
+    # Mark-read command
+    mark_parser = subparsers.add_parser('mark-read', parents=[output_parser], help='Mark unread messages read without displaying them')
+    mark_parser.add_argument('--from', dest='from_sender', help='Only messages from specific sender')
+    mark_parser.add_argument('--before', help='Only messages older than this date (YYYY-MM-DD or ISO timestamp)')
+    
+    # Next command
+    next_parser = subparsers.add_parser('next', parents=[output_parser],
+                                        help='Read the highest-priority unread message (urgent first)')
+    next_parser.add_argument('--peek', action='store_true', help='Show it without marking it read')
+    
+    # Watch command
+    watch_parser = subparsers.add_parser('watch', parents=[output_parser],
+                                         help='Wait for urgent messages and report them as they arrive')
+    watch_parser.add_argument('--timeout', type=float, help='Stop after this many idle seconds')
+    
+    # Work-queue commands
+    claim_parser = subparsers.add_parser('claim', parents=[output_parser],
+                                         help='Atomically take the next unread messages for processing')
+    claim_parser.add_argument('-n', '--count', type=int, default=1, help='Messages to claim (default: 1)')
+    claim_parser.add_argument('--visibility', type=int, default=300,
+                              help='Seconds the claim lasts before the messages are handed out again (default: 300)')
+    claim_parser.add_argument('--worker', help='Worker name recorded on the claim (default: host:pid)')
+    
+    ack_parser = subparsers.add_parser('ack', parents=[output_parser], help='Finish claimed messages (marks them read)')
+    ack_parser.add_argument('ids', nargs='+', help='Message IDs (partial IDs accepted)')
+    ack_parser.add_argument('--token', help='Claim token; only messages still held under it are acked')
+    
+    nack_parser = subparsers.add_parser('nack', parents=[output_parser], help='Release claimed messages for another worker')
+    nack_parser.add_argument('ids', nargs='+', help='Message IDs (partial IDs accepted)')
+    nack_parser.add_argument('--token', help='Claim token; only messages still held under it are released')
+    nack_parser.add_argument('--delay', type=int, default=0, help='Keep the messages hidden this many seconds (default: 0)')
+    
+    # Reply command
+    reply_parser = subparsers.add_parser('reply', parents=[output_parser], help='Reply to a message (keeps the conversation threaded)')
+    reply_parser.add_argument('message_id', help='Message ID to reply to (partial ID accepted)')
+    reply_parser.add_argument('body', nargs='?', default='', help='Reply body (- reads stdin)')
+    reply_parser.add_argument('--subject', help='Reply subject (default: "Re: <original subject>")')
+    reply_parser.add_argument('--priority', choices=['normal', 'high', 'urgent'], default='normal',
+                            help='Message priority (default: normal)')
+    
+    # Thread command
+    thread_parser = subparsers.add_parser('thread', parents=[output_parser], help='Show the whole conversation containing a message')
+    thread_parser.add_argument('message_id', help='ID of any message in the thread (partial ID accepted)')
+    
+    # Search command
+    search_parser = subparsers.add_parser('search', parents=[output_parser], help='Full-text search message history')
+    search_parser.add_argument('query', help='Search terms ("quoted phrase", -exclude, OR supported)')
+    search_parser.add_argument('--from', dest='from_sender', help='Only messages from specific sender')
+    search_parser.add_argument('--since', help='Only messages on or after this date (YYYY-MM-DD or ISO timestamp)')
+    search_parser.add_argument('--limit', type=int, default=20, help='Results per page (default: 20)')
+    search_parser.add_argument('--page', type=int, default=1, help='Page number (default: 1)')
     
     # Status command
-    subparsers.add_parser('status', help='Show LabMail system status')
+    subparsers.add_parser('status', parents=[output_parser], help='Show LabMail system status')
     
     # Stats command  
-    subparsers.add_parser('stats', help='Show system-wide message statistics')
+    subparsers.add_parser('stats', parents=[output_parser], help='Show system-wide message statistics')
+    
+    # Overview command
+    overview_parser = subparsers.add_parser('overview', parents=[output_parser],
+                                            help='Per-member totals, unread, oldest unread and last activity')
+    overview_parser.add_argument('--watch', type=float, nargs='?', const=5.0, metavar='SECONDS',
+                                 help='Refresh every SECONDS until interrupted (default: 5)')
+    overview_parser.add_argument('--prometheus', nargs='?', const='-', metavar='FILE',
+                                 help='Prometheus text format, to stdout or atomically to FILE '
+                                      '(e.g. the node_exporter textfile directory)')
     
     args = parser.parse_args()
     
@@ -398,29 +1711,73 @@ Always provide body as command line argument if needed.
         parser.print_help()
         return
     
-    labmail = LabMailDB()
+    if args.profile or args.profile_out:
+        PROFILER.start(args.profile_out)
+    
+    labmail = LabMailDB(output_format=args.format, profile=args.db_profile,
+                        read_only=args.command in READ_ONLY_COMMANDS, consistent=args.consistent)
+    PROFILER.switch("render")
     
     if args.command == 'send':
         # No interactive mode for AI systems - use empty body if not provided
         if not args.body:
             args.body = ''
+        elif args.body == '-':
+            # Explicit stdin for payloads too large for the command line (logs, diffs)
+            args.body = sys.stdin.read()
         
         labmail.send_message(args.recipient, args.subject, args.body, args.priority)
     
     elif args.command == 'list':
-        labmail.list_messages(unread_only=args.unread, from_sender=args.from_sender)
+        labmail.list_messages(unread_only=args.unread, from_sender=args.from_sender, with_body=args.with_body)
     
     elif args.command == 'read':
-        if args.message_id:
+        if args.ids:
+            labmail.read_messages(ids=[i.strip() for i in args.ids.split(',') if i.strip()])
+        elif args.all_unread:
+            labmail.read_messages(all_unread=True)
+        elif args.message_id:
             labmail.read_message(args.message_id)
         else:
             labmail.read_message(unread_only=args.unread)
     
+    elif args.command == 'mark-read':
+        labmail.mark_read(from_sender=args.from_sender, before=args.before)
+    
+    elif args.command == 'next':
+        labmail.next_message(peek=args.peek)
+    
+    elif args.command == 'watch':
+        labmail.watch_urgent(timeout=args.timeout)
+    
+    elif args.command == 'claim':
+        labmail.claim_messages(count=max(args.count, 1), visibility=max(args.visibility, 1), worker=args.worker)
+    
+    elif args.command in ('ack', 'nack'):
+        labmail.settle_messages(args.ids, ack=args.command == 'ack', token=args.token,
+                                delay=max(getattr(args, 'delay', 0), 0))
+    
+    elif args.command == 'reply':
+        if args.body == '-':
+            args.body = sys.stdin.read()
+        
+        labmail.reply_message(args.message_id, args.body, subject=args.subject, priority=args.priority)
+    
+    elif args.command == 'thread':
+        labmail.show_thread(args.message_id)
+    
+    elif args.command == 'search':
+        labmail.search_messages(args.query, from_sender=args.from_sender, since=args.since,
+                                limit=max(args.limit, 1), page=max(args.page, 1))
+    
     elif args.command == 'status':
         labmail.get_status()
         
     elif args.command == 'stats':
         labmail.get_stats()
+    
+    elif args.command == 'overview':
+        labmail.overview(watch=args.watch and max(args.watch, 0.5), prometheus=args.prometheus)
 
 
 if __name__ == '__main__':
@@ -4,21 +4,143 @@ LabMail - Digital Innovation Lab Messaging System
 Interoffice messaging for AI collective coordination across Claude Code sessions
 """
 
+import time
+
+STARTED = time.perf_counter()  # --profile counts module imports from here
+
 import argparse
+import base64
+import fcntl
+import gzip
+import hashlib
 import json
+import math
 import os
+import re
 import socket
 import sys
 import uuid
-from datetime import datetime, timezone
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from toolkit_metrics import Metrics, Profiler
+
+try:
+    import orjson  # Optional: parses and writes message files and the index several times faster
+except ImportError:
+    orjson = None
+
+
+# Words too common to be worth indexing
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "of", "on", "or", "that", "the", "this", "to", "was", "with",
+}
+
+
+# What list needs from a message file; the body stays on disk
+MessageHeader = namedtuple("MessageHeader", (
+    "path", "id", "sender", "to", "subject", "priority", "timestamp", "read", "read_at",
+    "thread_id", "in_reply_to", "body_size", "claim_token", "claimed_until", "delivery_count",
+))
+
+
+# Message files that start with this hold a padded header line, then the body line
+HEADER_MAGIC = b'{"lm":2'
+
+
+def json_loads(data):
+    """Parse JSON from bytes or str with the fastest codec available"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def json_dumps(value):
+    """Serialize compact JSON to UTF-8 bytes with the fastest codec available"""
+    if orjson:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def tokenize(text):
+    """Split text into lowercase index terms"""
+    return [t for t in re.findall(r"[a-z0-9_]+", (text or "").lower())
+            if len(t) > 1 and t not in STOP_WORDS]
+
+
+def parse_since(value):
+    """Parse a --since date/timestamp; naive values are taken as UTC"""
+    since = datetime.fromisoformat(value)
+    return since if since.tzinfo else since.replace(tzinfo=timezone.utc)
+
+
+def emit(record, output_format):
+    """Print one JSON object: indented for json, a single line for ndjson"""
+    print(json.dumps(record, indent=2 if output_format == "json" else None))
+
+
+def emit_stream(records, output_format):
+    """Print records as they are produced: a line each for ndjson, or a JSON array written incrementally"""
+    count = 0
+    if output_format != "ndjson":
+        sys.stdout.write("[")
+    for record in records:
+        line = json.dumps(record)
+        if output_format == "ndjson":
+            print(line)
+        else:
+            sys.stdout.write(("," if count else "") + "\n  " + line)
+        count += 1
+    if output_format != "ndjson":
+        sys.stdout.write("\n]\n" if count else "]\n")
+    return count
+
+
+def emit_error(message, **fields):
+    """Report an error in JSON modes on stderr so stdout stays parseable"""
+    print(json.dumps({"error": message, **fields}), file=sys.stderr)
+
+
+# --profile phases, in report order. Message files read while the search index
+# is updated count as fetch, not query. Reads done by scan workers are reported
+# separately.
+PROFILER = Profiler(STARTED, ("import", "startup", "ensure-schema", "query", "fetch", "render"))
+
+
+# Instrumentation for node_exporter's textfile collector; histograms use Metrics.BUCKETS
+LABMAIL_METRICS = {
+    "labmail_operation_duration_seconds": ("histogram", "Time taken by a LabMail command's storage work"),
+    "labmail_rows_scanned_total": ("counter", "Message files opened and read"),
+    "labmail_bytes_written_total": ("counter", "Bytes written to message files and the blob store"),
+}
+METRICS = Metrics("labmail", LABMAIL_METRICS, duration="labmail_operation_duration_seconds")
+
 
 class LabMail:
-    def __init__(self):
+    SUBJECT_WEIGHT = 3  # A subject hit counts as much as three body hits
+    INDEX_VERSION = 4  # Bump when the index layout changes; old indexes are rebuilt
+    COMPRESS_THRESHOLD = 8 * 1024  # Bodies this size (bytes) or larger are gzipped
+    BLOB_THRESHOLD = 256 * 1024  # ...and these go to the blob store instead of the message file
+    STREAM_CHUNK = 64 * 1024  # Characters written per step when streaming a blob
+    PRIORITY_RANK = {"urgent": 0, "high": 1, "normal": 2}  # Delivery order for unread mail
+    HEADER_SLOT = 512  # Bytes reserved for a message file's header line; grows in steps of this
+    BODY_FIELDS = ("body", "body_gz")  # Kept after the header, so headers can be read alone
+    SCAN_WORKERS = 8  # Message files read concurrently when a folder on a network filesystem is scanned
+    WATCH_POLL_SECONDS = 0.5  # How often watch looks for urgent events
+    WATCH_HEARTBEAT = ".watching"  # Touched by a running watch; senders skip spools where it is stale
+    WATCH_STALE_SECONDS = 30
+    NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "fuse.sshfs", "ceph", "glusterfs")
+    
+    def __init__(self, output_format="text", scan_workers=None):
+        self.output_format = output_format  # text, json or ndjson
         self.base_dir = Path("/var/lib/labmail")
         self.inbox_dir = self.base_dir / "inbox"
         self.sent_dir = self.base_dir / "sent"
+        self.index_dir = self.base_dir / "index"
+        self.blob_dir = self.base_dir / "blobs"
+        self.notify_dir = self.base_dir / "notify"
         self.hostname = socket.gethostname()
         
         # Known AI collective members
@@ -29,13 +151,40 @@ class LabMail:
         ]
         
         self._ensure_directories()
+        self.scan_workers = scan_workers or self._default_scan_workers()
     
+    def _default_scan_workers(self):
+        """Read in parallel only when base_dir is on a network filesystem
+        
+        Local reads are served from the page cache faster than threads can
+        hand them off, so a thread pool there only adds overhead.
+        """
+        try:
+            target = os.path.realpath(self.base_dir)
+            fs_type, best = None, ""
+            with open("/proc/mounts") as mounts:
+                for line in mounts:
+                    fields = line.split()
+                    if len(fields) < 3:
+                        continue
+                    mount_point = fields[1].replace("\\040", " ")
+                    prefix = mount_point.rstrip("/") + "/"
+                    if (target == mount_point or target.startswith(prefix)) and len(mount_point) >= len(best):
+                        fs_type, best = fields[2], mount_point
+        except OSError:
+            return 1
+        return self.SCAN_WORKERS if fs_type in self.NETWORK_FILESYSTEMS else 1
+    
+    @PROFILER.timed("ensure-schema")
     def _ensure_directories(self):
         """Create necessary directories if they don't exist"""
         try:
             self.base_dir.mkdir(parents=True, exist_ok=True)
             self.inbox_dir.mkdir(exist_ok=True)
             self.sent_dir.mkdir(exist_ok=True)
+            self.index_dir.mkdir(exist_ok=True)
+            self.blob_dir.mkdir(exist_ok=True)
+            self.notify_dir.mkdir(exist_ok=True)
             
             # Create inbox directories for all collective members
             for member in self.collective_members:
@@ -49,18 +198,243 @@ class LabMail:
             print("Run: sudo mkdir -p /var/lib/labmail && sudo chown -R $USER:$USER /var/lib/labmail")
             sys.exit(1)
     
-    def _create_message(self, to, subject, body, priority="normal"):
+    def _create_message(self, to, subject, body, priority="normal", in_reply_to=None, thread_id=None):
         """Create a message object"""
-        return {
-            "id": str(uuid.uuid4()),
+        message_id = str(uuid.uuid4())
+        message = {
+            "id": message_id,
             "from": self.hostname,
             "to": to,
             "subject": subject,
             "body": body,
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "read": False,
-            "priority": priority
+            "priority": priority,
+            "in_reply_to": in_reply_to,
+            "thread_id": thread_id or message_id
+        }
+        message.update(self._pack_body(body))
+        return message
+    
+    def _blob_path(self, digest):
+        return self.blob_dir / digest[:2] / f"{digest}.gz"
+    
+    def _pack_body(self, body):
+        """Return the body fields to store for a message body
+
+        Small bodies stay inline. Larger ones are stored gzipped and base64
+        encoded in body_gz, and the largest go to the content-addressed blob
+        store so that list and status never have to read them.
+        """
+        raw = (body or '').encode('utf-8')
+        if len(raw) < self.COMPRESS_THRESHOLD:
+            return {}
+        
+        if len(raw) >= self.BLOB_THRESHOLD:
+            digest = hashlib.sha256(raw).hexdigest()
+            blob_path = self._blob_path(digest)
+            # The inbox and sent copies (and any resend) share one blob
+            if not blob_path.exists():
+                blob_path.parent.mkdir(exist_ok=True)
+                tmp_path = blob_path.with_suffix(f".{os.getpid()}.tmp")
+                packed = gzip.compress(raw)
+                with open(tmp_path, 'wb') as f:
+                    f.write(packed)
+                tmp_path.replace(blob_path)
+                METRICS.add("labmail_bytes_written_total", len(packed), operation=METRICS.operation)
+            return {"body": None, "body_blob": digest, "body_size": len(raw)}
+        
+        packed = gzip.compress(raw)
+        if len(packed) >= len(raw):
+            return {}  # Incompressible; keep it readable
+        return {"body": None, "body_gz": base64.b64encode(packed).decode('ascii'), "body_size": len(raw)}
+    
+    def _message_text(self, message):
+        """Return the full body text of a message, unpacking it if needed"""
+        if message.get('body_gz'):
+            return gzip.decompress(base64.b64decode(message['body_gz'])).decode('utf-8', errors='replace')
+        if message.get('body_blob'):
+            with gzip.open(self._blob_path(message['body_blob']), 'rt', encoding='utf-8', errors='replace') as f:
+                return f.read()
+        return message.get('body') or ''
+    
+    def _write_body(self, message):
+        """Print a message body, streaming blobs instead of loading them whole"""
+        if not message.get('body_blob'):
+            print(self._message_text(message) or 'No content')
+            return
+        
+        try:
+            with gzip.open(self._blob_path(message['body_blob']), 'rt', encoding='utf-8', errors='replace') as f:
+                while chunk := f.read(self.STREAM_CHUNK):
+                    sys.stdout.write(chunk)
+            print()
+        except OSError as e:
+            print(f"⚠️  Error reading body blob {message['body_blob']}: {e}")
+    
+    def _record(self, message, with_body=False):
+        """Convert a message to a dict for JSON output, with the same keys as the PostgreSQL backends"""
+        record = {
+            "id": message.get('id'),
+            "from": message.get('from'),
+            "to": message.get('to'),
+            "subject": message.get('subject'),
+            "priority": message.get('priority', 'normal'),
+            "created_at": message.get('timestamp'),
+            "is_read": message.get('read', False),
+            "read_at": message.get('read_at'),
+            "thread_id": message.get('thread_id') or message.get('id'),
+            "in_reply_to": message.get('in_reply_to'),
+            "body_size": message.get('body_size'),
         }
+        for key in ("claim_token", "claimed_until", "delivery_count"):
+            if key in message:
+                record[key] = message[key]
+        if with_body:
+            record["body"] = self._message_text(message)
+        return record
+    
+    def _header_line(self, message, size=None):
+        """Encode a message's header fields as one line padded to size bytes (None if it won't fit)"""
+        line = json_dumps({"lm": 2, **{k: v for k, v in message.items() if k not in self.BODY_FIELDS}})
+        size = size or -(-(len(line) + 1) // self.HEADER_SLOT) * self.HEADER_SLOT
+        return line.ljust(size - 1) + b'\n' if len(line) < size else None
+    
+    def _write_message(self, path, message):
+        """Write a message file: a fixed-size header line, then the body fields on the next line
+
+        The file is written aside and renamed into place, so readers never
+        see half a message.
+        """
+        path = Path(path)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(self._header_line(message))
+            f.write(json_dumps({k: message[k] for k in self.BODY_FIELDS if k in message}))
+            written = f.tell()
+        tmp_path.replace(path)
+        METRICS.add("labmail_bytes_written_total", written, operation=METRICS.operation)
+    
+    @PROFILER.timed("fetch")
+    def _read_message(self, path):
+        """Read a whole message file, in either the header layout or the older single-document one"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        METRICS.add("labmail_rows_scanned_total", operation=METRICS.operation)
+        if not data.startswith(HEADER_MAGIC):
+            return json_loads(data)
+        header_end = data.index(b'\n')
+        message = json_loads(data[:header_end])
+        message.update(json_loads(data[header_end + 1:]))
+        del message["lm"]
+        return message
+    
+    @PROFILER.timed("fetch")
+    def _read_header(self, path):
+        """Read only a message's header fields: normally the first HEADER_SLOT bytes of the file"""
+        # Unbuffered: a buffered open would pull in 8 KB to return 512 bytes
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            head = os.read(fd, self.HEADER_SLOT)
+            if not head.startswith(HEADER_MAGIC):
+                # Older layout: the body has to be read and parsed too
+                chunks = [head]
+                while chunks[-1]:
+                    chunks.append(os.read(fd, 65536))
+                return json_loads(b''.join(chunks))
+            while not head.endswith(b'\n'):
+                chunk = os.read(fd, self.HEADER_SLOT)  # A header that outgrew one slot spans several
+                if not chunk:
+                    break
+                head += chunk
+        finally:
+            os.close(fd)
+        METRICS.add("labmail_rows_scanned_total", operation=METRICS.operation)
+        header = json_loads(head)
+        del header["lm"]
+        return header
+    
+    def _update_header(self, path, message):
+        """Save changed header fields (read flag, claims) by overwriting just the header slot
+
+        The body is left untouched unless the header no longer fits its slot
+        or the file is in the older layout, in which case it is rewritten.
+        """
+        with open(path, 'r+b') as f:
+            head = f.read(self.HEADER_SLOT)
+            if head.startswith(HEADER_MAGIC):
+                if not head.endswith(b'\n'):
+                    head += f.readline()
+                line = self._header_line(message, len(head))
+                if line:
+                    f.seek(0)
+                    f.write(line)
+                    METRICS.add("labmail_bytes_written_total", len(line), operation=METRICS.operation)
+                    return
+        if not any(k in message for k in self.BODY_FIELDS):
+            message = {**self._read_message(path), **message}  # Only the header was loaded
+        self._write_message(path, message)
+    
+    def _scan(self, paths, load):
+        """Yield (path, load(path)) for each file, with up to scan_workers reads in flight
+
+        On NFS every open and read waits on a round trip, so overlapping them
+        matters far more than bandwidth. Results come back in path order; a
+        file that fails to load yields its exception instead.
+        """
+        def attempt(path):
+            try:
+                return path, load(path)
+            except Exception as e:
+                return path, e
+        
+        if PROFILER.enabled:
+            with PROFILER.phase("query"):
+                paths = list(paths)  # Time the directory listing apart from the reads
+        
+        if self.scan_workers <= 1:
+            yield from map(attempt, paths)
+            return
+        
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+            pending = deque()
+            for path in paths:
+                pending.append(executor.submit(attempt, path))
+                if len(pending) >= self.scan_workers * 4:  # Keep a bounded window, not one future per file
+                    with PROFILER.phase("fetch"):
+                        result = pending.popleft().result()
+                    yield result
+            while pending:
+                with PROFILER.phase("fetch"):
+                    result = pending.popleft().result()
+                yield result
+    
+    def _load_header(self, msg_file):
+        """Read a message file's header into a compact record; bodies are never loaded"""
+        message = self._read_header(msg_file)
+        return MessageHeader(
+            str(msg_file), message.get('id', msg_file.stem),
+            # Senders and priorities repeat across thousands of messages; share one string each
+            sys.intern(message.get('from', '')), sys.intern(message.get('to', '')),
+            message.get('subject', ''), sys.intern(message.get('priority', 'normal')),
+            message.get('timestamp', ''), message.get('read', False), message.get('read_at'),
+            message.get('thread_id') or message.get('id'), message.get('in_reply_to'),
+            message.get('body_size'), message.get('claim_token'), message.get('claimed_until'),
+            message.get('delivery_count'),
+        )
+    
+    def _header_record(self, header):
+        """JSON output for a header, with the same keys as _record"""
+        record = {
+            "id": header.id, "from": header.sender, "to": header.to, "subject": header.subject,
+            "priority": header.priority, "created_at": header.timestamp, "is_read": header.read,
+            "read_at": header.read_at, "thread_id": header.thread_id, "in_reply_to": header.in_reply_to,
+            "body_size": header.body_size,
+        }
+        for key in ("claim_token", "claimed_until", "delivery_count"):
+            if getattr(header, key) is not None:
+                record[key] = getattr(header, key)
+        return record
     
     def _save_message(self, message, is_sent=False):
         """Save message to appropriate directory"""
@@ -77,19 +451,50 @@ class LabMail:
             filepath = inbox_dir / filename
         
         try:
-            with open(filepath, 'w') as f:
-                json.dump(message, f, indent=2)
+            self._write_message(filepath, message)
             return True
         except Exception as e:
             print(f"❌ Error saving message: {e}")
             return False
     
+    def _notify_urgent(self, message):
+        """Tell a watching recipient about an urgent message straight away
+
+        Events are small files in the recipient's spool under the notify
+        directory, so they reach a watcher on another host over NFS. They are
+        only written while a watcher keeps the spool's heartbeat fresh; with
+        nobody watching the message simply waits in the inbox. Returns whether
+        a watcher was notified.
+        """
+        spool = self.notify_dir / message['to'].split('.')[0]
+        try:
+            if time.time() - (spool / self.WATCH_HEARTBEAT).stat().st_mtime > self.WATCH_STALE_SECONDS:
+                return False
+        except OSError:
+            return False
+        event = {"id": message['id'], "from": message['from'], "to": message['to'],
+                 "subject": (message.get('subject') or '')[:200], "priority": "urgent"}
+        name = f"{time.time_ns()}-{message['id']}.json"
+        try:
+            with open(spool / f".{name}", 'w') as f:
+                json.dump(event, f)
+            os.replace(spool / f".{name}", spool / name)  # The watcher never reads a half-written event
+        except OSError as e:
+            print(f"⚠️  Could not notify {message['to']}'s watcher: {e}", file=sys.stderr)
+            return False
+        return True
+    
+    @METRICS.timed("send")
     def send_message(self, recipient, subject, body, priority="normal"):
         """Send a message to a recipient"""
         # Clean recipient name
         recipient = recipient.split('.')[0]  # Remove domain if present
         
         if recipient not in [m.split('.')[0] for m in self.collective_members]:
+            if self.output_format != "text":
+                emit_error("Unknown recipient", recipient=recipient,
+                           available=sorted(set(m.split('.')[0] for m in self.collective_members)))
+                return False
             print(f"❌ Unknown recipient: {recipient}")
             print(f"Available recipients: {', '.join(set([m.split('.')[0] for m in self.collective_members]))}")
             return False
@@ -100,38 +505,74 @@ class LabMail:
         if self._save_message(message):
             # Save copy to sent folder
             self._save_message(message, is_sent=True)
+            notified = priority == "urgent" and self._notify_urgent(message)
+            
+            if self.output_format != "text":
+                record = {"id": message['id'], "to": recipient, "subject": subject, "priority": priority,
+                          "thread_id": message['thread_id'], "body_size": len((body or '').encode('utf-8'))}
+                if priority == "urgent":
+                    record["watcher_notified"] = notified
+                emit(record, self.output_format)
+                return True
             
             priority_emoji = {"normal": "📧", "high": "⚡", "urgent": "🚨"}
             print(f"{priority_emoji.get(priority, '📧')} Message sent to {recipient}")
             print(f"   Subject: {subject}")
             print(f"   ID: {message['id'][:8]}...")
+            if priority == "urgent":
+                print(f"👂 {recipient}'s watcher notified" if notified else f"💤 No watcher running for {recipient}")
             return True
         
         return False
     
-    def list_messages(self, unread_only=False, from_sender=None):
+    @METRICS.timed("list")
+    def list_messages(self, unread_only=False, from_sender=None, with_body=False):
         """List messages in inbox"""
         my_inbox = self.inbox_dir / self.hostname.split('.')[0]
         
         if not my_inbox.exists():
-            print("📬 No messages")
+            if self.output_format != "text":
+                emit_stream([], self.output_format)
+            else:
+                print("📬 No messages")
             return
         
+        # Headers only: a big inbox never has all its bodies in memory at once
         messages = []
-        for msg_file in my_inbox.glob("*.json"):
-            try:
-                with open(msg_file, 'r') as f:
-                    message = json.load(f)
-                    
-                if unread_only and message.get('read', False):
-                    continue
-                    
-                if from_sender and message.get('from', '').split('.')[0] != from_sender.split('.')[0]:
-                    continue
-                    
-                messages.append(message)
-            except Exception as e:
-                print(f"⚠️  Error reading message {msg_file}: {e}")
+        for msg_file, header in self._scan(my_inbox.glob("*.json"), self._load_header):
+            if isinstance(header, Exception):
+                print(f"⚠️  Error reading message {msg_file}: {header}", file=sys.stderr)
+                continue
+                
+            if unread_only and header.read:
+                continue
+                
+            if from_sender and header.sender.split('.')[0] != from_sender.split('.')[0]:
+                continue
+                
+            messages.append(header)
+        
+        # Unread first in delivery order (urgent before high before normal, oldest
+        # first within a level), then read mail newest first
+        unread = sorted((h for h in messages if not h.read),
+                        key=lambda x: (self.PRIORITY_RANK.get(x.priority, 2), x.timestamp))
+        read = sorted((h for h in messages if h.read), key=lambda x: x.timestamp, reverse=True)
+        messages = unread + read
+        
+        if self.output_format != "text":
+            def records():
+                for header in messages:
+                    if not with_body:
+                        yield self._header_record(header)
+                        continue
+                    # Bodies are read back one message at a time as they are written out
+                    try:
+                        yield self._record(self._read_message(header.path), with_body=True)
+                    except Exception as e:
+                        print(f"⚠️  Error reading message {header.path}: {e}", file=sys.stderr)
+            
+            emit_stream(records(), self.output_format)
+            return
         
         if not messages:
             filter_desc = []
@@ -144,23 +585,21 @@ class LabMail:
             print(f"📬 No {filter_text} messages" if filter_text else "📬 No messages")
             return
         
-        # Sort by timestamp (newest first)
-        messages.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
         print(f"📬 {len(messages)} message(s) in inbox:")
         print()
         
         for msg in messages:
-            status = "📭" if msg.get('read', False) else "📬"
-            priority = {"high": "⚡", "urgent": "🚨"}.get(msg.get('priority', 'normal'), "")
+            status = "📭" if msg.read else "📬"
+            priority = {"high": "⚡", "urgent": "🚨"}.get(msg.priority, "")
             
-            timestamp = datetime.fromisoformat(msg.get('timestamp', '')).strftime('%Y-%m-%d %H:%M')
+            timestamp = datetime.fromisoformat(msg.timestamp).strftime('%Y-%m-%d %H:%M')
             
-            print(f"{status} {priority} [{msg['id'][:8]}] From: {msg.get('from', 'Unknown')}")
+            print(f"{status} {priority} [{msg.id[:8]}] From: {msg.sender or 'Unknown'}")
             print(f"    📅 {timestamp}")
-            print(f"    📋 {msg.get('subject', 'No subject')}")
+            print(f"    📋 {msg.subject or 'No subject'}")
             print()
     
+    @METRICS.timed("read")
     def read_message(self, message_id=None, unread_only=False):
         """Read a specific message or show unread messages"""
         my_inbox = self.inbox_dir / self.hostname.split('.')[0]
@@ -170,28 +609,696 @@ class LabMail:
             return
         
         if message_id:
-            # Read specific message
-            for msg_file in my_inbox.glob("*.json"):
+            # Read specific message, found through the index instead of opening every file
+            index = self._update_index()
+            key = self._find_indexed(index, message_id)
+            if not key:
+                if self.output_format != "text":
+                    emit_error("Message not found", id=message_id)
+                else:
+                    print(f"❌ Message not found: {message_id}")
+                return
+            
+            try:
+                message = self._read_message(index["docs"][key]["path"])
+            except Exception as e:
+                print(f"⚠️  Error reading message {index['docs'][key]['path']}: {e}", file=sys.stderr)
+                return
+            
+            if self.output_format != "text":
+                emit(self._record(message, with_body=True), self.output_format)
+            else:
+                self._display_message(message)
+            self._mark_read_locked({key: message})
+        else:
+            # Show unread messages
+            self.list_messages(unread_only=True)
+    
+    def _mark_read(self, index, messages):
+        """Mark messages read, given as {index key: message or None}; saves the index once"""
+        marked = 0
+        for key, message in messages.items():
+            doc = index["docs"][key]
+            try:
+                if message is None:
+                    message = self._read_header(doc["path"])
+                if not message.get('read', False):
+                    message['read'] = True
+                    message['read_at'] = datetime.now(timezone.utc).isoformat()
+                    self._update_header(doc["path"], message)
+                    marked += 1
+                doc["read"] = True
+            except Exception as e:
+                print(f"⚠️  Error marking message {doc['path']} read: {e}")
+        
+        if messages:
+            self._save_index(index)
+        return marked
+    
+    def _delivery_order(self, docs, keys):
+        """Sort index keys urgent first, then high, then normal; oldest first within a level"""
+        return sorted(keys, key=lambda k: (self.PRIORITY_RANK.get(docs[k].get("priority"), 2), docs[k]["timestamp"]))
+    
+    @METRICS.timed("read")
+    def read_messages(self, ids=None, all_unread=False):
+        """Read several messages in one pass over the index and mark them read
+
+        The pass runs under the queue lock, as next and claim do for their
+        pick, so a message is never handed to both; other sessions wait for
+        the output to finish.
+        """
+        with self._queue_lock():
+            index = self._update_index()
+            docs = index["docs"]
+            
+            if ids:
+                keys = []
+                for prefix in ids:
+                    key = self._find_indexed(index, prefix)
+                    if key:
+                        keys.append(key)
+                    elif self.output_format != "text":
+                        emit_error("Message not found", id=prefix)
+                    else:
+                        print(f"❌ Message not found: {prefix}")
+            else:
+                keys = [key for key, doc in docs.items() if key.startswith("inbox/") and not doc["read"]]
+            
+            messages = {}
+            now = datetime.now(timezone.utc)
+            
+            def load():
+                # Files are opened one at a time as each message is shown
+                for key in (self._delivery_order(docs, set(keys)) if all_unread else
+                            sorted(set(keys), key=lambda k: docs[k]["timestamp"])):
+                    try:
+                        message = self._read_message(docs[key]["path"])
+                    except Exception as e:
+                        print(f"⚠️  Error reading message {docs[key]['path']}: {e}", file=sys.stderr)
+                        continue
+                    # The file decides: the index may lag a message another session took
+                    held_until = message.get('claimed_until')
+                    if all_unread and (message.get('read', False) or
+                                       (held_until and datetime.fromisoformat(held_until) > now)):
+                        continue
+                    messages[key] = message
+                    yield message
+            
+            if self.output_format != "text":
+                emit_stream((self._record(message, with_body=True) for message in load()), self.output_format)
+                self._mark_read(index, messages)
+                return
+            
+            for message in load():
+                self._display_message(message)
+            
+            if not messages:
+                if not ids:
+                    print("📬 No unread messages")
+                return
+            
+            print(f"📭 Marked {self._mark_read(index, messages)} message(s) read")
+    
+    def _mark_read_locked(self, messages):
+        """Mark messages read in a fresh copy of the index, under the queue lock
+
+        Saving an index loaded before a message was shown would overwrite read
+        flags that a concurrent next or ack saved in the meantime.
+        """
+        with self._queue_lock():
+            index = self._update_index()
+            return self._mark_read(index, {key: None for key in messages if key in index["docs"]})
+    
+    @METRICS.timed("mark-read")
+    def mark_read(self, from_sender=None, before=None):
+        """Mark unread messages read, optionally by sender and age, in one pass over the index"""
+        try:
+            before_dt = parse_since(before) if before else None
+        except ValueError:
+            if self.output_format != "text":
+                emit_error("Invalid date", before=before)
+            else:
+                print(f"❌ Invalid --before date: {before} (use YYYY-MM-DD or an ISO timestamp)")
+            return
+        sender = from_sender.split('.')[0] if from_sender else None
+        
+        with self._queue_lock():  # Pick and save against one index, not one a concurrent next has moved past
+            index = self._update_index()
+            matches = {}
+            for key, doc in index["docs"].items():
+                if not key.startswith("inbox/") or doc["read"]:
+                    continue
+                if sender and doc["from"].split('.')[0] != sender:
+                    continue
+                if before_dt and (not doc["timestamp"] or datetime.fromisoformat(doc["timestamp"]) >= before_dt):
+                    continue
+                matches[key] = None
+            
+            marked = self._mark_read(index, matches)
+        if self.output_format != "text":
+            emit({"marked": marked}, self.output_format)
+        else:
+            print(f"📭 Marked {marked} message(s) read")
+    
+    @contextmanager
+    def _queue_lock(self):
+        """Serialize claim/ack/nack and index saves that mark mail read, between processes on this host"""
+        with open(self.index_dir / f"{self.hostname.split('.')[0]}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+    
+    @METRICS.timed("claim")
+    def claim_messages(self, count=1, visibility=300, worker=None):
+        """Atomically hand out the next unread, unclaimed messages to one worker
+
+        Claims are taken under an exclusive lock, so concurrent workers on this
+        host never receive the same message. A claim lasts `visibility`
+        seconds; a message that is not acked by then can be claimed again.
+        """
+        token = str(uuid.uuid4())
+        worker = worker or f"{self.hostname.split('.')[0]}:{os.getpid()}"
+        now = datetime.now(timezone.utc)
+        until = (now + timedelta(seconds=visibility)).isoformat()
+        claimed = []
+        
+        with self._queue_lock():
+            index = self._update_index()
+            docs = index["docs"]
+            keys = self._delivery_order(docs, (key for key, doc in docs.items()
+                                               if key.startswith("inbox/") and not doc["read"]))
+            
+            for key in keys:
+                if len(claimed) >= count:
+                    break
                 try:
-                    with open(msg_file, 'r') as f:
-                        message = json.load(f)
+                    message = self._read_message(docs[key]["path"])
                     
-                    if message['id'].startswith(message_id):
-                        self._display_message(message)
-                        
-                        # Mark as read
-                        message['read'] = True
-                        with open(msg_file, 'w') as f:
-                            json.dump(message, f, indent=2)
-                        return
-                        
+                    held_until = message.get('claimed_until')
+                    if message.get('read', False) or (held_until and datetime.fromisoformat(held_until) > now):
+                        continue
+                    
+                    message['claim_token'] = token
+                    message['claimed_by'] = worker
+                    message['claimed_until'] = until
+                    message['delivery_count'] = message.get('delivery_count', 0) + 1
+                    self._update_header(docs[key]["path"], message)
+                    claimed.append(message)
                 except Exception as e:
-                    print(f"⚠️  Error reading message {msg_file}: {e}")
+                    print(f"⚠️  Error claiming message {docs[key]['path']}: {e}", file=sys.stderr)
+        
+        if self.output_format != "text":
+            emit_stream((self._record(m, with_body=True) for m in claimed), self.output_format)
+            return
+        
+        if not claimed:
+            print("📭 No messages to claim")
+            return
+        
+        print(f"🔒 Claimed {len(claimed)} message(s) until "
+              f"{datetime.fromisoformat(until).strftime('%H:%M:%S')} (token {token})")
+        print()
+        for message in claimed:
+            self._display_message(message)
+            if message['delivery_count'] > 1:
+                print(f"🔁 Delivery {message['delivery_count']} (previous claim expired or was released)")
+        print(f"✅ When done: labmail ack {' '.join(m['id'][:8] for m in claimed)} --token {token}")
+    
+    @METRICS.timed("next")
+    def next_message(self, peek=False):
+        """Show the highest-priority unread message and mark it read
+
+        The pick is made from the index alone; only the chosen message file is
+        opened (plus any that turn out to be held by a claim). It runs under
+        the queue lock so two sessions never get the same message.
+        """
+        now = datetime.now(timezone.utc)
+        message = None
+        
+        with self._queue_lock():
+            index = self._update_index()
+            docs = index["docs"]
+            keys = self._delivery_order(docs, (key for key, doc in docs.items()
+                                               if key.startswith("inbox/") and not doc["read"]))
             
-            print(f"❌ Message not found: {message_id}")
+            for key in keys:
+                try:
+                    candidate = self._read_message(docs[key]["path"])
+                except Exception as e:
+                    print(f"⚠️  Error reading message {docs[key]['path']}: {e}", file=sys.stderr)
+                    continue
+                held_until = candidate.get('claimed_until')
+                if candidate.get('read', False) or (held_until and datetime.fromisoformat(held_until) > now):
+                    continue
+                message = candidate
+                if not peek:
+                    self._mark_read(index, {key: message})
+                break
+        
+        if self.output_format != "text":
+            if message:
+                emit(self._record(message, with_body=True), self.output_format)
+            else:
+                emit_error("No unread messages")
+            return
+        
+        if not message:
+            print("📬 No unread messages")
+            return
+        
+        self._display_message(message)
+    
+    def watch_urgent(self, timeout=None):
+        """Poll this host's notify spool and report urgent messages as they are sent
+
+        The spool is a plain directory, so senders on any host sharing
+        /var/lib/labmail can reach it. Each poll refreshes the heartbeat that
+        tells senders someone is listening.
+        """
+        spool = self.notify_dir / self.hostname.split('.')[0]
+        heartbeat = spool / self.WATCH_HEARTBEAT
+        try:
+            spool.mkdir(exist_ok=True)
+            os.chmod(spool, 0o777)  # Senders run as other users on other hosts
+            for leftover in spool.glob("*.json"):
+                leftover.unlink(missing_ok=True)  # Sent while nobody was watching; the inbox has them
+            heartbeat.touch()
+        except OSError as e:
+            print(f"❌ Watch error: {e}")
+            return
+        
+        if self.output_format == "text":
+            print(f"👂 Watching for urgent messages to {self.hostname} (Ctrl+C to stop)")
+        
+        idle_since = time.monotonic()
+        beat = time.monotonic()
+        try:
+            while True:
+                for event_file in sorted(spool.glob("*.json")):
+                    try:
+                        with open(event_file) as f:
+                            event = json.load(f)
+                        event_file.unlink()
+                    except FileNotFoundError:
+                        continue  # Another watcher for this host took it
+                    except (OSError, ValueError):
+                        event_file.unlink(missing_ok=True)
+                        continue
+                    idle_since = time.monotonic()
+                    if self.output_format != "text":
+                        print(json.dumps(event), flush=True)
+                    else:
+                        print(f"🚨 [{event['id'][:8]}] From: {event['from']}")
+                        print(f"    📋 {event['subject']}")
+                        sys.stdout.flush()
+                
+                if timeout is not None and time.monotonic() - idle_since >= timeout:
+                    return  # Timed out with nothing new
+                if time.monotonic() - beat >= self.WATCH_STALE_SECONDS / 3:
+                    heartbeat.touch()
+                    beat = time.monotonic()
+                time.sleep(self.WATCH_POLL_SECONDS)
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            print(f"❌ Watch error: {e}")
+        finally:
+            heartbeat.unlink(missing_ok=True)
+    
+    @METRICS.timed("settle")
+    def settle_messages(self, ids, ack=True, token=None, delay=0):
+        """Ack (mark read) or nack (release) claimed messages
+
+        With a token only messages still held under that claim are settled, so
+        a worker whose claim expired cannot ack a message someone else now holds.
+        A nack with a delay keeps the message hidden for that many seconds.
+        """
+        verb = "acked" if ack else "released"
+        done = []
+        missed = []
+        
+        with self._queue_lock():
+            index = self._update_index()
+            acked = {}
+            
+            for prefix in ids:
+                key = self._find_indexed(index, prefix)
+                try:
+                    message = None
+                    if key:
+                        message = self._read_message(index["docs"][key]["path"])
+                    
+                    if (not message or message.get('read', False)
+                            or (token and message.get('claim_token') != token)
+                            or (not token and not ack and not message.get('claim_token'))):
+                        missed.append(prefix)
+                        continue
+                    
+                    message.pop('claim_token', None)
+                    message.pop('claimed_by', None)
+                    if ack:
+                        message['claimed_until'] = None
+                        acked[key] = message
+                    else:
+                        message['claimed_until'] = ((datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat()
+                                                    if delay > 0 else None)
+                        self._update_header(index["docs"][key]["path"], message)
+                    done.append(message['id'])
+                except Exception as e:
+                    print(f"⚠️  Error settling message {prefix}: {e}", file=sys.stderr)
+                    missed.append(prefix)
+            
+            if acked:
+                self._mark_read(index, acked)
+        
+        if self.output_format != "text":
+            emit({verb: done, "missed": missed}, self.output_format)
+            return
+        
+        for prefix in missed:
+            print(f"⚠️  Not {verb}: {prefix} (not claimed with this token, or already done)")
+        if ack:
+            print(f"✅ Acked {len(done)} message(s)")
         else:
-            # Show unread messages
-            self.list_messages(unread_only=True)
+            print(f"↩️  Released {len(done)} message(s)")
+    
+    def _index_path(self):
+        return self.index_dir / f"{self.hostname.split('.')[0]}.json"
+    
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'rb') as f:
+                index = json_loads(f.read())
+            if index.get("version") == self.INDEX_VERSION:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {"version": self.INDEX_VERSION, "docs": {}, "postings": {}}
+    
+    def _save_index(self, index):
+        index_path = self._index_path()
+        tmp_path = index_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(json_dumps(index))
+            tmp_path.replace(index_path)
+        except OSError as e:
+            print(f"⚠️  Could not save search index: {e}")
+    
+    @PROFILER.timed("query")
+    def _update_index(self):
+        """Bring the inverted index up to date with this host's inbox and sent folders
+
+        Only files that are new since the last update are opened; files that
+        disappeared are dropped from the index.
+        """
+        index = self._load_index()
+        docs = index["docs"]
+        postings = index["postings"]
+        host = self.hostname.split('.')[0]
+        seen = set()
+        changed = False
+        
+        new_files = {}  # path -> index key, for files not indexed yet
+        for folder, directory in (("inbox", self.inbox_dir / host), ("sent", self.sent_dir / host)):
+            if not directory.exists():
+                continue
+            for msg_file in directory.glob("*.json"):
+                key = f"{folder}/{msg_file.name}"
+                seen.add(key)
+                if key not in docs:
+                    new_files[msg_file] = key
+        
+        for msg_file, entry in self._scan(new_files, self._index_entry):
+            if isinstance(entry, Exception):
+                continue  # Possibly mid-write; picked up next time
+            
+            key = new_files[msg_file]
+            docs[key], weights = entry
+            for term, weight in weights.items():
+                postings.setdefault(term, {})[key] = weight
+            changed = True
+        
+        for key in set(docs) - seen:
+            for term in docs.pop(key)["terms"]:
+                postings.get(term, {}).pop(key, None)
+                if term in postings and not postings[term]:
+                    del postings[term]
+            changed = True
+        
+        if changed:
+            self._save_index(index)
+        return index
+    
+    def _index_entry(self, msg_file):
+        """Read one message file and return its index doc and term weights"""
+        message = self._read_message(msg_file)
+        
+        weights = {}
+        for term in tokenize(message.get('subject')):
+            weights[term] = weights.get(term, 0) + self.SUBJECT_WEIGHT
+        for term in tokenize(self._message_text(message)):
+            weights[term] = weights.get(term, 0) + 1
+        
+        doc = {
+            "path": str(msg_file),
+            "id": message.get('id', msg_file.stem),
+            "thread_id": message.get('thread_id') or message.get('id', msg_file.stem),
+            "in_reply_to": message.get('in_reply_to'),
+            "from": message.get('from', ''),
+            "to": message.get('to', ''),
+            "timestamp": message.get('timestamp', ''),
+            "read": message.get('read', False),
+            "priority": message.get('priority', 'normal'),
+            "terms": sorted(weights),
+        }
+        return doc, weights
+    
+    def _find_indexed(self, index, message_id, folders=("inbox",)):
+        """Return the index key of the newest message whose ID starts with message_id"""
+        candidates = [
+            (doc["timestamp"], key) for key, doc in index["docs"].items()
+            if key.split('/', 1)[0] in folders and doc["id"].startswith(message_id)
+        ]
+        return max(candidates)[1] if candidates else None
+    
+    @METRICS.timed("reply")
+    def reply_message(self, message_id, body, subject=None, priority="normal"):
+        """Reply to a message in this inbox, linking it into the same thread"""
+        index = self._update_index()
+        key = self._find_indexed(index, message_id)
+        if not key:
+            if self.output_format != "text":
+                emit_error("Message not found", id=message_id)
+                return False
+            print(f"❌ Message not found: {message_id}")
+            return False
+        
+        try:
+            original = self._read_message(index["docs"][key]["path"])
+        except Exception as e:
+            print(f"❌ Error reading message {message_id}: {e}")
+            return False
+        
+        original_subject = original.get('subject', '')
+        if subject is None:
+            subject = original_subject if original_subject.lower().startswith('re:') else f"Re: {original_subject}"
+        
+        recipient = original.get('from', '').split('.')[0]
+        message = self._create_message(recipient, subject, body, priority,
+                                       in_reply_to=original['id'],
+                                       thread_id=original.get('thread_id') or original['id'])
+        
+        if self._save_message(message):
+            self._save_message(message, is_sent=True)
+            notified = priority == "urgent" and self._notify_urgent(message)
+            
+            if self.output_format != "text":
+                record = {"id": message['id'], "to": recipient, "subject": subject, "priority": priority,
+                          "thread_id": message['thread_id'], "body_size": len((body or '').encode('utf-8'))}
+                if priority == "urgent":
+                    record["watcher_notified"] = notified
+                emit(record, self.output_format)
+                return True
+            
+            priority_emoji = {"normal": "📧", "high": "⚡", "urgent": "🚨"}
+            print(f"{priority_emoji.get(priority, '📧')} Reply sent to {recipient}")
+            print(f"   Subject: {subject}")
+            print(f"   ID: {message['id'][:8]}...")
+            print(f"   Thread: {message['thread_id'][:8]}...")
+            if priority == "urgent":
+                print(f"👂 {recipient}'s watcher notified" if notified else f"💤 No watcher running for {recipient}")
+            return True
+        
+        return False
+    
+    @METRICS.timed("thread")
+    def show_thread(self, message_id):
+        """Show the whole conversation containing a message"""
+        index = self._update_index()
+        docs = index["docs"]
+        key = self._find_indexed(index, message_id, folders=("inbox", "sent"))
+        if not key:
+            if self.output_format != "text":
+                emit_error("Thread not found", id=message_id)
+            else:
+                print(f"❌ Thread not found: {message_id}")
+            return
+        
+        # Thread membership comes from the index; only member files are opened
+        thread_id = docs[key]["thread_id"]
+        members = {}
+        for member_key, doc in docs.items():
+            if doc["thread_id"] != thread_id:
+                continue
+            # A message to ourselves is in both folders; keep the inbox copy
+            if doc["id"] not in members or member_key.startswith("inbox/"):
+                members[doc["id"]] = member_key
+        
+        messages = []
+        for member_key in members.values():
+            try:
+                messages.append(self._read_message(docs[member_key]["path"]))
+            except Exception as e:
+                print(f"⚠️  Error reading message {docs[member_key]['path']}: {e}", file=sys.stderr)
+        messages.sort(key=lambda m: m.get('timestamp', ''))
+        
+        if self.output_format != "text":
+            emit_stream((self._record(msg, with_body=True) for msg in messages), self.output_format)
+            return
+        
+        print(f"🧵 Thread [{thread_id[:8]}] - {len(messages)} message(s)")
+        print("=" * 50)
+        
+        for msg in messages:
+            priority = {"high": "⚡", "urgent": "🚨"}.get(msg.get('priority', 'normal'), "")
+            timestamp = datetime.fromisoformat(msg.get('timestamp', '')).strftime('%Y-%m-%d %H:%M')
+            reply_to = f" ↳ [{msg['in_reply_to'][:8]}]" if msg.get('in_reply_to') else ""
+            
+            print(f"📨 {priority} [{msg['id'][:8]}] {msg.get('from', 'Unknown')} → {msg.get('to', 'Unknown')}{reply_to}")
+            print(f"    📅 {timestamp}")
+            print(f"    📋 {msg.get('subject', 'No subject')}")
+            print()
+            self._write_body(msg)
+            print("-" * 30)
+    
+    def _snippet(self, text, terms, width=160):
+        """Return a short window of text around the first matching term, with terms highlighted"""
+        text = " ".join((text or "").split())
+        if not text:
+            return ""
+        
+        pattern = re.compile(r"\b(" + "|".join(re.escape(t) for t in terms) + r")\b", re.IGNORECASE)
+        match = pattern.search(text)
+        start = max((match.start() if match else 0) - width // 3, 0)
+        window = text[start:start + width]
+        prefix = "…" if start > 0 else ""
+        suffix = "…" if start + width < len(text) else ""
+        return prefix + pattern.sub(r"**\1**", window) + suffix
+    
+    @METRICS.timed("search")
+    def search_messages(self, query, from_sender=None, since=None, limit=20, page=1):
+        """Full-text search over messages sent to or from this system"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            if self.output_format != "text":
+                emit_error("Search query has no searchable words", query=query)
+            else:
+                print("❌ Search query has no searchable words")
+            return
+        
+        try:
+            since_dt = parse_since(since) if since else None
+        except ValueError:
+            if self.output_format != "text":
+                emit_error("Invalid date", since=since)
+            else:
+                print(f"❌ Invalid --since date: {since} (use YYYY-MM-DD or an ISO timestamp)")
+            return
+        
+        index = self._update_index()
+        docs = index["docs"]
+        
+        # Every term must match; score with a simple tf-idf
+        matches = None
+        for term in terms:
+            keys = set(index["postings"].get(term, {}))
+            matches = keys if matches is None else matches & keys
+        
+        scored = []
+        # A message to ourselves is indexed in both folders; keep the inbox copy
+        keys = sorted(matches or (), key=lambda k: not k.startswith("inbox/"))
+        seen_files = set()
+        for key in keys:
+            filename = key.split('/', 1)[1]
+            if filename in seen_files:
+                continue
+            seen_files.add(filename)
+            doc = docs[key]
+            if from_sender and doc["from"].split('.')[0] != from_sender.split('.')[0]:
+                continue
+            if since_dt and (not doc["timestamp"] or datetime.fromisoformat(doc["timestamp"]) < since_dt):
+                continue
+            score = sum(
+                index["postings"][term][key] * math.log(1 + len(docs) / len(index["postings"][term]))
+                for term in terms
+            )
+            scored.append((score, doc["timestamp"], key))
+        
+        scored.sort(reverse=True)
+        total = len(scored)
+        pages = (total + limit - 1) // limit
+        hits = scored[(page - 1) * limit:page * limit]
+        
+        if self.output_format != "text":
+            emit_stream(self._search_records(docs, hits, terms, total), self.output_format)
+            return
+        
+        if not scored:
+            print(f"🔍 No messages matching '{query}'")
+            return
+        
+        if not hits:
+            print(f"🔍 No messages matching '{query}' on page {page}")
+            return
+        
+        print(f"🔍 {total} message(s) matching '{query}' (page {page} of {pages}):")
+        print()
+        
+        for score, timestamp, key in hits:
+            try:
+                msg = self._read_message(docs[key]["path"])
+            except Exception as e:
+                print(f"⚠️  Error reading message {docs[key]['path']}: {e}")
+                continue
+            
+            status = "📭" if msg.get('read', False) else "📬"
+            priority = {"high": "⚡", "urgent": "🚨"}.get(msg.get('priority', 'normal'), "")
+            timestamp = datetime.fromisoformat(msg.get('timestamp', '')).strftime('%Y-%m-%d %H:%M')
+            
+            print(f"{status} {priority} [{msg['id'][:8]}] {msg.get('from', 'Unknown')} → {msg.get('to', 'Unknown')}")
+            print(f"    📅 {timestamp}")
+            print(f"    📋 {self._snippet(msg.get('subject', 'No subject'), terms, width=200)}")
+            if msg.get('body_blob'):
+                print(f"    📦 {msg['body_size'] / 1024:.1f} KB body (read to view)")
+            else:
+                snippet = self._snippet(self._message_text(msg), terms)
+                if snippet:
+                    print(f"    🔎 {snippet}")
+            print()
+        
+        if page < pages:
+            print(f"More results: labmail search '{query}' --page {page + 1}")
+    
+    def _search_records(self, docs, hits, terms, total):
+        """Yield search hits as JSON records, opening each file as it is needed"""
+        for score, timestamp, key in hits:
+            try:
+                msg = self._read_message(docs[key]["path"])
+            except Exception as e:
+                print(f"⚠️  Error reading message {docs[key]['path']}: {e}", file=sys.stderr)
+                continue
+            snippet = "" if msg.get('body_blob') else self._snippet(self._message_text(msg), terms)
+            yield {**self._record(msg), "rank": round(score, 4), "snippet": snippet, "total": total}
     
     def _display_message(self, message):
         """Display a message in detail"""
@@ -204,48 +1311,54 @@ class LabMail:
         print(f"📅 Date: {timestamp}")
         print(f"🆔 ID: {message.get('id', 'Unknown')}")
         print(f"📋 Subject: {message.get('subject', 'No subject')}")
+        if message.get('body_size'):
+            print(f"📦 Size: {message['body_size'] / 1024:.1f} KB")
         print()
         print("📝 Message:")
         print("-" * 30)
-        print(message.get('body', 'No content'))
+        self._write_body(message)
         print("-" * 30)
         print()
     
+    @METRICS.timed("status")
     def get_status(self):
         """Show LabMail system status"""
         my_inbox = self.inbox_dir / self.hostname.split('.')[0]
         
-        print(f"🤖 LabMail Status - {self.hostname}")
-        print("=" * 40)
-        
         # Count messages
         total_messages = 0
         unread_messages = 0
         
         if my_inbox.exists():
-            for msg_file in my_inbox.glob("*.json"):
-                try:
-                    with open(msg_file, 'r') as f:
-                        message = json.load(f)
-                    total_messages += 1
-                    if not message.get('read', False):
-                        unread_messages += 1
-                except:
+            for msg_file, message in self._scan(my_inbox.glob("*.json"), self._read_header):
+                if isinstance(message, Exception):
                     continue
+                total_messages += 1
+                if not message.get('read', False):
+                    unread_messages += 1
         
+        members = sorted(set([m.split('.')[0] for m in self.collective_members]))
+        if self.output_format != "text":
+            emit({"hostname": self.hostname, "total": total_messages, "unread": unread_messages,
+                  "mail_directory": str(self.base_dir), "members": members}, self.output_format)
+            return
+        
+        print(f"🤖 LabMail Status - {self.hostname}")
+        print("=" * 40)
         print(f"📬 Total messages: {total_messages}")
         print(f"📭 Unread messages: {unread_messages}")
         print(f"🏠 Hostname: {self.hostname}")
         print(f"📁 Mail directory: {self.base_dir}")
         print()
         print("🤖 AI Collective Members:")
-        for member in sorted(set([m.split('.')[0] for m in self.collective_members])):
+        for member in members:
             inbox_exists = (self.inbox_dir / member).exists()
             status = "✅" if inbox_exists else "📋"
             print(f"   {status} {member}")
 
 
 def main():
+    PROFILER.switch("startup")
     parser = argparse.ArgumentParser(
         description="LabMail - Digital Innovation Lab Messaging System",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -254,15 +1367,39 @@ Examples:
   labmail send skynet-prod "SSL Issue" "Please check SSL certificate configuration"
   labmail send edgar-dev "Testing Required" "New API endpoints ready for testing"
   labmail list --unread
+  labmail list --unread --with-body --format ndjson
   labmail read abc123
+  labmail read --all-unread
+  labmail mark-read --from hal-db --before 2025-06-01
+  labmail next
+  labmail watch
+  labmail claim -n 5 --visibility 600 --format ndjson
+  labmail ack abc123 def456 --token <token from claim>
+  labmail reply abc123 "Done, certificate renewed"
+  labmail thread abc123
+  labmail search "ssl certificate" --since 2025-06-01
   labmail status
         """
     )
     
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
+    # Options shared by every command
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument('--format', choices=['text', 'json', 'ndjson'], default='text',
+                               help='Output format (default: text); json/ndjson emit one object per message')
+    output_parser.add_argument('--scan-workers', type=int,
+                               help=f'Message files read in parallel when scanning a folder; raise it on '
+                                    f'high-latency NFS (default: {LabMail.SCAN_WORKERS} on network '
+                                    f'filesystems, 1 on local disk)')
+    output_parser.add_argument('--profile', action='store_true',
+                               help='Print where the time went on stderr: import, ensure-schema (directories), '
+                                    'query (folder listing, search index), fetch (message files), render')
+    output_parser.add_argument('--profile-out', metavar='FILE',
+                               help='With --profile (implied), also write cProfile stats to FILE for pstats')
+    
     # Send command
-    send_parser = subparsers.add_parser('send', help='Send a message')
+    send_parser = subparsers.add_parser('send', parents=[output_parser], help='Send a message')
     send_parser.add_argument('recipient', help='Recipient hostname (edgar-dev, skynet-prod, hal-db, coder)')
     send_parser.add_argument('subject', help='Message subject')
     send_parser.add_argument('body', nargs='?', default='', help='Message body (optional)')
@@ -270,17 +1407,72 @@ Examples:
                            help='Message priority (default: normal)')
     
     # List command
-    list_parser = subparsers.add_parser('list', help='List messages')
+    list_parser = subparsers.add_parser('list', parents=[output_parser], help='List messages')
     list_parser.add_argument('--unread', action='store_true', help='Show only unread messages')
     list_parser.add_argument('--from', dest='from_sender', help='Show messages from specific sender')
+    list_parser.add_argument('--with-body', action='store_true', help='Include message bodies (json/ndjson only)')
     
     # Read command
-    read_parser = subparsers.add_parser('read', help='Read a message')
+    read_parser = subparsers.add_parser('read', parents=[output_parser], help='Read a message')
     read_parser.add_argument('message_id', nargs='?', help='Message ID to read (optional)')
     read_parser.add_argument('--unread', action='store_true', help='Show unread messages if no ID specified')
+    read_parser.add_argument('--all-unread', action='store_true', help='Read every unread message and mark them read')
+    read_parser.add_argument('--ids', help='Comma-separated message IDs to read together (partial IDs accepted)')
+    
+    # Mark-read command
+    mark_parser = subparsers.add_parser('mark-read', parents=[output_parser], help='Mark unread messages read without displaying them')
+    mark_parser.add_argument('--from', dest='from_sender', help='Only messages from specific sender')
+    mark_parser.add_argument('--before', help='Only messages older than this date (YYYY-MM-DD or ISO timestamp)')
+    
+    # Next command
+    next_parser = subparsers.add_parser('next', parents=[output_parser],
+                                        help='Read the highest-priority unread message (urgent first)')
+    next_parser.add_argument('--peek', action='store_true', help='Show it without marking it read')
+    
+    # Watch command
+    watch_parser = subparsers.add_parser('watch', parents=[output_parser],
+                                         help='Wait for urgent messages and report them as they arrive')
+    watch_parser.add_argument('--timeout', type=float, help='Stop after this many idle seconds')
+    
+    # Work-queue commands
+    claim_parser = subparsers.add_parser('claim', parents=[output_parser],
+                                         help='Atomically take the next unread messages for processing')
+    claim_parser.add_argument('-n', '--count', type=int, default=1, help='Messages to claim (default: 1)')
+    claim_parser.add_argument('--visibility', type=int, default=300,
+                              help='Seconds the claim lasts before the messages are handed out again (default: 300)')
+    claim_parser.add_argument('--worker', help='Worker name recorded on the claim (default: host:pid)')
+    
+    ack_parser = subparsers.add_parser('ack', parents=[output_parser], help='Finish claimed messages (marks them read)')
+    ack_parser.add_argument('ids', nargs='+', help='Message IDs (partial IDs accepted)')
+    ack_parser.add_argument('--token', help='Claim token; only messages still held under it are acked')
+    
+    nack_parser = subparsers.add_parser('nack', parents=[output_parser], help='Release claimed messages for another worker')
+    nack_parser.add_argument('ids', nargs='+', help='Message IDs (partial IDs accepted)')
+    nack_parser.add_argument('--token', help='Claim token; only messages still held under it are released')
+    nack_parser.add_argument('--delay', type=int, default=0, help='Keep the messages hidden this many seconds (default: 0)')
+    
+    # Reply command
+    reply_parser = subparsers.add_parser('reply', parents=[output_parser], help='Reply to a message (keeps the conversation threaded)')
+    reply_parser.add_argument('message_id', help='Message ID to reply to (partial ID accepted)')
+    reply_parser.add_argument('body', nargs='?', default='', help='Reply body (optional)')
+    reply_parser.add_argument('--subject', help='Reply subject (default: "Re: <original subject>")')
+    reply_parser.add_argument('--priority', choices=['normal', 'high', 'urgent'], default='normal',
+                            help='Message priority (default: normal)')
+    
+    # Thread command
+    thread_parser = subparsers.add_parser('thread', parents=[output_parser], help='Show the whole conversation containing a message')
+    thread_parser.add_argument('message_id', help='ID of any message in the thread (partial ID accepted)')
+    
+    # Search command
+    search_parser = subparsers.add_parser('search', parents=[output_parser], help='Full-text search message history')
+    search_parser.add_argument('query', help='Search words (all must match)')
+    search_parser.add_argument('--from', dest='from_sender', help='Only messages from specific sender')
+    search_parser.add_argument('--since', help='Only messages on or after this date (YYYY-MM-DD or ISO timestamp)')
+    search_parser.add_argument('--limit', type=int, default=20, help='Results per page (default: 20)')
+    search_parser.add_argument('--page', type=int, default=1, help='Page number (default: 1)')
     
     # Status command
-    subparsers.add_parser('status', help='Show LabMail system status')
+    subparsers.add_parser('status', parents=[output_parser], help='Show LabMail system status')
     
     args = parser.parse_args()
     
@@ -288,12 +1480,16 @@ Examples:
         parser.print_help()
         return
     
-    labmail = LabMail()
+    if args.profile or args.profile_out:
+        PROFILER.start(args.profile_out)
+    
+    labmail = LabMail(output_format=args.format, scan_workers=args.scan_workers)
+    PROFILER.switch("render")
     
     if args.command == 'send':
         if not args.body:
             # Interactive input for message body
-            print("Enter message body (Ctrl+D or Ctrl+Z when done):")
+            print("Enter message body (Ctrl+D or Ctrl+Z when done):", file=sys.stderr if args.format != 'text' else sys.stdout)
             try:
                 args.body = sys.stdin.read().strip()
             except KeyboardInterrupt:
@@ -303,14 +1499,53 @@ Examples:
         labmail.send_message(args.recipient, args.subject, args.body, args.priority)
     
     elif args.command == 'list':
-        labmail.list_messages(unread_only=args.unread, from_sender=args.from_sender)
+        labmail.list_messages(unread_only=args.unread, from_sender=args.from_sender, with_body=args.with_body)
     
     elif args.command == 'read':
-        if args.message_id:
+        if args.ids:
+            labmail.read_messages(ids=[i.strip() for i in args.ids.split(',') if i.strip()])
+        elif args.all_unread:
+            labmail.read_messages(all_unread=True)
+        elif args.message_id:
             labmail.read_message(args.message_id)
         else:
             labmail.read_message(unread_only=args.unread)
     
+    elif args.command == 'mark-read':
+        labmail.mark_read(from_sender=args.from_sender, before=args.before)
+    
+    elif args.command == 'next':
+        labmail.next_message(peek=args.peek)
+    
+    elif args.command == 'watch':
+        labmail.watch_urgent(timeout=args.timeout)
+    
+    elif args.command == 'claim':
+        labmail.claim_messages(count=max(args.count, 1), visibility=max(args.visibility, 1), worker=args.worker)
+    
+    elif args.command in ('ack', 'nack'):
+        labmail.settle_messages(args.ids, ack=args.command == 'ack', token=args.token,
+                                delay=max(getattr(args, 'delay', 0), 0))
+    
+    elif args.command == 'reply':
+        if not args.body:
+            # Interactive input for reply body
+            print("Enter reply body (Ctrl+D or Ctrl+Z when done):", file=sys.stderr if args.format != 'text' else sys.stdout)
+            try:
+                args.body = sys.stdin.read().strip()
+            except KeyboardInterrupt:
+                print("\n❌ Reply cancelled")
+                return
+        
+        labmail.reply_message(args.message_id, args.body, subject=args.subject, priority=args.priority)
+    
+    elif args.command == 'thread':
+        labmail.show_thread(args.message_id)
+    
+    elif args.command == 'search':
+        labmail.search_messages(args.query, from_sender=args.from_sender, since=args.since,
+                                limit=max(args.limit, 1), page=max(args.page, 1))
+    
     elif args.command == 'status':
         labmail.get_status()
 
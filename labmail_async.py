@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+LabMail Async - asyncio client library for the LabMail PostgreSQL backend
+Lets async agent runtimes send, read, claim and watch messages without blocking the event loop
+
+    import asyncio
+    from labmail_async import AsyncLabMail
+
+    async def main():
+        async with AsyncLabMail() as mail:
+            await mail.send("hal-db", "Backup status", "Nightly backup complete")
+            for message in await mail.read_many(all_unread=True):
+                print(message.sender, message.subject, message.body)
+
+    asyncio.run(main())
+
+Every call returns data (Message objects, lists, counts) instead of printing.
+The tables, body encoding and JSON keys are the ones labmail-db and labmail-ai
+use, so messages move freely between the library and the command-line tools.
+"""
+
+import asyncio
+import configparser
+import gzip
+import hashlib
+import json
+import os
+import random
+import socket
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+import asyncpg
+
+
+# The schema labmail-db/labmail-ai create; must equal len(SCHEMA_MIGRATIONS) there
+SCHEMA_VERSION = 6
+
+# Connection profiles, shared with labmail-db/labmail-ai: INI files with one
+# section per profile, later files overriding earlier ones. $LABMAIL_CONFIG
+# replaces the list, and LABMAIL_<KEY> environment variables win over the file.
+# asyncpg only understands URI DSNs (postgresql://...).
+CONFIG_PATHS = ("/etc/labmail.conf", "~/.config/labmail.conf")
+DEFAULT_PROFILE = {
+    # hal-db.justsparx.local. No password here: libpq (and asyncpg) take it from
+    # ~/.pgpass or PGPASSWORD, or put one in the profile's dsn
+    "dsn": "postgresql://hal_admin@192.168.1.202:5432/hal_main",
+    "read_dsn": "",  # Replicas for list(), separated by whitespace; empty sends it to dsn
+    "listen_dsn": "",  # Unpooled connection for watch() (LISTEN); empty uses dsn
+    "pooled": "no",  # dsn/read_dsn go through pgbouncer in transaction mode: no prepared statement cache
+    "connect_timeout": "10",  # Seconds
+    "statement_timeout": "0",  # Seconds, 0 for none; enforced client-side when pooled
+    "replica_wait": "2",  # Used by the CLIs' --consistent
+}
+
+COLLECTIVE_MEMBERS = ["edgar-dev", "skynet-prod", "hal-db", "coder"]
+PRIORITIES = ("normal", "high", "urgent")
+
+HEADER_COLUMNS = """m.id, m.from_system, m.to_system, m.subject, m.priority, m.created_at, m.is_read,
+                    m.read_at, m.thread_id, m.in_reply_to, m.body_size"""
+BODY_COLUMNS = "m.body, m.body_gz, m.body_blob"
+CLAIM_COLUMNS = "m.claim_token, m.claimed_until, m.delivery_count"
+
+
+class LabMailError(Exception):
+    """A LabMail request was refused: unknown recipient, bad priority, an out-of-date schema or a bad profile"""
+
+
+def load_profile(name=None):
+    """Resolve a connection profile: built-in defaults, then the config file section, then LABMAIL_* variables"""
+    name = name or os.environ.get("LABMAIL_PROFILE") or "default"
+    parser = configparser.ConfigParser(interpolation=None)
+    config_path = os.environ.get("LABMAIL_CONFIG")
+    found = parser.read([config_path] if config_path else [os.path.expanduser(p) for p in CONFIG_PATHS])
+
+    if parser.has_section(name):
+        settings = dict(parser[name])
+    elif name == "default":
+        settings = parser.defaults()
+    else:
+        raise LabMailError(f"No [{name}] profile in {', '.join(found) or 'any config file'}")
+    unknown = set(settings) - set(DEFAULT_PROFILE)
+    if unknown:
+        raise LabMailError(f"Unknown setting(s) in [{name}]: {', '.join(sorted(unknown))}")
+
+    profile = {key: os.environ.get(f"LABMAIL_{key.upper()}", settings.get(key, default))
+               for key, default in DEFAULT_PROFILE.items()}
+    try:
+        profile["pooled"] = profile["pooled"].strip().lower() in ("1", "yes", "true", "on")
+        profile["connect_timeout"] = int(profile["connect_timeout"])
+        profile["statement_timeout"] = float(profile["statement_timeout"])
+        profile["replica_wait"] = float(profile["replica_wait"])
+    except ValueError as e:
+        raise LabMailError(f"Bad setting in [{name}]: {e}") from None
+    if not profile["dsn"].strip():
+        raise LabMailError(f"No dsn configured in [{name}]: set dsn in {', '.join(found) or CONFIG_PATHS[-1]} or LABMAIL_DSN")
+    profile["name"] = name
+    return profile
+
+
+@dataclass
+class Message:
+    id: str
+    sender: str
+    recipient: str
+    subject: str
+    priority: str
+    created_at: datetime
+    is_read: bool
+    read_at: Optional[datetime]
+    thread_id: Optional[str]
+    in_reply_to: Optional[str]
+    body_size: Optional[int] = None
+    body: Optional[str] = None  # None when the body was not requested
+    claim_token: Optional[str] = None
+    claimed_until: Optional[datetime] = None
+    delivery_count: Optional[int] = None
+
+    def to_dict(self):
+        """The same keys the CLIs print with --format json"""
+        record = {
+            "id": self.id, "from": self.sender, "to": self.recipient, "subject": self.subject,
+            "priority": self.priority, "created_at": self.created_at.isoformat(),
+            "is_read": self.is_read, "read_at": self.read_at.isoformat() if self.read_at else None,
+            "thread_id": self.thread_id, "in_reply_to": self.in_reply_to, "body_size": self.body_size,
+        }
+        if self.claim_token:
+            record.update(claim_token=self.claim_token, claimed_until=self.claimed_until.isoformat(),
+                          delivery_count=self.delivery_count)
+        if self.body is not None:
+            record["body"] = self.body
+        return record
+
+
+@dataclass
+class SettleResult:
+    done: list = field(default_factory=list)  # Full IDs acked or released
+    missed: list = field(default_factory=list)  # Requested IDs that were not held under the token
+
+
+def _uuid(value):
+    return str(value) if value is not None else None
+
+
+class AsyncLabMail:
+    COMPRESS_THRESHOLD = 8 * 1024  # Bodies this size (bytes) or larger are gzipped
+    BLOB_THRESHOLD = 256 * 1024  # ...and these go to labmail_blobs instead of the row
+    SEARCH_TEXT_LIMIT = 256 * 1024  # Body characters fed to the search vector
+
+    def __init__(self, hostname=None, min_size=1, max_size=10, profile=None, **db_config):
+        self.hostname = (hostname or socket.gethostname()).split('.')[0]  # Remove domain
+        self.profile = load_profile(profile)
+        self.db_config = db_config  # asyncpg.connect() arguments applied over the profile (host=, password=, ...)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+        self.read_pool = None  # The same pool unless the profile has a read_dsn
+
+    def _connect_args(self, target="dsn", dsn=None):
+        """asyncpg connection arguments for the profile's dsn, read_dsn or listen_dsn"""
+        args = {"dsn": dsn or self.profile[target] or self.profile["dsn"], "timeout": self.profile["connect_timeout"]}
+        timeout = self.profile["statement_timeout"]
+        if self.profile["pooled"] and target != "listen_dsn":
+            # Transaction pooling moves sessions between servers: no named statements or startup settings
+            args["statement_cache_size"] = 0
+            if timeout:
+                args["command_timeout"] = timeout
+        elif timeout:
+            args["server_settings"] = {"statement_timeout": str(int(timeout * 1000))}
+        return {**args, **self.db_config}
+
+    async def open(self):
+        """Create the connection pools and check the schema is current"""
+        self.pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size,
+                                              **self._connect_args())
+        self.read_pool = self.pool
+        replicas = self.profile["read_dsn"].split()
+        random.shuffle(replicas)  # Spread clients across replicas; an unreachable one is skipped
+        for dsn in replicas:
+            try:
+                self.read_pool = await asyncpg.create_pool(min_size=self.min_size, max_size=self.max_size,
+                                                           **self._connect_args("read_dsn", dsn))
+                break
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+                continue
+        version = await self.pool.fetchval("""
+            SELECT CASE WHEN to_regclass('labmail_schema') IS NULL THEN 0
+                        ELSE (SELECT COALESCE(MAX(version), 0) FROM labmail_schema) END
+        """)
+        if version < SCHEMA_VERSION:
+            await self.close()
+            raise LabMailError(f"LabMail schema is at version {version}, need {SCHEMA_VERSION}: "
+                               f"run 'labmail-db status' once to upgrade it")
+        return self
+
+    async def close(self):
+        if self.read_pool is not None and self.read_pool is not self.pool:
+            await self.read_pool.close()
+        self.read_pool = None
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # Bodies
+
+    def _check(self, recipient, priority):
+        if recipient is not None and recipient not in COLLECTIVE_MEMBERS:
+            raise LabMailError(f"Unknown recipient: {recipient} (available: {', '.join(COLLECTIVE_MEMBERS)})")
+        if priority not in PRIORITIES:
+            raise LabMailError(f"Unknown priority: {priority} (use {', '.join(PRIORITIES)})")
+
+    async def _store_body(self, conn, body):
+        """Return (body, body_gz, body_blob, body_size) column values, as labmail-db stores them"""
+        raw = (body or '').encode('utf-8')
+        if len(raw) < self.COMPRESS_THRESHOLD:
+            return body, None, None, None
+
+        if len(raw) >= self.BLOB_THRESHOLD:
+            # Compressing megabytes would stall every other task on the loop
+            packed = await asyncio.to_thread(gzip.compress, raw)
+            digest = hashlib.sha256(raw).hexdigest()
+            await conn.execute("""
+                INSERT INTO labmail_blobs (digest, data, size) VALUES ($1, $2, $3)
+                ON CONFLICT (digest) DO NOTHING
+            """, digest, packed, len(raw))
+            return None, None, digest, len(raw)
+
+        packed = gzip.compress(raw)
+        if len(packed) >= len(raw):
+            return body, None, None, None  # Incompressible; TOAST can have it
+        return None, packed, None, len(raw)
+
+    async def _bodies(self, conn, rows):
+        """Decode the bodies of fetched rows; all offloaded blobs come back in one query"""
+        digests = list({row['body_blob'] for row in rows if row['body_blob']})
+        blobs = {}
+        if digests:
+            for blob in await conn.fetch("SELECT digest, data FROM labmail_blobs WHERE digest = ANY($1::text[])",
+                                         digests):
+                blobs[blob['digest'].strip()] = blob['data']
+
+        bodies = []
+        for row in rows:
+            if row['body_gz'] is not None:
+                bodies.append(gzip.decompress(row['body_gz']).decode('utf-8', errors='replace'))
+            elif row['body_blob']:
+                data = blobs.get(row['body_blob'].strip())
+                bodies.append((await asyncio.to_thread(gzip.decompress, data)).decode('utf-8', errors='replace')
+                              if data is not None else '')
+            else:
+                bodies.append(row['body'] or '')
+        return bodies
+
+    async def _messages(self, conn, rows, with_body=False):
+        bodies = await self._bodies(conn, rows) if with_body else [None] * len(rows)
+        messages = []
+        for row, body in zip(rows, bodies):
+            message = Message(
+                id=str(row['id']), sender=row['from_system'], recipient=row['to_system'],
+                subject=row['subject'], priority=row['priority'], created_at=row['created_at'],
+                is_read=row['is_read'], read_at=row['read_at'], thread_id=_uuid(row['thread_id']),
+                in_reply_to=_uuid(row['in_reply_to']), body_size=row['body_size'], body=body,
+            )
+            if 'claim_token' in row.keys() and row['claim_token'] is not None:
+                message.claim_token = str(row['claim_token'])
+                message.claimed_until = row['claimed_until']
+                message.delivery_count = row['delivery_count']
+            messages.append(message)
+        return messages
+
+    async def _notify_urgent(self, conn, message_id, recipient, subject):
+        """Wake the recipient's watchers; delivered when the surrounding transaction commits"""
+        await conn.execute("SELECT pg_notify($1, $2)", f"labmail_{recipient}", json.dumps({
+            "id": message_id, "from": self.hostname, "to": recipient,
+            "subject": subject[:200], "priority": "urgent",
+        }))
+
+    # Sending
+
+    async def send(self, recipient, subject, body="", priority="normal"):
+        """Send one message; returns its ID"""
+        return (await self.send_many([(recipient, subject, body, priority)]))[0]
+
+    async def send_many(self, messages):
+        """Send several (recipient, subject, body[, priority]) messages in one transaction
+
+        The inserts go through executemany, which pipelines them to the server
+        in a single round trip instead of one per message. Returns the new IDs.
+        """
+        rows = []
+        urgent = []
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for item in messages:
+                    recipient, subject, body = item[0].split('.')[0], item[1], item[2]
+                    priority = item[3] if len(item) > 3 else "normal"
+                    self._check(recipient, priority)
+
+                    message_id = str(uuid.uuid4())
+                    body_text, body_gz, body_blob, body_size = await self._store_body(conn, body)
+                    rows.append((message_id, self.hostname, recipient, subject, body_text, body_gz, body_blob,
+                                 body_size, priority, subject, (body or '')[:self.SEARCH_TEXT_LIMIT]))
+                    if priority == "urgent":
+                        urgent.append((message_id, recipient, subject))
+
+                await conn.executemany("""
+                    INSERT INTO labmailmessages
+                    (id, from_system, to_system, subject, body, body_gz, body_blob, body_size,
+                     priority, thread_id, search_vector)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $1,
+                            setweight(to_tsvector('english', $10), 'A') ||
+                            setweight(to_tsvector('english', $11), 'B'))
+                """, rows)
+
+                for message_id, recipient, subject in urgent:
+                    await self._notify_urgent(conn, message_id, recipient, subject)
+
+        return [row[0] for row in rows]
+
+    async def reply(self, message_id, body, subject=None, priority="normal"):
+        """Reply to a message in this inbox, keeping it in the same thread; returns the reply ID or None"""
+        self._check(None, priority)
+        reply_id = str(uuid.uuid4())
+        async with self.pool.acquire() as conn:
+            transaction = conn.transaction()
+            await transaction.start()
+            try:
+                body_text, body_gz, body_blob, body_size = await self._store_body(conn, body)
+                row = await conn.fetchrow("""
+                    INSERT INTO labmailmessages
+                    (id, from_system, to_system, subject, body, body_gz, body_blob, body_size,
+                     priority, in_reply_to, thread_id, search_vector)
+                    SELECT $1, $2, m.from_system, s.subject, $3, $4, $5, $6, $7, m.id, COALESCE(m.thread_id, m.id),
+                           setweight(to_tsvector('english', s.subject), 'A') ||
+                           setweight(to_tsvector('english', $8), 'B')
+                    FROM labmailmessages m,
+                         LATERAL (SELECT COALESCE($9, CASE WHEN m.subject ILIKE 're:%' THEN m.subject
+                                                           ELSE 'Re: ' || m.subject END) AS subject) s
+                    WHERE m.to_system = $10 AND CAST(m.id AS TEXT) LIKE $11
+                    ORDER BY m.created_at DESC
+                    LIMIT 1
+                    RETURNING to_system, subject
+                """, reply_id, self.hostname, body_text, body_gz, body_blob, body_size, priority,
+                    (body or '')[:self.SEARCH_TEXT_LIMIT], subject, self.hostname, f"{message_id}%")
+
+                if row is None:
+                    await transaction.rollback()  # Don't keep a blob stored for a reply that never happened
+                    return None
+                if priority == "urgent":
+                    await self._notify_urgent(conn, reply_id, row['to_system'], row['subject'])
+            except BaseException:
+                await transaction.rollback()
+                raise
+            await transaction.commit()
+        return reply_id
+
+    # Reading
+
+    async def list(self, unread_only=False, from_sender=None, with_body=False):
+        """Inbox messages: unread first in delivery order, then read mail newest first
+
+        The unread and read parts are separate branches that each walk an
+        index in order, joined by UNION ALL, so the server sorts nothing.
+        """
+        params = [self.hostname]
+        sender = ""
+        if from_sender:
+            params.append(from_sender.split('.')[0])
+            sender = " AND m.from_system = $2"
+        columns = f"{HEADER_COLUMNS}{', ' + BODY_COLUMNS if with_body else ''}"
+        query = f"""
+            SELECT {columns} FROM labmailmessages m
+            WHERE m.to_system = $1 AND m.is_read = FALSE{sender}
+            ORDER BY m.priority_rank, m.created_at
+        """
+        if not unread_only:
+            query = f"""({query}) UNION ALL (
+                SELECT {columns} FROM labmailmessages m
+                WHERE m.to_system = $1 AND m.is_read = TRUE{sender}
+                ORDER BY m.created_at DESC
+            )"""
+
+        async with self.read_pool.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+            return await self._messages(conn, rows, with_body)
+
+    async def read(self, message_id, mark_read=True):
+        """The newest message whose ID starts with message_id, with its body; None if there is none"""
+        messages = await self.read_many(ids=[message_id], mark_read=mark_read)
+        return messages[0] if messages else None
+
+    async def read_many(self, ids=None, all_unread=False, mark_read=True):
+        """Fetch messages with bodies and mark them read, in one statement
+
+        Pass partial IDs, or all_unread=True for every unread message in
+        delivery order that no worker holds a claim on. IDs that match
+        nothing are left out of the result.
+        """
+        if ids:
+            pick = """
+                SELECT DISTINCT ON (p.prefix) m.id
+                FROM unnest($2::text[]) AS p(prefix)
+                JOIN labmailmessages m ON CAST(m.id AS TEXT) LIKE p.prefix || '%'
+                WHERE m.to_system = $1
+                ORDER BY p.prefix, m.created_at DESC
+            """
+            params = [self.hostname, list(ids)]
+            order = "created_at"
+        elif all_unread:
+            pick = """
+                SELECT m.id FROM labmailmessages m
+                WHERE m.to_system = $1 AND m.is_read = FALSE
+                  AND (m.claimed_until IS NULL OR m.claimed_until < NOW())
+            """
+            params = [self.hostname]
+            order = "priority_rank, created_at"
+        else:
+            return []
+
+        if mark_read:
+            query = f"""
+                WITH done AS (
+                    UPDATE labmailmessages m
+                    SET is_read = TRUE, read_at = NOW()
+                    WHERE m.id IN ({pick})
+                    RETURNING {HEADER_COLUMNS}, {BODY_COLUMNS}, m.priority_rank
+                )
+                SELECT * FROM done ORDER BY {order}
+            """
+        else:
+            query = f"""
+                SELECT {HEADER_COLUMNS}, {BODY_COLUMNS}, m.priority_rank
+                FROM labmailmessages m WHERE m.id IN ({pick})
+                ORDER BY {order}
+            """
+
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(query, *params)
+            return await self._messages(conn, rows, with_body=True)
+
+    async def next(self, peek=False):
+        """The highest-priority unread message not held by a claim, marked read unless peek; None if empty"""
+        pick = """
+            SELECT id FROM labmailmessages
+            WHERE to_system = $1 AND is_read = FALSE
+              AND (claimed_until IS NULL OR claimed_until < NOW())
+            ORDER BY priority_rank, created_at
+            LIMIT 1
+        """
+        async with self.pool.acquire() as conn:
+            if peek:
+                row = await conn.fetchrow(f"""
+                    SELECT {HEADER_COLUMNS}, {BODY_COLUMNS} FROM labmailmessages m WHERE m.id = ({pick})
+                """, self.hostname)
+            else:
+                row = await conn.fetchrow(f"""
+                    UPDATE labmailmessages m
+                    SET is_read = TRUE, read_at = NOW()
+                    WHERE m.id = ({pick} FOR UPDATE SKIP LOCKED)
+                    RETURNING {HEADER_COLUMNS}, {BODY_COLUMNS}
+                """, self.hostname)
+            if row is None:
+                return None
+            return (await self._messages(conn, [row], with_body=True))[0]
+
+    async def mark_read(self, from_sender=None, before=None):
+        """Mark unread messages read, optionally by sender and age; returns how many changed"""
+        conditions = ["to_system = $1", "is_read = FALSE"]
+        params = [self.hostname]
+        if from_sender:
+            params.append(from_sender.split('.')[0])
+            conditions.append(f"from_system = ${len(params)}")
+        if before:
+            params.append(before)
+            conditions.append(f"created_at < ${len(params)}")
+
+        async with self.pool.acquire() as conn:
+            status = await conn.execute(f"""
+                UPDATE labmailmessages SET is_read = TRUE, read_at = NOW()
+                WHERE {' AND '.join(conditions)}
+            """, *params)
+        return int(status.split()[-1])
+
+    # Work queue
+
+    async def claim(self, count=1, visibility=300, worker=None):
+        """Hand out up to count unread, unclaimed messages to this worker in delivery order
+
+        Each returned Message carries the claim_token to ack or nack it with.
+        Concurrent claimers never receive the same message.
+        """
+        token = uuid.uuid4()
+        worker = worker or f"{self.hostname}:{os.getpid()}"
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                UPDATE labmailmessages m
+                SET claim_token = $1, claimed_by = $2,
+                    claimed_until = NOW() + make_interval(secs => $3),
+                    delivery_count = m.delivery_count + 1
+                FROM (
+                    SELECT id FROM labmailmessages
+                    WHERE to_system = $4 AND is_read = FALSE
+                      AND (claimed_until IS NULL OR claimed_until < NOW())
+                    ORDER BY priority_rank, created_at
+                    LIMIT $5
+                    FOR UPDATE SKIP LOCKED
+                ) next
+                WHERE m.id = next.id
+                RETURNING {HEADER_COLUMNS}, {BODY_COLUMNS}, {CLAIM_COLUMNS}, m.priority_rank
+            """, token, worker, float(visibility), self.hostname, count)
+            rows = sorted(rows, key=lambda m: (m['priority_rank'], m['created_at']))
+            return await self._messages(conn, rows, with_body=True)
+
+    async def ack(self, ids, token=None):
+        """Finish claimed messages (marks them read)"""
+        return await self._settle(ids, True, token, 0)
+
+    async def nack(self, ids, token=None, delay=0):
+        """Release claimed messages, optionally hidden for delay seconds before the next claim"""
+        return await self._settle(ids, False, token, delay)
+
+    async def _settle(self, ids, ack, token, delay):
+        params = [self.hostname, [f"{i}%" for i in ids]]
+        if ack:
+            assignments = "is_read = TRUE, read_at = NOW(), claimed_until = NULL"
+        else:
+            params.append(float(delay))
+            assignments = "claimed_until = CASE WHEN $3 > 0 THEN NOW() + make_interval(secs => $3) END"
+
+        conditions = ["to_system = $1", "is_read = FALSE", "CAST(id AS TEXT) LIKE ANY($2::text[])"]
+        if token:
+            params.append(str(token))
+            conditions.append(f"claim_token = ${len(params)}::uuid")
+        elif not ack:
+            conditions.append("claim_token IS NOT NULL")
+
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(f"""
+                UPDATE labmailmessages
+                SET {assignments}, claim_token = NULL, claimed_by = NULL
+                WHERE {' AND '.join(conditions)}
+                RETURNING CAST(id AS TEXT) AS id
+            """, *params)
+        done = [row['id'] for row in rows]
+        return SettleResult(done=done, missed=[i for i in ids if not any(d.startswith(i) for d in done)])
+
+    # Notifications
+
+    async def watch(self):
+        """Yield an event dict for each urgent message sent to this host, as it is committed
+
+        Runs on its own connection outside the pool until the caller stops
+        iterating; wrap it in asyncio.timeout() or break out to finish.
+        """
+        if self.profile["pooled"] and not self.profile["listen_dsn"]:
+            # Transaction pooling hands each statement a different server, so LISTEN would be lost
+            raise LabMailError(f"watch() needs a direct connection: set listen_dsn in profile '{self.profile['name']}'")
+        events = asyncio.Queue()
+        conn = await asyncpg.connect(**self._connect_args("listen_dsn"))
+        try:
+            await conn.add_listener(f"labmail_{self.hostname}",
+                                    lambda _conn, _pid, _channel, payload: events.put_nowait(json.loads(payload)))
+            while True:
+                yield await events.get()
+        finally:
+            await conn.close()
+
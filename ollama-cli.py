@@ -4,53 +4,289 @@ Ollama CLI - Quick AI queries via local Ollama API
 One-shot queries perfect for Claude Code development sessions
 """
 
+import time
+
+STARTED = time.perf_counter()  # --profile counts module imports from here
+
 import argparse
 import json
-import sys
+import math
+import os
 import requests
-from datetime import datetime
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ollama_pool import METRICS_LOG, HostPool, append_metrics_log, model_key, read_metrics_log
+from toolkit_metrics import Metrics, Profiler
+
+
+def parse_keep_alive(value):
+    """Convert a --keep-alive value to what the Ollama API expects
+
+    Bare numbers are seconds (-1 keeps the model loaded indefinitely, 0 unloads
+    it immediately); anything else is passed through as a duration string
+    such as "10m" or "24h".
+    """
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(pct * len(ordered) / 100) - 1, 0)]  # Multiply first: 0.7 * 10 is 7.000000000000001
+
+
+# --profile phases, in report order. Fetching the model list to check a model
+# name counts as query, not models. Host probes run on worker threads and are
+# reported separately.
+PROFILER = Profiler(STARTED, ("import", "startup", "models", "connect", "query", "render"), plain=True)
+
+
+# Instrumentation for node_exporter's textfile collector; histograms use Metrics.BUCKETS
+OLLAMA_METRICS = {
+    "ollama_request_duration_seconds": ("histogram", "Wall time of a completed Ollama call, queueing and model load included"),
+    "ollama_request_errors_total": ("counter", "Ollama API requests that failed: connection errors, timeouts, HTTP errors"),
+    "ollama_tokens_total": ("counter", "Tokens processed by Ollama, by kind (prompt or generated)"),
+}
+METRICS = Metrics("ollama-cli", OLLAMA_METRICS, plain=True)
+
 
 class OllamaCLI:
-    def __init__(self, host="milliways", port=11434):
-        self.base_url = f"http://{host}:{port}/api"
-        self.host = host
+    CACHE_FILE = Path.home() / ".cache" / "ollama-models.json"
+    CACHE_TTL = 60  # seconds a cached /api/tags listing stays fresh
+    
+    def __init__(self, host="milliways", port=11434, keep_alive=None, refresh=False, metrics=None):
+        hosts = host.split(',') if isinstance(host, str) else list(host)
+        self.pool = HostPool(hosts, port, metrics=METRICS, profiler=PROFILER)
+        self.host = ", ".join(e['name'] for e in self.pool.endpoints)
         self.port = port
+        self.keep_alive = keep_alive
+        self.refresh = refresh
+        self.metrics = metrics
+        self.cache = self._load_cache()
+    
+    def _load_cache(self):
+        try:
+            with open(self.CACHE_FILE, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_cache(self):
+        try:
+            self.CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.CACHE_FILE.with_suffix(f".{os.getpid()}.tmp")  # Concurrent CLIs each write their own
+            with open(tmp_file, 'w') as f:
+                json.dump(self.cache, f)
+            tmp_file.replace(self.CACHE_FILE)
+        except OSError:
+            pass
+    
+    def _cached_entry(self, endpoint):
+        """Return the cached tags/version entry for a host if it is still fresh"""
+        entry = self.cache.get(f"{endpoint['host']}:{endpoint['port']}")
+        if self.refresh or not entry or time.time() - entry.get('fetched_at', 0) > self.CACHE_TTL:
+            return None
+        return entry
+    
+    def _store_entry(self, endpoint, tags, version=None):
+        """Cache the parts of /api/tags (and /api/version) we actually use"""
+        entry = {
+            'fetched_at': time.time(),
+            'models': [
+                {key: model.get(key) for key in ('name', 'size', 'digest', 'modified_at')}
+                for model in tags.get('models', [])
+            ],
+            'version': version,
+        }
+        self.cache[f"{endpoint['host']}:{endpoint['port']}"] = entry
+        self._save_cache()
+        return entry
+    
+    def get_models(self):
+        """Return the models available on any configured host, from the local cache where it is fresh
+
+        Each host's own list is remembered on its endpoint so the pool sends a
+        model's requests to a host that has it. Hosts that cannot be listed
+        are skipped; the last error is raised only if none could be.
+        """
+        models = {}
+        last_error = None
+        for endpoint in self.pool.endpoints:
+            entry = self._cached_entry(endpoint)
+            if entry is None:
+                try:
+                    response = self.pool.call(endpoint, 'GET', '/tags', timeout=10)
+                    if response.status_code != 200:
+                        raise requests.exceptions.HTTPError(f"HTTP {response.status_code}", response=response)
+                    entry = self._store_entry(endpoint, response.json())
+                except requests.exceptions.ConnectionError as e:
+                    self.pool._mark_down(endpoint)
+                    last_error = e
+                    continue
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    last_error = e
+                    continue
+            endpoint['available'] = {model_key(m.get('name') or '') for m in entry['models']}
+            for m in entry['models']:
+                models.setdefault(model_key(m.get('name') or ''), m)
+        
+        if not models and last_error is not None:
+            raise last_error
+        return list(models.values())
+    
+    @PROFILER.timed("models")
+    def _check_model(self, model):
+        """Reject unknown model names before sending a request"""
+        try:
+            names = {model_key(m.get('name', '')) for m in self.get_models()}
+        except (requests.exceptions.RequestException, ValueError):
+            return True  # Let the real request report the connection problem
+        
+        if model_key(model) in names:
+            return True
+        
+        print(f"ERROR: Model '{model}' not found")
+        print(f"Available models: {', '.join(sorted(names)) or 'none'}")
+        print("If it was pulled recently, retry with --refresh")
+        return False
+    
+    def _print_timing(self, result, endpoint):
+        """Show response time with model load split out from evaluation"""
+        if 'total_duration' not in result:
+            return
+        
+        duration_ms = result['total_duration'] / 1_000_000  # nanoseconds to ms
+        load_ms = result.get('load_duration', 0) / 1_000_000
+        eval_ms = (result.get('prompt_eval_duration', 0) + result.get('eval_duration', 0)) / 1_000_000
+        served_by = f" on {endpoint['name']}" if len(self.pool.endpoints) > 1 else ""
+        print()
+        print(f"Response time: {duration_ms:.0f}ms{served_by} (load: {load_ms:.0f}ms, eval: {eval_ms:.0f}ms)")
+    
+    def _record_metrics(self, operation, model, result, endpoint, started):
+        """Append one call's timing and throughput to the metrics log"""
+        ns_per_ms = 1_000_000
+        wall_ms = (time.monotonic() - started) * 1000
+        total_ms = result.get('total_duration', 0) / ns_per_ms
+        eval_tokens = result.get('eval_count', 0)
+        eval_ns = result.get('eval_duration', 0)
+        
+        entry = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'tool': 'ollama-cli',
+            'operation': operation,
+            'model': model_key(model),
+            'host': f"{endpoint['host']}:{endpoint['port']}",
+            'prompt_tokens': result.get('prompt_eval_count', 0),
+            'generated_tokens': eval_tokens,
+            'tokens_per_sec': round(eval_tokens / (eval_ns / 1e9), 2) if eval_ns else None,
+            'load_ms': round(result.get('load_duration', 0) / ns_per_ms, 1),
+            'prompt_eval_ms': round(result.get('prompt_eval_duration', 0) / ns_per_ms, 1),
+            'eval_ms': round(eval_ns / ns_per_ms, 1),
+            'total_ms': round(total_ms, 1),
+            'wall_ms': round(wall_ms, 1),
+            # Time spent outside the model: network plus queueing on the server
+            'queue_ms': round(max(wall_ms - total_ms, 0.0), 1),
+        }
+        
+        labels = {"operation": entry['operation'], "model": entry['model'], "host": entry['host']}
+        METRICS.observe("ollama_request_duration_seconds", wall_ms / 1000, **labels)
+        METRICS.add("ollama_tokens_total", entry['prompt_tokens'], kind="prompt", **labels)
+        METRICS.add("ollama_tokens_total", eval_tokens, kind="generated", **labels)
+        
+        append_metrics_log(entry)
+        
+        if self.metrics == 'json':
+            print(json.dumps(entry))
+    
+    def stats(self):
+        """Aggregate the metrics log into per-model/host percentiles"""
+        entries = read_metrics_log()
+        if entries is None:
+            print(f"No metrics recorded yet ({METRICS_LOG})")
+            return
+        groups = {}
+        for entry in entries:
+            groups.setdefault((entry.get('model'), entry.get('host')), []).append(entry)
+        
+        fields = ['total_ms', 'queue_ms', 'load_ms', 'prompt_eval_ms', 'tokens_per_sec']
+        summary = []
+        for (model, host), entries in sorted(groups.items(), key=lambda item: (str(item[0][0]), str(item[0][1]))):
+            row = {
+                'model': model,
+                'host': host,
+                'calls': len(entries),
+                'prompt_tokens': sum(e.get('prompt_tokens') or 0 for e in entries),
+                'generated_tokens': sum(e.get('generated_tokens') or 0 for e in entries),
+            }
+            for field in fields:
+                values = [e[field] for e in entries if e.get(field) is not None]
+                row[field] = {f"p{pct}": percentile(values, pct) for pct in (50, 90, 99)}
+            summary.append(row)
+        
+        if self.metrics == 'json':
+            print(json.dumps(summary, indent=2))
+            return
+        
+        print(f"Ollama call statistics ({sum(r['calls'] for r in summary)} calls)")
+        print("=" * 50)
+        for row in summary:
+            print(f"{row['model']} on {row['host']}: {row['calls']} calls, "
+                  f"{row['prompt_tokens']} prompt / {row['generated_tokens']} generated tokens")
+            for field in fields:
+                values = row[field]
+                if values['p50'] is None:
+                    continue
+                print(f"  {field:<15} p50 {values['p50']:>9.1f}  p90 {values['p90']:>9.1f}  p99 {values['p99']:>9.1f}")
+            print()
     
     def list_models(self):
         """List available models"""
         try:
-            response = requests.get(f"{self.base_url}/tags", timeout=10)
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                if models:
-                    print("Available models:")
-                    for model in models:
-                        name = model.get('name', 'unknown')
-                        size = model.get('size', 0)
-                        size_gb = round(size / (1024**3), 1) if size > 0 else 0
-                        print(f"  {name} ({size_gb}GB)")
-                else:
-                    print("No models available")
+            models = self.get_models()
+            if models:
+                print("Available models:")
+                for model in models:
+                    name = model.get('name') or 'unknown'
+                    size = model.get('size') or 0
+                    size_gb = round(size / (1024**3), 1) if size > 0 else 0
+                    print(f"  {name} ({size_gb}GB)")
             else:
-                print(f"ERROR: Failed to fetch models ({response.status_code})")
+                print("No models available")
+        except requests.exceptions.HTTPError as e:
+            print(f"ERROR: Failed to fetch models ({e.response.status_code})")
         except requests.exceptions.RequestException as e:
-            print(f"ERROR: Cannot connect to Ollama at {self.host}:{self.port}")
+            print(f"ERROR: Cannot connect to Ollama at {self.pool.label}")
             print(f"Details: {e}")
     
     def generate(self, model, prompt, stream=False):
         """Generate response from model"""
+        if not self._check_model(model):
+            return
+        
         try:
             payload = {
                 "model": model,
                 "prompt": prompt,
                 "stream": stream
             }
+            if self.keep_alive is not None:
+                payload["keep_alive"] = self.keep_alive
             
             print(f"Querying {model} on {self.host}...")
             print("=" * 50)
             
-            response = requests.post(
-                f"{self.base_url}/generate", 
+            started = time.monotonic()
+            response, endpoint = self.pool.request(
+                'POST', '/generate',
+                model=model,
                 json=payload,
                 timeout=120  # 2 minute timeout for large responses
             )
@@ -65,10 +301,8 @@ class OllamaCLI:
                     print("No response generated")
                 
                 # Show timing info if available
-                if 'total_duration' in result:
-                    duration_ms = result['total_duration'] / 1_000_000  # nanoseconds to ms
-                    print()
-                    print(f"Response time: {duration_ms:.0f}ms")
+                self._print_timing(result, endpoint)
+                self._record_metrics('generate', model, result, endpoint, started)
                 
             else:
                 error_data = response.json() if response.content else {}
@@ -84,6 +318,9 @@ class OllamaCLI:
     
     def chat(self, model, message, system_prompt=None):
         """Chat-style interaction (future: add history)"""
+        if not self._check_model(model):
+            return
+        
         try:
             messages = []
             
@@ -97,12 +334,16 @@ class OllamaCLI:
                 "messages": messages,
                 "stream": False
             }
+            if self.keep_alive is not None:
+                payload["keep_alive"] = self.keep_alive
             
             print(f"Chat with {model} on {self.host}...")
             print("=" * 50)
             
-            response = requests.post(
-                f"{self.base_url}/chat",
+            started = time.monotonic()
+            response, endpoint = self.pool.request(
+                'POST', '/chat',
+                model=model,
                 json=payload,
                 timeout=120
             )
@@ -120,10 +361,8 @@ class OllamaCLI:
                     print("Unexpected response format")
                 
                 # Show timing info
-                if 'total_duration' in result:
-                    duration_ms = result['total_duration'] / 1_000_000
-                    print()
-                    print(f"Response time: {duration_ms:.0f}ms")
+                self._print_timing(result, endpoint)
+                self._record_metrics('chat', model, result, endpoint, started)
                     
             else:
                 error_data = response.json() if response.content else {}
@@ -137,34 +376,90 @@ class OllamaCLI:
         except json.JSONDecodeError:
             print("ERROR: Invalid JSON response")
     
-    def status(self):
-        """Show Ollama server status"""
-        try:
-            # Try a simple request to check if server is alive
-            response = requests.get(f"{self.base_url}/tags", timeout=5)
-            if response.status_code == 200:
-                print(f"✅ Ollama server running at {self.host}:{self.port}")
+    def warm(self, models):
+        """Preload models so the next query does not pay the cold-load cost"""
+        for model in models:
+            if not self._check_model(model):
+                continue
+            
+            # An empty prompt makes Ollama load the model without generating
+            payload = {
+                "model": model,
+                "prompt": "",
+                "stream": False
+            }
+            if self.keep_alive is not None:
+                payload["keep_alive"] = self.keep_alive
+            
+            try:
+                started = time.monotonic()
+                response, endpoint = self.pool.request(
+                    'POST', '/generate',
+                    model=model,
+                    json=payload,
+                    timeout=120
+                )
                 
-                models = response.json().get('models', [])
-                print(f"📦 {len(models)} models available")
+                if response.status_code == 200:
+                    result = response.json()
+                    load_ms = result.get('load_duration', 0) / 1_000_000
+                    keep_alive = self.keep_alive if self.keep_alive is not None else 'server default'
+                    print(f"Warmed {model} on {endpoint['name']} (load: {load_ms:.0f}ms, keep-alive: {keep_alive})")
+                    self._record_metrics('warm', model, result, endpoint, started)
+                else:
+                    error_data = response.json() if response.content else {}
+                    error_msg = error_data.get('error', f'HTTP {response.status_code}')
+                    print(f"ERROR: Failed to warm {model}: {error_msg}")
+                    
+            except requests.exceptions.Timeout:
+                print(f"ERROR: Warming {model} timed out (120s limit)")
+            except requests.exceptions.RequestException as e:
+                print(f"ERROR: Request failed: {e}")
+            except json.JSONDecodeError:
+                print("ERROR: Invalid JSON response")
+    
+    def status(self):
+        """Show Ollama server status for every configured host"""
+        for endpoint in self.pool.endpoints:
+            address = f"{endpoint['host']}:{endpoint['port']}"
+            entry = self._cached_entry(endpoint)
+            try:
+                if entry:
+                    age = time.time() - entry['fetched_at']
+                    print(f"✅ Ollama server running at {address} (cached {age:.0f}s ago, --refresh to recheck)")
+                else:
+                    # Try a simple request to check if server is alive
+                    response = self.pool.call(endpoint, 'GET', '/tags', timeout=5)
+                    if response.status_code != 200:
+                        print(f"❌ Ollama server at {address} responded with status {response.status_code}")
+                        continue
+                    
+                    print(f"✅ Ollama server running at {address}")
+                    
+                    # Fetch system info if available
+                    version = None
+                    try:
+                        info_response = self.pool.call(endpoint, 'GET', '/version', timeout=5)
+                        if info_response.status_code == 200:
+                            version = info_response.json().get('version', 'unknown')
+                    except:
+                        pass
+                    entry = self._store_entry(endpoint, response.json(), version)
                 
-                # Show system info if available
-                try:
-                    info_response = requests.get(f"http://{self.host}:{self.port}/api/version", timeout=5)
-                    if info_response.status_code == 200:
-                        version_info = info_response.json()
-                        print(f"🔧 Version: {version_info.get('version', 'unknown')}")
-                except:
-                    pass
-            else:
-                print(f"❌ Ollama server responded with status {response.status_code}")
+                print(f"📦 {len(entry['models'])} models available")
+                if entry.get('version'):
+                    print(f"🔧 Version: {entry['version']}")
                 
-        except requests.exceptions.RequestException as e:
-            print(f"❌ Cannot connect to Ollama at {self.host}:{self.port}")
-            print(f"Details: {e}")
-
+                latency = self.pool._host_state(endpoint).get('latency_ms')
+                if len(self.pool.endpoints) > 1 and latency is not None:
+                    print(f"⏱️  Observed latency: {latency:.0f}ms")
+                    
+            except requests.exceptions.RequestException as e:
+                print(f"❌ Cannot connect to Ollama at {address}")
+                print(f"Details: {e}")
 
 def main():
+    PROFILER.switch("startup")
     parser = argparse.ArgumentParser(
         description="Ollama CLI - Quick AI queries for development sessions",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -179,24 +474,50 @@ Examples:
   # Chat mode with system prompt
   ollama-cli -c -s "You are a helpful coding assistant" "Debug this Python code"
   
-  # List available models
+  # List available models (cached briefly; --refresh forces a live fetch)
   ollama-cli -l
+  ollama-cli -l --refresh
   
   # Check server status
   ollama-cli --status
+  
+  # Preload models and keep them resident for an hour
+  ollama-cli --keep-alive 1h warm llama3.2 granite3.2:2b
+  
+  # Per-call metrics as JSON, and percentiles over the metrics log
+  ollama-cli --metrics json "Explain this error"
+  ollama-cli stats
+  
+  # Spread load across several hosts (fails over if one is down)
+  ollama-cli -H milliways,hal-db:11435 "Explain this stack trace"
+  
+  # Pin a model in memory indefinitely while querying it
+  ollama-cli --keep-alive -1 -m granite3.2:2b "Summarize this log"
 
 Default host: milliways:11434
         """
     )
     
-    parser.add_argument('prompt', nargs='?', help='Query/prompt for the AI model')
+    parser.add_argument('prompt', nargs='?', help="Query/prompt for the AI model, or 'warm' / 'stats'")
+    parser.add_argument('models', nargs='*', metavar='MODEL',
+                        help="Models to preload with 'warm' (default: --model)")
     parser.add_argument('-m', '--model', default='llama3.2', help='Model to use (default: llama3.2)')
-    parser.add_argument('-H', '--host', default='milliways', help='Ollama host (default: milliways)')
+    parser.add_argument('-H', '--host', default='milliways', help='Ollama host, or comma-separated host[:port] list to load-balance (default: milliways)')
     parser.add_argument('-p', '--port', type=int, default=11434, help='Ollama port (default: 11434)')
     parser.add_argument('-l', '--list', action='store_true', help='List available models')
     parser.add_argument('-c', '--chat', action='store_true', help='Use chat mode instead of generate')
     parser.add_argument('-s', '--system', help='System prompt for chat mode')
     parser.add_argument('--status', action='store_true', help='Show server status')
+    parser.add_argument('--refresh', action='store_true',
+                        help=f'Bypass the cached model list (refreshed every {OllamaCLI.CACHE_TTL}s)')
+    parser.add_argument('--metrics', choices=['json'],
+                        help='Print per-call timing/throughput metrics (and stats) as JSON')
+    parser.add_argument('--keep-alive', metavar='DURATION',
+                        help='How long the model stays loaded after a request (e.g. 10m, 1h, -1 = forever)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print where the time went on stderr: import, models, connect (host probes), query, render')
+    parser.add_argument('--profile-out', metavar='FILE',
+                        help='With --profile (implied), also write cProfile stats to FILE for pstats')
     
     args = parser.parse_args()
     
@@ -204,12 +525,22 @@ Default host: milliways:11434
         parser.print_help()
         return
     
-    ollama = OllamaCLI(args.host, args.port)
+    if args.profile or args.profile_out:
+        PROFILER.start(args.profile_out)
+    
+    ollama = OllamaCLI(args.host, args.port, parse_keep_alive(args.keep_alive), args.refresh, args.metrics)
+    PROFILER.switch("render")
     
     if args.status:
         ollama.status()
     elif args.list:
         ollama.list_models()
+    elif args.prompt == 'stats':
+        ollama.stats()
+    elif args.prompt == 'warm':
+        ollama.warm(args.models or [args.model])
+    elif args.models:
+        parser.error("unexpected arguments after prompt (quote multi-word prompts)")
     elif args.prompt:
         if args.chat:
             ollama.chat(args.model, args.prompt, args.system)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Ollama Pool - host scheduling and failover shared by ollama-cli and creative-agents
+
+    from ollama_pool import HostPool
+
+    pool = HostPool(["milliways", "hal-db:11435"])
+    response, endpoint = pool.request("POST", "/chat", model="granite3.2:2b", json=payload, timeout=120)
+
+Also the per-call metrics log both tools append to and ollama-cli stats reads.
+
+Lives next to the scripts in /mnt/idea-factory/bin, like toolkit_metrics.py.
+Needs requests.
+"""
+
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+import requests
+
+
+def model_key(name):
+    """Normalize a model name the way Ollama reports it (untagged means :latest)"""
+    return name if ':' in name else f"{name}:latest"
+
+
+METRICS_LOG = Path.home() / ".cache" / "ollama-metrics.jsonl"
+METRICS_LOG_MAX_BYTES = 5 * 1024 * 1024  # Rolled over to ollama-metrics.jsonl.1 past this
+
+
+def append_metrics_log(entry):
+    """Append one call's record to the metrics log, rolling it over once it outgrows METRICS_LOG_MAX_BYTES
+
+    Only the previous generation is kept, so the log never takes more than
+    about twice the cap and stats never reads more than that.
+    """
+    try:
+        METRICS_LOG.parent.mkdir(parents=True, exist_ok=True)
+        with open(METRICS_LOG, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            if os.fstat(f.fileno()).st_size <= METRICS_LOG_MAX_BYTES:
+                return
+        with open(f"{METRICS_LOG}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Re-check under the lock: a concurrent caller may have rolled it over already
+            if METRICS_LOG.stat().st_size > METRICS_LOG_MAX_BYTES:
+                METRICS_LOG.replace(f"{METRICS_LOG}.1")
+    except OSError:
+        pass  # Best effort; never fail a query over the log
+
+
+def read_metrics_log():
+    """Every record in the metrics log, oldest first; None when nothing has been recorded"""
+    entries = None
+    for path in (f"{METRICS_LOG}.1", METRICS_LOG):
+        try:
+            with open(path, 'r') as f:
+                entries = entries or []
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue  # Tolerate a torn final line
+        except FileNotFoundError:
+            continue
+    return entries
+
+
+class HostPool:
+    """Client-side scheduler across one or more Ollama endpoints
+
+    Hosts known not to have the model (per /api/tags) go last. Among the
+    rest, hosts that already have it loaded (per /api/ps) are preferred, then
+    the ones with the fewest requests in flight from this process, then the
+    lowest observed latency. Latency and down-marks are kept in a small state
+    file so separate invocations learn from each other. Connection errors fail
+    over to the next host; read timeouts do not, since the host may still be
+    generating.
+    """
+
+    STATE_FILE = Path.home() / ".cache" / "ollama-hosts.json"
+    DOWN_SECONDS = 30
+    LATENCY_WEIGHT = 0.3  # EWMA weight of the newest sample
+
+    def __init__(self, hosts, port=11434, metrics=None, profiler=None):
+        self.metrics = metrics  # toolkit_metrics.Metrics for ollama_request_errors_total
+        self.profiler = profiler  # toolkit_metrics.Profiler: probes count as connect, requests as query
+        self.endpoints = []
+        for entry in hosts:
+            if not entry.strip():
+                continue  # -H "" or a stray comma
+            host, _, entry_port = entry.strip().partition(':')
+            entry_port = int(entry_port or port)
+            self.endpoints.append({
+                'name': host if entry_port == port else f"{host}:{entry_port}",
+                'host': host,
+                'port': entry_port,
+                'url': f"http://{host}:{entry_port}/api",
+                'in_flight': 0,
+                'loaded': None,
+                'available': None,  # Model keys from the host's /api/tags, once something has listed them
+            })
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+        self.state = self._load_state()
+
+    @property
+    def label(self):
+        return ", ".join(f"{e['host']}:{e['port']}" for e in self.endpoints)
+
+    def _load_state(self):
+        try:
+            with open(self.STATE_FILE, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        try:
+            self.STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.STATE_FILE.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(self.state, f)
+            tmp_file.replace(self.STATE_FILE)
+        except OSError:
+            pass  # Scheduling hints only; never fail a query over them
+
+    def _host_state(self, endpoint):
+        return self.state.setdefault(f"{endpoint['host']}:{endpoint['port']}", {})
+
+    def _mark_down(self, endpoint):
+        with self.lock:
+            self._host_state(endpoint)['down_until'] = time.time() + self.DOWN_SECONDS
+            self._save_state()
+
+    def _record_latency(self, endpoint, elapsed_ms):
+        with self.lock:
+            state = self._host_state(endpoint)
+            previous = state.get('latency_ms')
+            if previous is None:
+                state['latency_ms'] = elapsed_ms
+            else:
+                state['latency_ms'] = previous + self.LATENCY_WEIGHT * (elapsed_ms - previous)
+            state.pop('down_until', None)
+            self._save_state()
+
+    def _is_down(self, endpoint):
+        return self._host_state(endpoint).get('down_until', 0) > time.time()
+
+    def _probe_loaded(self, endpoint):
+        """Fetch the set of models currently in memory on a host"""
+        try:
+            response = requests.get(f"{endpoint['url']}/ps", timeout=2)
+            if response.status_code == 200:
+                endpoint['loaded'] = {model_key(m.get('name', '')) for m in response.json().get('models', [])}
+            else:
+                endpoint['loaded'] = set()
+        except requests.exceptions.ConnectionError:
+            self._mark_down(endpoint)
+        except (requests.exceptions.RequestException, ValueError):
+            endpoint['loaded'] = set()
+
+    def _phase(self, name):
+        return self.profiler.phase(name) if self.profiler else nullcontext()
+
+    def _probe(self, model):
+        """Learn which hosts already have models loaded (once per process)"""
+        if not model or len(self.endpoints) < 2:
+            return
+        with self.probe_lock, self._phase("connect"):
+            stale = [e for e in self.endpoints if e['loaded'] is None and not self._is_down(e)]
+            if stale:
+                with ThreadPoolExecutor(max_workers=len(stale)) as executor:
+                    list(executor.map(self._probe_loaded, stale))
+
+    def _sort_key(self, model):
+        def sort_key(endpoint):
+            missing = bool(model) and endpoint['available'] is not None and model_key(model) not in endpoint['available']
+            cold = bool(model) and model_key(model) not in (endpoint['loaded'] or set())
+            # Hosts never measured sort first so they get a latency sample
+            latency = self._host_state(endpoint).get('latency_ms', 0)
+            return (self._is_down(endpoint), missing, cold, endpoint['in_flight'], latency)
+        return sort_key
+
+    def ranked(self, model=None):
+        """Return endpoints in the order they should be tried for a model"""
+        self._probe(model)
+        with self.lock:
+            return sorted(self.endpoints, key=self._sort_key(model))
+
+    def _acquire(self, model, tried, prefer=None):
+        """Pick the best untried endpoint and count it as in flight atomically
+
+        A preferred endpoint wins over the sort order while it is untried and
+        not marked down.
+        """
+        with self.lock:
+            remaining = [e for e in self.endpoints if e['name'] not in tried]
+            if not remaining:
+                return None
+            if prefer is not None and prefer['name'] not in tried and not self._is_down(prefer):
+                endpoint = prefer
+            else:
+                endpoint = min(remaining, key=self._sort_key(model))
+            endpoint['in_flight'] += 1
+            return endpoint
+
+    def call(self, endpoint, method, path, **kwargs):
+        """Send one request to a specific endpoint, counting it in ollama_request_errors_total if it fails"""
+        labels = {"host": f"{endpoint['host']}:{endpoint['port']}", "path": path}
+        with self._phase("query"):
+            try:
+                response = requests.request(method, f"{endpoint['url']}{path}", **kwargs)
+            except requests.exceptions.RequestException as e:
+                self._count_error(type(e).__name__, labels)
+                raise
+        if response.status_code >= 400:
+            self._count_error(f"HTTP {response.status_code}", labels)
+        return response
+
+    def _count_error(self, reason, labels):
+        if self.metrics:
+            self.metrics.add("ollama_request_errors_total", reason=reason, **labels)
+
+    def request(self, method, path, model=None, prefer=None, **kwargs):
+        """Send a request to the best endpoint, failing over on connection errors
+
+        prefer pins the request to an endpoint from an earlier call while it
+        is reachable. Returns (response, endpoint). Re-raises the last
+        connection error if every endpoint is unreachable, or raises
+        ConnectionError if there is none to try.
+        """
+        self._probe(model)
+        tried = set()
+        last_error = None
+
+        while True:
+            endpoint = self._acquire(model, tried, prefer)
+            if endpoint is None:
+                if last_error is None:
+                    raise requests.exceptions.ConnectionError(f"No Ollama host to send to (hosts: {self.label or 'none given'})")
+                raise last_error
+            if last_error is not None:
+                print(f"WARNING: {last_failed} unreachable, failing over to {endpoint['name']}", file=sys.stderr)
+            tried.add(endpoint['name'])
+
+            start = time.monotonic()
+            try:
+                response = self.call(endpoint, method, path, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                self._mark_down(endpoint)
+                last_error = e
+                last_failed = endpoint['name']
+                continue
+            finally:
+                with self.lock:
+                    endpoint['in_flight'] -= 1
+
+            if model:
+                self._record_latency(endpoint, (time.monotonic() - start) * 1000)
+                if endpoint['loaded'] is not None:
+                    endpoint['loaded'].add(model_key(model))
+            return response, endpoint
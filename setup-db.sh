@@ -17,6 +17,7 @@ fi
 # Install LabMail PostgreSQL CLI
 echo "📦 Installing LabMail PostgreSQL CLI..."
 $SUDO_CMD cp labmail-db.py /usr/local/bin/labmail
+$SUDO_CMD cp toolkit_metrics.py /usr/local/bin/toolkit_metrics.py  # Imported by labmail
 $SUDO_CMD chmod +x /usr/local/bin/labmail
 
 # Install Python PostgreSQL dependency if needed
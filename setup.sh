@@ -36,6 +36,7 @@ $SUDO_CMD chmod -R 777 /var/lib/labmail/sent
 # Install LabMail CLI
 echo "📦 Installing LabMail CLI..."
 $SUDO_CMD cp labmail.py /usr/local/bin/labmail
+$SUDO_CMD cp toolkit_metrics.py /usr/local/bin/toolkit_metrics.py  # Imported by labmail
 $SUDO_CMD chmod +x /usr/local/bin/labmail
 
 # Verify installation
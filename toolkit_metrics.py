@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Toolkit Metrics - instrumentation shared by the labmail and Ollama tools
+Prometheus textfile totals (METRICS_TEXTFILE_DIR) and the --profile phase timer
+
+    import time
+    STARTED = time.perf_counter()  # Before the other imports, so they are timed
+
+    from toolkit_metrics import Metrics, Profiler
+
+    PROFILER = Profiler(STARTED, ("import", "startup", "query", "render"))
+    METRICS = Metrics("my-tool", {"my_requests_total": ("counter", "Requests sent")})
+
+Lives next to the scripts in /mnt/idea-factory/bin, which Python puts on
+sys.path when one of them runs. Standard library only.
+"""
+
+import atexit
+import cProfile
+import fcntl
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Wall time per phase for --profile, plus an optional cProfile dump
+
+    The main thread is always in exactly one phase, so the phases add up to
+    the whole run. Nested phases are exclusive: time goes to the innermost
+    one, except that query and fetch time inside an opaque phase stays with
+    it. Phases entered on worker threads overlap the main thread's and are
+    reported separately.
+    """
+
+    def __init__(self, started, order, opaque=(), plain=False):
+        self.order = order  # Report order; the main thread starts in order[0]
+        self.opaque = set(opaque)
+        self.plain = plain  # ERROR:/WARNING: style output instead of emoji
+        self.enabled = False
+        self.totals = {}  # Main thread: phase -> seconds
+        self.worker_totals = {}
+        self.lock = threading.Lock()
+        self.main_thread = threading.current_thread()
+        self.local = threading.local()
+        self.local.stack = [order[0]]
+        self.local.mark = started
+        self.cprofile = None
+        self.dump_path = None
+
+    def _charge(self):
+        """Add the time since the last change to the current phase; returns this thread's phase stack"""
+        now = time.perf_counter()
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        if stack:
+            totals = self.totals if threading.current_thread() is self.main_thread else self.worker_totals
+            with self.lock:
+                totals[stack[-1]] = totals.get(stack[-1], 0.0) + now - self.local.mark
+        self.local.mark = now
+        return stack
+
+    def switch(self, name):
+        """Move the main thread on to the next top-level phase"""
+        self._charge()[-1] = name
+
+    @contextmanager
+    def phase(self, name):
+        """Charge the time spent inside the block to name"""
+        if not self.enabled:
+            yield
+            return
+        stack = self._charge()
+        if stack and stack[-1] in self.opaque and name in ("query", "fetch"):
+            name = stack[-1]
+        stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge()
+            stack.pop()
+
+    def timed(self, name):
+        """Decorator form of phase(), costing one attribute check when profiling is off"""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.phase(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def iterate(self, items, name):
+        """Yield from items, charging the wait for each one to name"""
+        items = iter(items)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+            yield item
+
+    def start(self, dump_path=None):
+        """Turn on phase timing, reported on stderr at exit; with dump_path, cProfile the main thread too"""
+        self.enabled = True
+        atexit.register(self.report)
+        if dump_path:
+            self.dump_path = dump_path
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def report(self):
+        """Print the phase breakdown and write the cProfile dump"""
+        self._charge()
+        if self.cprofile:
+            self.cprofile.disable()
+        total = sum(self.totals.values())
+        rank = {name: i for i, name in enumerate(self.order)}
+        indent = "  " if self.plain else "   "
+        print(f"PROFILE: {total * 1000:.1f} ms total" if self.plain else f"⏱️  Profile: {total * 1000:.1f} ms",
+              file=sys.stderr)
+        for name, seconds in sorted(self.totals.items(), key=lambda item: rank.get(item[0], len(rank))):
+            print(f"{indent}{name:<14} {seconds * 1000:9.1f} ms {seconds / total:7.1%}", file=sys.stderr)
+        if self.worker_totals:
+            busy = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in sorted(self.worker_totals.items()))
+            label = "worker threads" if self.plain else "Worker threads"
+            print(f"{indent}{label} (overlapping the above): {busy}", file=sys.stderr)
+        if self.cprofile:
+            try:
+                self.cprofile.dump_stats(self.dump_path)
+                where = f"{self.dump_path} (python3 -m pstats {self.dump_path})"
+                print(f"PSTATS: {where}" if self.plain else f"{indent}📊 cProfile stats: {where}", file=sys.stderr)
+            except OSError as e:
+                warning = "WARNING:" if self.plain else "⚠️ "
+                print(f"{warning} Could not write profile {self.dump_path}: {e}", file=sys.stderr)
+
+
+class Metrics:
+    """Counters and histograms written to $METRICS_TEXTFILE_DIR/<tool>.prom
+
+    Nothing is recorded unless METRICS_TEXTFILE_DIR is set. Samples collect in
+    memory and at exit are added, under a lock, to the totals already in the
+    file, which is then replaced atomically: the file holds running totals
+    over every invocation, as Prometheus counters expect.
+    """
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+
+    def __init__(self, tool, families, duration=None, plain=False):
+        self.tool = tool
+        self.families = families  # name -> (type, help)
+        self.duration = duration  # Histogram that timed() observes
+        self.plain = plain  # ERROR:/WARNING: style output instead of emoji
+        directory = os.environ.get("METRICS_TEXTFILE_DIR")
+        self.path = os.path.join(directory, f"{tool}.prom") if directory else None
+        self.samples = {}  # Exposition-format series -> amount added by this process
+        self.operation = "other"  # Label for samples counted outside a timed command
+        self.lock = threading.Lock()  # Worker threads record too
+        if self.path:
+            atexit.register(self.flush)
+
+    def _series(self, name, labels):
+        labels = {"tool": self.tool, **labels}
+        escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for k, v in labels.items()}
+        return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(escaped.items())) + "}"
+
+    def add(self, name, value=1, **labels):
+        """Increase a counter (or one series of a histogram) by value"""
+        if self.path is None:
+            return
+        series = self._series(name, labels)
+        with self.lock:
+            self.samples[series] = self.samples.get(series, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Record one histogram observation"""
+        if self.path is None:
+            return
+        for bound in self.BUCKETS:
+            self.add(f"{name}_bucket", int(seconds <= bound), le=repr(float(bound)), **labels)
+        self.add(f"{name}_bucket", le="+Inf", **labels)
+        self.add(f"{name}_sum", seconds, **labels)
+        self.add(f"{name}_count", **labels)
+
+    def timed(self, operation):
+        """Decorator: observe a command's duration; samples counted during it can use its label
+
+        A timed method called from another one counts toward the outer command.
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.path is None or self.operation != "other":
+                    return func(*args, **kwargs)
+                self.operation = operation
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(self.duration, time.perf_counter() - started, operation=operation)
+                    self.operation = "other"
+            return wrapper
+        return decorate
+
+    @staticmethod
+    def _order(series):
+        """Sort key: label set, then metric name, then bucket bound"""
+        name, _, labels = series.partition("{")
+        bound = re.search(r'le="([^"]*)"', labels)
+        return re.sub(r'(^|,)le="[^"]*"', "", labels).lstrip(","), name, float(bound.group(1)) if bound else 0.0
+
+    def render(self, totals):
+        """Totals in the Prometheus text exposition format, grouped by family"""
+        lines = []
+        for family, (kind, help_text) in self.families.items():
+            names = {family} if kind == "counter" else {f"{family}_bucket", f"{family}_sum", f"{family}_count"}
+            series = sorted((s for s in totals if s.partition("{")[0] in names), key=self._order)
+            if series:
+                lines += [f"# HELP {family} {help_text}", f"# TYPE {family} {kind}"]
+                lines += [f"{s} {int(totals[s]) if totals[s].is_integer() else round(totals[s], 6)}" for s in series]
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """Add this process's samples to the totals in the textfile"""
+        if not self.samples:
+            return
+        try:
+            with open(f"{self.path}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # Concurrent invocations must not lose each other's counts
+                totals = {}
+                try:
+                    with open(self.path) as f:
+                        for line in f:
+                            if line.strip() and not line.startswith("#"):
+                                series, _, value = line.rstrip("\n").rpartition(" ")
+                                totals[series] = float(value)
+                except FileNotFoundError:
+                    pass
+                for series, value in self.samples.items():
+                    totals[series] = totals.get(series, 0.0) + value
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    f.write(self.render(totals))
+                os.replace(temp_path, self.path)  # The collector never sees a half-written file
+        except (OSError, ValueError) as e:
+            warning = "WARNING:" if self.plain else "⚠️ "
+            print(f"{warning} Could not update metrics file {self.path}: {e}", file=sys.stderr)
+        self.samples.clear()